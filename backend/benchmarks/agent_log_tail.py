@@ -0,0 +1,114 @@
+"""
+Agent log tail read benchmark: bytes returned by MongoDB and latency of
+`get_memory_log` as one agent's log grows, against reading the whole
+document and slicing in Python (the read path before server-side $slice).
+Needs a running MongoDB; writes to a throwaway database that is dropped.
+
+    cd backend && MONGO_URL=mongodb://localhost:27017 python -m benchmarks.agent_log_tail
+"""
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Sequence
+import argparse
+import asyncio
+import os
+import time
+
+import bson
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+from services.database import database
+from services.memory_service import agent_memory_service
+
+SESSION_ID = "bench-session"
+AGENT_ID = "engineer"
+
+class ReplyBytes(monitoring.CommandListener):
+    """Sums the BSON size of every server reply"""
+
+    def __init__(self):
+        self.total = 0
+
+    def started(self, event) -> None:
+        pass
+
+    def succeeded(self, event) -> None:
+        self.total += len(bson.encode(event.reply))
+
+    def failed(self, event) -> None:
+        pass
+
+def log_entries(n: int) -> List[dict]:
+    now = datetime(2024, 10, 28, 10, 0, 0)
+    return [
+        {
+            "id": f"msg-{i:06d}",
+            "session_id": SESSION_ID,
+            "agent_id": AGENT_ID,
+            "role": "Engineer",
+            "content": f"Turn {i}: " + "Proposed architecture: API gateway, event queue, Postgres, workers. " * 6,
+            "timestamp": now + timedelta(seconds=i),
+        }
+        for i in range(n)
+    ]
+
+async def measure(read: Callable[[], Awaitable[object]], listener: ReplyBytes, repeat: int) -> tuple:
+    """(median ms, bytes per read)"""
+    await read()  # warm up connection and caches
+    timings = []
+    listener.total = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await read()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000, listener.total // repeat
+
+async def run(sizes: Sequence[int], limit: int, repeat: int) -> None:
+    listener = ReplyBytes()
+    # Same options as the app's shared client, plus the reply-size listener
+    database.client = AsyncIOMotorClient(
+        os.getenv("MONGO_URL", "mongodb://localhost:27017"), event_listeners=[listener], **database.client_options()
+    )
+    db_name = f"emergent_plus_bench_{os.getpid()}"
+    database._db = database.client[db_name]
+    collection = agent_memory_service.collection
+    query = {"session_id": SESSION_ID, "agent_id": AGENT_ID}
+
+    async def whole_document() -> list:
+        # Before: fetch the full document, slice in Python
+        doc = await collection.find_one(query)
+        return (doc or {}).get("log", [])[-limit:]
+
+    paths: Dict[str, Callable[[], Awaitable[object]]] = {
+        "whole document (before)": whole_document,
+        "$slice": lambda: agent_memory_service.get_memory_log(SESSION_ID, AGENT_ID, limit=limit),
+        "$slice + $map (role, content)": lambda: agent_memory_service.get_memory_log(
+            SESSION_ID, AGENT_ID, limit=limit, fields=["role", "content"]
+        ),
+    }
+    print(f"last {limit} entries, median of {repeat} reads")
+    print(f"  {'entries':>7}  " + "  ".join(f"{label:>30}" for label in paths))
+    try:
+        for size in sizes:
+            await collection.delete_many(query)
+            await collection.insert_one({**query, "log": log_entries(size), "updated_at": datetime.now()})
+            cells = []
+            for read in paths.values():
+                ms, size_bytes = await measure(read, listener, repeat)
+                cells.append(f"{size_bytes / 1024:9.1f} KiB {ms:8.2f} ms")
+            print(f"  {size:>7}  " + "  ".join(f"{cell:>30}" for cell in cells))
+    finally:
+        await database.client.drop_database(db_name)
+        database.close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="10,100,1000,10000", help="comma-separated log lengths")
+    parser.add_argument("--limit", type=int, default=10, help="entries read (get_memory_log's default)")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run([int(s) for s in args.sizes.split(",")], args.limit, args.repeat))
+
+if __name__ == "__main__":
+    main()
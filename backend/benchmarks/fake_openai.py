@@ -0,0 +1,100 @@
+"""
+Local OpenAI-compatible HTTP server for tests and benchmarks. Tests run it
+in a background thread; load tests run it as its own process, so that it
+doesn't compete for the GIL with the code being measured:
+
+    cd backend && python -m benchmarks.fake_openai --port 8010 --latency 0.5
+"""
+from collections import Counter
+from typing import Callable, Optional
+import argparse
+import asyncio
+import threading
+import time
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+import uvicorn
+
+def completion(content: str = "ok") -> dict:
+    return {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "gpt-4o",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 1, "total_tokens": 11},
+    }
+
+def rate_limited(retry_after_ms: Optional[int] = None, code: str = "rate_limit_exceeded") -> JSONResponse:
+    headers = {"retry-after-ms": str(retry_after_ms)} if retry_after_ms is not None else {}
+    body = {"error": {"message": "Rate limit reached", "type": "requests", "code": code}}
+    return JSONResponse(body, status_code=429, headers=headers)
+
+class FakeOpenAI:
+    """
+    Serves /v1/chat/completions from a background thread. `handler(key, n)`
+    gets the bearer key and that key's call number (from 1) and returns a
+    response, or None for a normal completion after `latency` seconds.
+    """
+
+    def __init__(self, handler: Optional[Callable[[str, int], Optional[JSONResponse]]] = None, latency: float = 0.0):
+        self.handler = handler or (lambda key, n: None)
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.concurrent = 0
+        self.peak_concurrent = 0
+        self.app = Starlette(routes=[
+            Route("/v1/chat/completions", self._completions, methods=["POST"]),
+            Route("/stats", self._stats),
+        ])
+        self._server = uvicorn.Server(uvicorn.Config(self.app, host="127.0.0.1", port=0, log_level="warning"))
+        self._thread: Optional[threading.Thread] = None
+
+    async def _completions(self, request: Request):
+        key = request.headers["authorization"].removeprefix("Bearer ")
+        self.calls[key] += 1
+        response = self.handler(key, self.calls[key])
+        if response is not None:
+            return response
+        self.concurrent += 1
+        self.peak_concurrent = max(self.peak_concurrent, self.concurrent)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.concurrent -= 1
+        return JSONResponse(completion())
+
+    async def _stats(self, request: Request):
+        return JSONResponse({"calls": sum(self.calls.values()), "peak_concurrent": self.peak_concurrent})
+
+    @property
+    def base_url(self) -> str:
+        port = self._server.servers[0].sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}/v1"
+
+    def __enter__(self) -> "FakeOpenAI":
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError("Fake OpenAI server did not start")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=10)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible server")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per completion")
+    args = parser.parse_args()
+    uvicorn.run(FakeOpenAI(latency=args.latency).app, host="127.0.0.1", port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Memory search and recall microbenchmark: the in-process BM25 index against
+a case-insensitive regex scan (what the old $regex query made Mongo do),
+and hashing-embedder recall over the session vector index. No database
+needed.
+
+    cd backend && python -m benchmarks.memory_search --memories 100000 --recall-memories 50000
+"""
+from datetime import datetime, timedelta
+from typing import Callable, List, Sequence
+import argparse
+import random
+import re
+import time
+
+from services.search_index import SessionSearchIndex
+from services.vector_index import HashingEmbedder, SessionVectorIndex
+
+TAGS = ["idea", "goal", "project", "note", "marketing", "product", "hiring", "funding", "design", "ops"]
+
+def vocabulary(size: int, rng: random.Random) -> List[str]:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(3, 9))))
+    return sorted(words)
+
+def memory_docs(n: int, seed: int = 7) -> List[dict]:
+    """Memories of 10-40 words drawn Zipf-like from a 20k-word vocabulary"""
+    rng = random.Random(seed)
+    words = vocabulary(20_000, rng)
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    now = datetime(2024, 10, 28, 10, 0, 0)
+    docs = []
+    for i in range(n):
+        content = " ".join(rng.choices(words, weights, k=rng.randint(10, 40)))
+        docs.append({
+            "id": f"mem-{i:06d}",
+            "content": content,
+            "tags": rng.sample(TAGS, rng.randint(1, 3)),
+            "created_at": now - timedelta(minutes=i),
+        })
+    return docs
+
+def queries(docs: Sequence[dict], count: int, seed: int = 11) -> List[str]:
+    """One to three words taken from random memories, so every query has matches"""
+    rng = random.Random(seed)
+    result = []
+    for _ in range(count):
+        words = rng.choice(docs)["content"].split()
+        result.append(" ".join(rng.sample(words, min(len(words), rng.randint(1, 3)))))
+    return result
+
+def percentiles(fn: Callable[[str], object], inputs: Sequence[str]) -> tuple:
+    timings = []
+    for value in inputs:
+        start = time.perf_counter()
+        fn(value)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    pick = lambda q: timings[min(len(timings) - 1, int(q * len(timings)))] * 1000
+    return pick(0.5), pick(0.99)
+
+def report(label: str, p50: float, p99: float) -> None:
+    print(f"  {label:<40} p50 {p50:7.2f} ms   p99 {p99:7.2f} ms")
+
+def bench_search(n: int, query_count: int) -> None:
+    docs = memory_docs(n)
+    index = SessionSearchIndex()
+    start = time.perf_counter()
+    for doc in docs:
+        index.add(doc["id"], doc["content"], doc["tags"], doc["created_at"])
+    print(f"\nkeyword search: {n} memories, {query_count} queries "
+          f"(index built in {time.perf_counter() - start:.1f} s)")
+    sample = queries(docs, query_count)
+    contents = [doc["content"] for doc in docs]
+
+    def regex_scan(q: str) -> list:
+        # Before: unanchored, case-insensitive regex over every memory in the session
+        pattern = re.compile(re.escape(q), re.IGNORECASE)
+        return [text for text in contents if pattern.search(text)]
+
+    # The scan is slow; a tenth of the queries is enough for its percentiles
+    report("regex scan (before)", *percentiles(regex_scan, sample[:max(1, query_count // 10)]))
+    report("BM25 top 20", *percentiles(lambda q: index.search(q, limit=20), sample))
+    report("BM25 top 20, tag filter", *percentiles(lambda q: index.search(q, tags=["product"], limit=20), sample))
+    report("BM25 page 5 (offset 80)", *percentiles(lambda q: index.search(q, limit=20, offset=80), sample))
+
+def bench_recall(n: int, dim: int, query_count: int) -> None:
+    docs = memory_docs(n)
+    embedder = HashingEmbedder(dim)
+    index = SessionVectorIndex(dim)
+    for doc in docs:
+        index.add(doc["id"], embedder.embed(" ".join([doc["content"], *doc["tags"]])))
+    sample = queries(docs, query_count)
+    embedded = {q: embedder.embed(q) for q in sample}
+    print(f"\nsemantic recall: {n} memories, {dim} dimensions, {query_count} queries")
+    report("embed query", *percentiles(embedder.embed, sample))
+    report("top 5 search", *percentiles(lambda q: index.search(embedded[q], k=5, min_score=0.1), sample))
+    report("embed + top 5 (per chat turn)", *percentiles(
+        lambda q: index.search(embedder.embed(q), k=5, min_score=0.1), sample
+    ))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--memories", type=int, default=100_000, help="memories in the keyword search session")
+    parser.add_argument("--recall-memories", type=int, default=50_000, help="memories in the recall session")
+    parser.add_argument("--dim", type=int, default=256, help="embedding dimensions (MEMORY_EMBEDDING_DIM)")
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+    bench_search(args.memories, args.queries)
+    bench_recall(args.recall_memories, args.dim, args.queries)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Read-path serialization microbenchmark: validated Pydantic models through
+FastAPI's default encoder, against models built without validation or raw
+Mongo documents rendered by orjson. No database needed.
+
+    cd backend && python -m benchmarks.serialization --records 10000
+"""
+from datetime import datetime, timedelta
+from typing import Callable, List
+import argparse
+import json
+import time
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from models import Memory, Startup, from_db
+from responses import FastJSONResponse
+
+def memory_docs(n: int) -> List[dict]:
+    now = datetime(2024, 10, 28, 10, 0, 0)
+    return [
+        {
+            "_id": ObjectId(),
+            "id": f"mem-{i:06d}",
+            "session_id": "bench-session",
+            "content": f"Idea {i}: a marketplace connecting local farmers with restaurants, with weekly delivery routes",
+            "category": ("idea", "goal", "project", "note")[i % 4],
+            "tags": ["marketplace", "food", f"tag{i % 17}"],
+            "created_at": now - timedelta(minutes=i),
+            "updated_at": now - timedelta(minutes=i),
+        }
+        for i in range(n)
+    ]
+
+def startup_docs(n: int) -> List[dict]:
+    now = datetime(2024, 10, 28, 10, 0, 0)
+    return [
+        {
+            "_id": ObjectId(),
+            "id": f"startup-{i:06d}",
+            "session_id": "bench-session",
+            "name": f"Startup {i}",
+            "description": "Carbon tracking for small businesses",
+            "stage": "mvp",
+            "metrics": {"users": 100 + i, "revenue": 1000.0 * i, "funding": 50000.0, "team_size": 3, "growth_rate": 0.2},
+            "milestones": [{"title": "MVP", "month": 3}],
+            "created_at": now - timedelta(minutes=i),
+            "updated_at": now - timedelta(minutes=i),
+        }
+        for i in range(n)
+    ]
+
+def without_id(docs: List[dict]) -> List[dict]:
+    """What a read projecting out `_id` gets from Mongo"""
+    return [{k: v for k, v in doc.items() if k != "_id"} for doc in docs]
+
+def best_of(fn: Callable[[], object], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def bench(name: str, model, docs: List[dict], repeat: int) -> None:
+    projected = without_id(docs)
+    paths = {
+        # Before: validate every document, then FastAPI's jsonable_encoder and json.dumps
+        "validate + jsonable_encoder + json": lambda: JSONResponse(jsonable_encoder(
+            {"items": [model(**{**d, "_id": str(d["_id"])}) for d in docs]}
+        )).body,
+        "model_construct + orjson": lambda: FastJSONResponse(
+            {"items": [from_db(model, d) for d in projected]}
+        ).body,
+        "raw documents + orjson": lambda: FastJSONResponse({"items": projected}).body,
+    }
+    baseline = None
+    print(f"\n{name}: {len(docs)} records, best of {repeat}")
+    for label, fn in paths.items():
+        seconds = best_of(fn, repeat)
+        baseline = baseline or seconds
+        print(f"  {label:<36} {seconds * 1000:8.1f} ms  {baseline / seconds:5.1f}x")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    # Every path must produce the same JSON
+    for model, docs in ((Memory, memory_docs(3)), (Startup, startup_docs(3))):
+        slow = JSONResponse(jsonable_encoder([model(**{**d, "_id": str(d["_id"])}) for d in docs])).body
+        fast = FastJSONResponse([from_db(model, d) for d in without_id(docs)]).body
+        raw = FastJSONResponse(without_id(docs)).body
+        assert json.loads(slow) == json.loads(fast) == json.loads(raw), "serialized output differs"
+    bench("memories", Memory, memory_docs(args.records), args.repeat)
+    bench("startups (nested metrics)", Startup, startup_docs(args.records), args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,41 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Literal, Type, TypeVar, Union, get_args, get_origin
 from datetime import datetime
+from functools import lru_cache
 from uuid import uuid4
 
+M = TypeVar("M", bound=BaseModel)
+
 def generate_uuid():
     return str(uuid4())
 
+def from_db(model: Type[M], doc: dict) -> M:
+    """
+    Build `model` from a document our own code wrote, without validation.
+    Nested models are built the same way; `_id` and unknown keys are ignored.
+    """
+    nested = _nested_models(model)
+    if nested:
+        doc = {**doc, **{name: build(doc[name]) for name, build in nested.items() if doc.get(name) is not None}}
+    return model.model_construct(**doc)
+
+@lru_cache(maxsize=None)
+def _nested_models(model: Type[BaseModel]) -> Dict[str, Any]:
+    """Builders for the fields of `model` that hold models (directly, Optional or in a List)"""
+    builders = {}
+    for name, field in model.model_fields.items():
+        annotation = field.annotation
+        if get_origin(annotation) is Union:
+            args = [arg for arg in get_args(annotation) if arg is not type(None)]
+            annotation = args[0] if len(args) == 1 else annotation
+        if get_origin(annotation) in (list, List):
+            item = (get_args(annotation) or (None,))[0]
+            if isinstance(item, type) and issubclass(item, BaseModel):
+                builders[name] = lambda values, item=item: [from_db(item, value) for value in values]
+        elif isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            builders[name] = lambda value, annotation=annotation: from_db(annotation, value)
+    return builders
+
 class Message(BaseModel):
     role: str
     content: str
@@ -23,7 +53,11 @@ class Memory(BaseModel):
 class Conversation(BaseModel):
     id: str = Field(default_factory=generate_uuid)
     session_id: str
-    messages: List[Message] = []
+    messages: List[Message] = []  # Legacy; messages are stored in conversation_messages
+    message_count: int = 0
+    summary: Optional[str] = None  # Rolling summary of compacted messages
+    summary_through_seq: int = 0  # Last message seq folded into the summary
+    uncompacted_count: int = 0  # message_count - summary_through_seq, kept on write for an indexed candidate query
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: datetime = Field(default_factory=datetime.now)
 
@@ -50,7 +84,10 @@ class Design(BaseModel):
     session_id: str
     title: str
     prompt: str
-    image_url: Optional[str] = None
+    image_url: Optional[str] = None  # Locally stored image, or the remote URL if storing failed
+    thumbnail_url: Optional[str] = None  # Small WebP rendition for galleries
+    asset_id: Optional[str] = None  # SHA-256 of the stored image
+    source_url: Optional[str] = None  # URL the image was generated at (expires)
     design_type: str  # slide, mockup, visual, logo
     created_at: datetime = Field(default_factory=datetime.now)
 
@@ -65,23 +102,87 @@ class MemoryRequest(BaseModel):
     category: str
     tags: List[str] = []
 
+class BulkMemoryItem(BaseModel):
+    content: str
+    category: str
+    tags: List[str] = []
+    id: Optional[str] = None  # Keep ids from the source to make re-imports idempotent
+    created_at: Optional[datetime] = None
+
+class BulkMemoryRequest(BaseModel):
+    session_id: str
+    memories: List[BulkMemoryItem] = Field(min_length=1, max_length=10000)
+
 class StartupRequest(BaseModel):
     session_id: str
     name: str
     description: str
     user_api_key: Optional[str] = None
 
+class SimulationScenario(BaseModel):
+    """Overrides for the Monte Carlo model's stage defaults (monthly rates, USD)"""
+    name: Optional[str] = None
+    growth_mean: Optional[float] = Field(default=None, ge=-0.5, le=2.0)
+    growth_volatility: Optional[float] = Field(default=None, ge=0)
+    growth_reversion: Optional[float] = Field(default=None, ge=0, le=1)
+    churn: Optional[float] = Field(default=None, ge=0, le=1)
+    organic_users: Optional[float] = Field(default=None, ge=0)
+    market_size: Optional[float] = Field(default=None, gt=0)
+    arpu: Optional[float] = Field(default=None, ge=0)
+    cost_per_employee: Optional[float] = Field(default=None, ge=0)
+    fixed_costs: Optional[float] = Field(default=None, ge=0)
+    hire_rate: Optional[float] = Field(default=None, ge=0)
+    attrition: Optional[float] = Field(default=None, ge=0, le=1)
+    funding_probability: Optional[float] = Field(default=None, ge=0, le=1)
+    funding_median: Optional[float] = Field(default=None, ge=0)
+    bootstrap_months: Optional[float] = Field(default=None, ge=0)
+
 class SimulateRequest(BaseModel):
     startup_id: str
-    months: int = 6
+    months: int = Field(default=6, ge=1, le=120)
+    paths: int = Field(default=2000, ge=100, le=20000)  # Monte Carlo paths
+    seed: Optional[int] = Field(default=None, ge=0)  # If omitted, the latest stored run is reused (else random)
+    fresh: bool = False  # Without a seed: ignore stored runs and simulate with a new random seed
+    scenario: Optional[SimulationScenario] = None
+    narrate: bool = False  # Also ask the LLM for a narrative on top of the numbers
     user_api_key: Optional[str] = None
 
+class BatchSimulateRequest(BaseModel):
+    startup_ids: List[str] = Field(min_length=1, max_length=1000)
+    scenarios: List[SimulationScenario] = Field(default_factory=lambda: [SimulationScenario(name="base")],
+                                                min_length=1, max_length=20)
+    months: int = Field(default=12, ge=1, le=120)
+    paths: int = Field(default=2000, ge=100, le=20000)
+    seed: Optional[int] = Field(default=None, ge=0)  # Shared by every run in the batch
+
 class DesignRequest(BaseModel):
     session_id: str
     prompt: str
     design_type: str
     user_api_key: Optional[str] = None
 
+class DesignSpec(BaseModel):
+    prompt: str
+    design_type: str
+
+class DesignBatchRequest(BaseModel):
+    session_id: str
+    designs: List[DesignSpec] = Field(min_length=1, max_length=50)
+    user_api_key: Optional[str] = None
+
+class DesignJob(BaseModel):
+    id: str = Field(default_factory=generate_uuid)
+    batch_id: str
+    session_id: str
+    prompt: str
+    design_type: str
+    status: str = "queued"  # queued, running, succeeded, failed
+    design: Optional[Design] = None  # Set once the job succeeds
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.now)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
 class Agent(BaseModel):
     agent_id: str
     role: str  # CEO, Engineer, Designer, Marketer
@@ -103,3 +204,12 @@ class AgentMemory(BaseModel):
     agent_id: str
     log: List[AgentMessage] = []
     updated_at: datetime = Field(default_factory=datetime.now)
+
+class AgentStreamEvent(BaseModel):
+    """Event emitted while an agent collaboration runs"""
+    type: Literal["stage_started", "token", "stage_done", "final", "error"]
+    stage: Optional[str] = None  # Stage name, e.g. "engineer" or "ceo_final"
+    agent: Optional[str] = None  # CEO, Engineer, Designer, Marketer
+    content: Optional[str] = None  # Token delta, full stage output, final result or error detail
+    context_tokens: Optional[int] = None  # Prompt tokens, on "stage_started" and "stage_done"
+    trace: Optional[List[Dict[str, Any]]] = None  # Only on "final"
@@ -0,0 +1,25 @@
+from typing import Any
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+from services.metrics import add_request_time
+import orjson
+import time
+
+def orjson_default(obj: Any) -> Any:
+    """Serialize what orjson doesn't know natively: Pydantic models (built with or without validation)"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+class FastJSONResponse(ORJSONResponse):
+    """
+    orjson-rendered JSON that also accepts Pydantic models. Returning it from
+    an endpoint skips FastAPI's jsonable_encoder pass as well, so reads go
+    straight from Mongo documents or constructed models to bytes.
+    """
+
+    def render(self, content: Any) -> bytes:
+        start = time.perf_counter()
+        body = orjson.dumps(content, default=orjson_default, option=orjson.OPT_NON_STR_KEYS)
+        add_request_time("render", time.perf_counter() - start)
+        return body
@@ -1,22 +1,87 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import logging
+import anyio
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, StreamingResponse
 from dotenv import load_dotenv
+import orjson
 import os
+from typing import List, Optional, Tuple
+
+# Load environment variables before services read their settings
+load_dotenv()
 
 from models import (
-    ChatRequest, MemoryRequest, StartupRequest, 
-    SimulateRequest, DesignRequest, Message, Memory, Startup, Design
+    ChatRequest, MemoryRequest, BulkMemoryRequest, StartupRequest, 
+    SimulateRequest, BatchSimulateRequest, DesignRequest, DesignBatchRequest, Message, Memory, Startup, Design
 )
+from responses import FastJSONResponse, orjson_default
 from services.ai_service import ai_service
 from services.memory_service import memory_service, agent_memory_service
 from services.startup_service import startup_service
 from services.canvas_service import design_service, conversation_service
-from models import AgentMessage
-
-# Load environment variables
-load_dotenv()
+from services.database import database
+from services.indexes import index_manager
+from services.context_builder import ChatContext, context_builder
+from services.compaction import compaction_service
+from services.simulation import forecast_digest, new_seed, simulation_pool
+from services.simulation_service import simulation_service
+from services.asset_store import asset_store
+from services.design_jobs import DesignQueueFullError, batch_status, design_job_queue
+from services.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, PageRequestError, parse_fields
+from services.rate_limiter import AIRateLimitError
+from services.metrics import CONTENT_TYPE_LATEST, MetricsMiddleware, metrics_payload
+from services.agent_graph import (
+    AGENT_GRAPHS, AGENT_PERSONALITIES, SEQUENTIAL_AGENT_GRAPH, AgentGraph, AgentGraphScheduler
+)
 
-app = FastAPI(title="Emergent++ API", version="1.0.0")
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create the shared MongoDB client on startup rather than at import time
+    database.connect()
+    if os.getenv("MONGO_ENSURE_INDEXES", "true").lower() in ("1", "true", "yes"):
+        try:
+            await index_manager.ensure_indexes()
+            await index_manager.report_drift()
+        except Exception as e:
+            logger.error("Index provisioning failed: %s", e)
+    if os.getenv("MIGRATE_LEGACY_CONVERSATIONS", "true").lower() in ("1", "true", "yes"):
+        try:
+            migrated = await conversation_service.migrate_legacy_conversations()
+            if migrated:
+                logger.info("Migrated %d legacy conversations", migrated)
+        except Exception as e:
+            logger.error("Conversation migration failed: %s", e)
+    try:
+        # Backfill the counters compaction picks candidates by, for documents written before them
+        await conversation_service.sync_uncompacted_counts()
+        await agent_memory_service.sync_uncompacted_counts()
+    except Exception as e:
+        logger.error("Compaction counter backfill failed: %s", e)
+    # Load the tokenizer here, not at import; a cold tiktoken cache downloads its BPE file
+    await asyncio.to_thread(context_builder.counter.load)
+    # Fold old messages and agent log entries into summaries in the background
+    compaction_service.start()
+    design_job_queue.start(generate_and_store_design)
+    agent_memory_service.buffer.start()
+    yield
+    await design_job_queue.stop()
+    await compaction_service.stop()
+    # Write buffered agent log entries before the database closes
+    await agent_memory_service.buffer.stop()
+    simulation_pool.close()
+    await asset_store.close()
+    # Close pooled OpenAI connections
+    await ai_service.close()
+    database.close()
+
+# Read endpoints return FastJSONResponse directly, which also skips jsonable_encoder
+app = FastAPI(title="Emergent++ API", version="1.0.0", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # CORS middleware
 app.add_middleware(
@@ -27,33 +92,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so latency covers the whole stack and streamed bodies
+app.add_middleware(MetricsMiddleware)
+
 @app.get("/api/health")
 async def health_check():
     return {"status": "healthy", "service": "Emergent++ Backend"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(metrics_payload(), media_type=CONTENT_TYPE_LATEST)
+
+def rate_limited(e: AIRateLimitError) -> HTTPException:
+    """429 response for an OpenAI rate limit that outlasted our retries"""
+    headers = {"Retry-After": str(int(e.retry_after) + 1)} if e.retry_after else None
+    return HTTPException(status_code=429, detail=str(e), headers=headers)
+
+@app.get("/api/ai/limiter/stats")
+async def ai_limiter_stats():
+    """Per-key OpenAI queue depth, in-flight and throttling metrics"""
+    return ai_service.scheduler.stats()
+
+@app.get("/api/ai/cache/stats")
+async def ai_cache_stats():
+    """LLM response cache hit/miss metrics"""
+    return ai_service.cache.stats()
+
 # ============ CHAT ENDPOINTS ============
 
-@app.post("/api/chat")
-async def chat(request: ChatRequest):
-    """
-    Chat with Emergent++ AI co-founder
-    Maintains conversation context and memory
-    """
-    try:
-        # Get conversation history
-        history = await conversation_service.get_conversation_history(
-            request.session_id, limit=10
-        )
-        
-        # Add user message
-        user_message = Message(role="user", content=request.message)
-        await conversation_service.add_message(request.session_id, user_message)
-        
-        # Prepare messages for AI
-        all_messages = history + [user_message]
-        
-        # Get AI response
-        system_prompt = """
+# Number of semantically recalled memories added to each chat prompt (0 disables)
+CHAT_MEMORY_RECALL_K = int(os.getenv("CHAT_MEMORY_RECALL_K", "5"))
+# Messages of history considered for each chat prompt; the token budget decides how many are sent
+CHAT_HISTORY_LIMIT = int(os.getenv("CHAT_HISTORY_LIMIT", "20"))
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+CHAT_SYSTEM_PROMPT = """
 You are Emergent++, an intelligent AI co-founder workspace.
 You help users:
 - Brainstorm and develop ideas
@@ -63,10 +138,38 @@ You help users:
 
 Be creative, insightful, and actionable. Help users turn ideas into reality.
 """
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def prepare_chat_turn(request: ChatRequest) -> ChatContext:
+    """Save the user's message and pack history and memories into the chat token budget"""
+    # Get conversation history and memories relevant to this message
+    history, recalled = await asyncio.gather(
+        conversation_service.get_conversation_history(request.session_id, limit=CHAT_HISTORY_LIMIT),
+        memory_service.recall_memories(request.session_id, request.message, k=CHAT_MEMORY_RECALL_K),
+    )
+    
+    # Add user message
+    user_message = Message(role="user", content=request.message)
+    await conversation_service.add_message(request.session_id, user_message)
+    
+    return context_builder.build_chat(CHAT_SYSTEM_PROMPT, history, user_message, recalled)
+
+@app.post("/api/chat")
+async def chat(request: ChatRequest):
+    """
+    Chat with Emergent++ AI co-founder
+    Maintains conversation context and memory
+    """
+    try:
+        context = await prepare_chat_turn(request)
         
+        # Get AI response
         response_content = await ai_service.chat_completion(
-            all_messages, 
-            system_prompt=system_prompt,
+            context.messages, 
+            system_prompt=context.system_prompt,
             user_api_key=request.user_api_key
         )
         
@@ -76,18 +179,70 @@ Be creative, insightful, and actionable. Help users turn ideas into reality.
         
         return {
             "response": response_content,
-            "session_id": request.session_id
+            "session_id": request.session_id,
+            "context_tokens": context.tokens
         }
     
+    except AIRateLimitError as e:
+        raise rate_limited(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Streaming chat: relays the AI response token by token as Server-Sent Events
+    (`start`, `token`, `done`, `error`). The assembled reply is saved to the
+    conversation when the stream ends. If the client disconnects, the upstream
+    completion is cancelled.
+    """
+    async def event_stream():
+        # Flush headers and a first frame right away, before any DB or model work
+        yield sse_event("start", {"session_id": request.session_id})
+        chunks = []
+        try:
+            context = await prepare_chat_turn(request)
+            async for token in ai_service.chat_completion_stream(
+                context.messages,
+                system_prompt=context.system_prompt,
+                user_api_key=request.user_api_key
+            ):
+                chunks.append(token)
+                yield sse_event("token", {"content": token})
+            yield sse_event("done", {
+                "response": "".join(chunks),
+                "session_id": request.session_id,
+                "context_tokens": context.tokens,
+            })
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+        finally:
+            if chunks:
+                # Still save what was generated if the client went away mid-stream
+                with anyio.CancelScope(shield=True):
+                    assistant_message = Message(role="assistant", content="".join(chunks))
+                    await conversation_service.add_message(request.session_id, assistant_message)
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+# Fields list endpoints accept in `fields=`
+MESSAGE_FIELDS = ("seq", "role", "content", "timestamp")
+
 @app.get("/api/chat/history/{session_id}")
-async def get_chat_history(session_id: str, limit: int = 20):
-    """Get conversation history"""
+async def get_chat_history(
+    session_id: str,
+    limit: int = Query(default=20, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    """Get conversation history, newest page first; pass `next_cursor` back as `cursor` for older messages"""
     try:
-        history = await conversation_service.get_conversation_history(session_id, limit)
-        return {"messages": history}
+        page = await conversation_service.get_history_page(
+            session_id, limit, cursor, parse_fields(fields, MESSAGE_FIELDS)
+        )
+        return FastJSONResponse({"messages": page.items, "summary": page.summary, "next_cursor": page.next_cursor})
+    except PageRequestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -108,21 +263,53 @@ async def create_memory(request: MemoryRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/memory/bulk")
+async def create_memories_bulk(request: BulkMemoryRequest):
+    """
+    Import up to 10,000 memories in one request with unordered bulk inserts.
+    Items that fail, such as duplicate ids, are reported without stopping the rest.
+    """
+    try:
+        memories = [
+            Memory(session_id=request.session_id, **item.model_dump(exclude_none=True))
+            for item in request.memories
+        ]
+        inserted, errors = await memory_service.create_memories(memories)
+        return {"success": not errors, "inserted": inserted, "errors": errors}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/memory/{session_id}")
-async def get_memories(session_id: str, category: str = None):
-    """Get all memories for a session"""
+async def get_memories(
+    session_id: str,
+    category: str = None,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    """Get a page of memories for a session, newest first"""
     try:
-        memories = await memory_service.get_memories(session_id, category)
-        return {"memories": memories, "count": len(memories)}
+        page = await memory_service.get_memories_page(
+            session_id, category, limit, cursor, parse_fields(fields, Memory.model_fields)
+        )
+        return FastJSONResponse({"memories": page.items, "count": len(page.items), "next_cursor": page.next_cursor})
+    except PageRequestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/memory/search/{session_id}")
-async def search_memories(session_id: str, q: str):
-    """Search memories"""
+async def search_memories(
+    session_id: str,
+    q: str = "",
+    tags: List[str] = Query(default=[]),
+    limit: int = Query(default=20, ge=1, le=100),
+    offset: int = Query(default=0, ge=0),
+):
+    """Search memories (BM25-ranked, optionally filtered by tags)"""
     try:
-        memories = await memory_service.search_memories(session_id, q)
-        return {"memories": memories, "count": len(memories)}
+        memories, total = await memory_service.search(session_id, q, tags, limit, offset)
+        return FastJSONResponse({"memories": memories, "count": len(memories), "total": total})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -153,11 +340,20 @@ async def create_startup(request: StartupRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/startup/{session_id}")
-async def get_startups(session_id: str):
-    """Get all startups for a session"""
+async def get_startups(
+    session_id: str,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    """Get a page of startups for a session, newest first"""
     try:
-        startups = await startup_service.get_startups(session_id)
-        return {"startups": startups, "count": len(startups)}
+        page = await startup_service.get_startups_page(
+            session_id, limit, cursor, parse_fields(fields, Startup.model_fields)
+        )
+        return FastJSONResponse({"startups": page.items, "count": len(page.items), "next_cursor": page.next_cursor})
+    except PageRequestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -168,81 +364,283 @@ async def get_startup_detail(startup_id: str):
         startup = await startup_service.get_startup(startup_id)
         if not startup:
             raise HTTPException(status_code=404, detail="Startup not found")
-        return {"startup": startup}
+        return FastJSONResponse({"startup": startup})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/startup/simulate")
 async def simulate_startup(request: SimulateRequest):
-    """Simulate startup growth"""
+    """
+    Simulate startup growth with a seeded Monte Carlo model starting from the
+    startup's stored metrics. Returns per-month percentile bands; set
+    "narrate" for an LLM narrative on top of the numbers. Results are stored,
+    so repeats are instant and longer horizons only compute the new months.
+    """
     try:
         # Get startup details
         startup = await startup_service.get_startup(request.startup_id)
         if not startup:
             raise HTTPException(status_code=404, detail="Startup not found")
         
-        # Generate simulation
-        simulation = await ai_service.generate_startup_simulation(
-            startup.name,
-            startup.description,
-            startup.stage,
+        # Served from storage when possible; otherwise simulated off the event loop and stored
+        scenario = request.scenario.model_dump(exclude_none=True) if request.scenario else None
+        simulation = await simulation_service.simulate(
+            startup,
             request.months,
-            user_api_key=request.user_api_key
+            request.paths,
+            request.seed,
+            scenario,
+            fresh=request.fresh,
         )
         
-        return {
+        if request.narrate:
+            simulation["narrative"] = await ai_service.generate_startup_simulation(
+                startup.name,
+                startup.description,
+                startup.stage,
+                request.months,
+                forecast_digest(simulation),
+                user_api_key=request.user_api_key
+            )
+        
+        return FastJSONResponse({
             "success": True,
             "startup_id": request.startup_id,
             "simulation": simulation
-        }
+        })
+    except HTTPException:
+        raise
+    except AIRateLimitError as e:
+        raise rate_limited(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/startup/simulate/batch")
+async def simulate_startups_batch(request: BatchSimulateRequest):
+    """
+    Simulate many startups under several scenarios. Startups are loaded in one
+    query and simulated across worker processes. Each result is streamed as
+    an NDJSON line as soon as it is ready. Every run shares one seed, so
+    scenarios are compared on the same random draws.
+    """
+    try:
+        startups = await startup_service.get_startups_by_ids(request.startup_ids)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    seed = request.seed if request.seed is not None else new_seed()
+    
+    async def run(startup: Startup, label: str, scenario: dict) -> dict:
+        try:
+            simulation = await simulation_service.simulate(
+                startup, request.months, request.paths, seed, scenario, pool=simulation_pool
+            )
+            return {"startup_id": startup.id, "name": startup.name, "scenario": label, "simulation": simulation}
+        except Exception as e:
+            return {"startup_id": startup.id, "name": startup.name, "scenario": label, "error": str(e)}
+    
+    async def results():
+        found = {startup.id for startup in startups}
+        for startup_id in dict.fromkeys(request.startup_ids):
+            if startup_id not in found:
+                yield orjson.dumps({"startup_id": startup_id, "error": "Startup not found"}) + b"\n"
+        tasks = [
+            asyncio.create_task(run(
+                startup, scenario.name or f"scenario-{i}", scenario.model_dump(exclude_none=True)
+            ))
+            for startup in startups
+            for i, scenario in enumerate(request.scenarios)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield orjson.dumps(await next_done, default=orjson_default) + b"\n"
+        finally:
+            # Client went away: drop the runs that haven't started
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@app.get("/api/startup/{startup_id}/simulations")
+async def get_startup_simulations(startup_id: str):
+    """List stored simulations of a startup (inputs only, not results)"""
+    try:
+        simulations = await simulation_service.get_simulations(startup_id)
+        return FastJSONResponse({"simulations": simulations, "count": len(simulations)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/startup/{startup_id}")
 async def delete_startup(startup_id: str):
-    """Delete a startup"""
+    """Delete a startup and its stored simulations"""
     try:
         success = await startup_service.delete_startup(startup_id)
+        if success:
+            await simulation_service.delete_simulations(startup_id)
         return {"success": success}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # ============ CANVAS DESIGNER ENDPOINTS ============
 
+async def design_image_fields(image_url: str) -> dict:
+    """Store a generated image locally and return the Design image fields (remote URL if storing fails)"""
+    try:
+        asset_id = await asset_store.ingest_url(image_url)
+    except Exception as e:
+        logger.warning("Could not store design image locally: %s", e)
+        return {"image_url": image_url, "source_url": image_url}
+    return {
+        "image_url": asset_store.url(asset_id),
+        "thumbnail_url": asset_store.url(asset_id, "thumb"),
+        "asset_id": asset_id,
+        "source_url": image_url,
+    }
+
+async def generate_and_store_design(
+    session_id: str, prompt: str, design_type: str, user_api_key: Optional[str] = None
+) -> Design:
+    """Generate a design image with DALL-E and save the Design"""
+    image_url = await ai_service.generate_design_image(prompt, design_type, user_api_key=user_api_key)
+    
+    # Save design, with the image downloaded before its URL expires
+    design = Design(
+        session_id=session_id,
+        title=f"{design_type.title()} Design",
+        prompt=prompt,
+        design_type=design_type,
+        **await design_image_fields(image_url)
+    )
+    return await design_service.create_design(design)
+
 @app.post("/api/canvas/generate")
 async def generate_design(request: DesignRequest):
-    """Generate AI-powered design"""
+    """Generate AI-powered design (waits for the image; see /api/canvas/jobs to queue many)"""
     try:
-        # Generate image with DALL-E
-        image_url = await ai_service.generate_design_image(
-            request.prompt,
-            request.design_type,
-            user_api_key=request.user_api_key
+        result = await generate_and_store_design(
+            request.session_id, request.prompt, request.design_type, request.user_api_key
         )
-        
-        # Save design
-        design = Design(
-            session_id=request.session_id,
-            title=f"{request.design_type.title()} Design",
-            prompt=request.prompt,
-            image_url=image_url,
-            design_type=request.design_type
-        )
-        result = await design_service.create_design(design)
-        
         return {
             "success": True,
             "design": result
         }
+    except AIRateLimitError as e:
+        raise rate_limited(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Seconds between re-reads of a batch while streaming, for jobs run by other server processes
+DESIGN_EVENTS_REFRESH_SECONDS = float(os.getenv("DESIGN_EVENTS_REFRESH_SECONDS", "10"))
+
+@app.post("/api/canvas/jobs", status_code=202)
+async def submit_design_jobs(request: DesignBatchRequest):
+    """
+    Queue one design job per prompt and return their ids immediately. Jobs
+    run in the background; poll /api/canvas/batches/{batch_id} or stream
+    /api/canvas/batches/{batch_id}/events for progress.
+    """
+    try:
+        jobs = await design_job_queue.submit(
+            request.session_id,
+            request.designs,
+            ai_service.key_scope(request.user_api_key),
+            request.user_api_key,
+        )
+        return {
+            "batch_id": jobs[0].batch_id,
+            "jobs": [{"id": job.id, "status": job.status, "prompt": job.prompt, "design_type": job.design_type}
+                     for job in jobs],
+        }
+    except DesignQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/canvas/jobs/stats")
+async def design_job_stats():
+    """Design job queue depth and running jobs per key"""
+    return design_job_queue.stats()
+
+@app.get("/api/canvas/jobs/{job_id}")
+async def get_design_job(job_id: str):
+    """Status of one design job, with its design once it has succeeded"""
+    try:
+        job = await design_job_queue.get_job(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Design job not found")
+        return FastJSONResponse(job)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/canvas/batches/{batch_id}")
+async def get_design_batch(batch_id: str):
+    """Every job of a design batch with per-status counts"""
+    try:
+        jobs = await design_job_queue.get_batch(batch_id)
+        if not jobs:
+            raise HTTPException(status_code=404, detail="Design batch not found")
+        return FastJSONResponse({"batch_id": batch_id, **batch_status(jobs), "jobs": jobs})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/canvas/batches/{batch_id}/events")
+async def design_batch_events(batch_id: str):
+    """
+    Server-Sent Events for a design batch: a `job` event with each job's
+    current state, then one per status change, and `done` once every job
+    has finished.
+    """
+    updates = design_job_queue.subscribe(batch_id)
+    try:
+        # Read after subscribing, so no change between the two is missed
+        jobs = {job.id: job for job in await design_job_queue.get_batch(batch_id)}
     except Exception as e:
+        design_job_queue.unsubscribe(batch_id, updates)
         raise HTTPException(status_code=500, detail=str(e))
+    if not jobs:
+        design_job_queue.unsubscribe(batch_id, updates)
+        raise HTTPException(status_code=404, detail="Design batch not found")
+    
+    async def event_stream():
+        try:
+            for job in jobs.values():
+                yield sse_event("job", job.model_dump())
+            while not batch_status(list(jobs.values()))["done"]:
+                try:
+                    changed = [await asyncio.wait_for(updates.get(), DESIGN_EVENTS_REFRESH_SECONDS)]
+                except asyncio.TimeoutError:
+                    fresh = await design_job_queue.get_batch(batch_id)
+                    changed = [job for job in fresh if job.status != jobs[job.id].status]
+                    if not changed:
+                        yield ": keep-alive\n\n"
+                for job in changed:
+                    if job.status != jobs[job.id].status:
+                        jobs[job.id] = job
+                        yield sse_event("job", job.model_dump())
+            yield sse_event("done", {"batch_id": batch_id, **batch_status(list(jobs.values()))})
+        finally:
+            design_job_queue.unsubscribe(batch_id, updates)
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
 
 @app.get("/api/canvas/{session_id}")
-async def get_designs(session_id: str):
-    """Get all designs for a session"""
+async def get_designs(
+    session_id: str,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    """Get a page of designs for a session, newest first (use `thumbnail_url` for gallery views)"""
     try:
-        designs = await design_service.get_designs(session_id)
-        return {"designs": designs, "count": len(designs)}
+        page = await design_service.get_designs_page(
+            session_id, limit, cursor, parse_fields(fields, Design.model_fields)
+        )
+        return FastJSONResponse({"designs": page.items, "count": len(page.items), "next_cursor": page.next_cursor})
+    except PageRequestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -255,127 +653,174 @@ async def delete_design(design_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# ============ ASSET ENDPOINTS ============
+
+# Asset URLs are content-addressed, so they never change
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) of a single `bytes=` range, or None if unsatisfiable"""
+    unit, _, spec = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    start, _, end = spec.strip().partition("-")
+    try:
+        if not start:
+            # Suffix range: the last `end` bytes
+            length = int(end)
+            return (max(size - length, 0), size - 1) if length > 0 and size else None
+        start, end = int(start), int(end) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+def read_range(path: str, start: int, end: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start + 1)
+
+@app.get("/api/assets/{asset_id}")
+@app.get("/api/assets/{asset_id}/{variant}")
+async def get_asset(asset_id: str, request: Request, variant: Optional[str] = None):
+    """
+    Serve a stored design image or one of its WebP variants (`thumb`,
+    `medium`, `webp`). Supports ETag revalidation and byte ranges.
+    """
+    asset = await asset_store.open(asset_id, variant)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Asset not found")
+    path, media_type, etag = asset
+    headers = {"ETag": etag, "Cache-Control": ASSET_CACHE_CONTROL, "Accept-Ranges": "bytes"}
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [
+        tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+    ]):
+        return Response(status_code=304, headers=headers)
+    
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", etag) == etag:
+        size = os.path.getsize(path)
+        byte_range = parse_range(range_header, size)
+        if byte_range is None:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        start, end = byte_range
+        content = await asyncio.to_thread(read_range, path, start, end)
+        return Response(
+            content, status_code=206, media_type=media_type,
+            headers={**headers, "Content-Range": f"bytes {start}-{end}/{size}"},
+        )
+    return FileResponse(path, media_type=media_type, headers=headers)
+
 # ============ SESSION MANAGEMENT ============
 
 @app.get("/api/session/{session_id}/summary")
 async def get_session_summary(session_id: str):
     """Get complete session summary"""
     try:
-        memories = await memory_service.get_memories(session_id)
-        startups = await startup_service.get_startups(session_id)
-        designs = await design_service.get_designs(session_id)
-        history = await conversation_service.get_conversation_history(session_id)
+        # Counts and top-k reads are independent, so run them concurrently
+        (
+            memories_count, startups_count, designs_count, messages_count,
+            memories, startups, designs,
+        ) = await asyncio.gather(
+            memory_service.count_memories(session_id),
+            startup_service.count_startups(session_id),
+            design_service.count_designs(session_id),
+            conversation_service.count_messages(session_id),
+            memory_service.get_memories(session_id, limit=5),
+            startup_service.get_startups(session_id, limit=3),
+            design_service.get_designs(session_id, limit=5),
+        )
         
-        return {
+        return FastJSONResponse({
             "session_id": session_id,
-            "memories_count": len(memories),
-            "startups_count": len(startups),
-            "designs_count": len(designs),
-            "messages_count": len(history),
+            "memories_count": memories_count,
+            "startups_count": startups_count,
+            "designs_count": designs_count,
+            "messages_count": messages_count,
             "summary": {
-                "memories": memories[:5],  # Latest 5
-                "startups": startups[:3],  # Latest 3
-                "designs": designs[:5]  # Latest 5
+                "memories": memories,  # Latest 5
+                "startups": startups,  # Latest 3
+                "designs": designs  # Latest 5
             }
-        }
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# Define the personalities for the four agents
-AGENT_PERSONALITIES = {
-    "ceo": "Visionary, strategic, persuasive, holistic thinker. Sees the big picture and synthesizes team output into an actionable summary.",
-    "engineer": "Analytical, detail-oriented, practical. Breaks down visions into technical solutions, always thinking about robust implementation.",
-    "designer": "Creative, user-centric, visual thinker. Refines ideas for clarity, communicates through visuals, and ensures a compelling aesthetic.",
-    "marketer": "Persuasive, audience-aware, energetic. Focuses on messaging impact, clarity, brand, and engaging presentation.",
-}
-
 # Orchestrator for multi-agent pipeline
-async def multi_agent_pipeline(user_message: str, session_id: str, user_api_key: str = None):
-    trace = []
-
-    # --- CEO (interprets and delegates to Engineer) ---
-    ceo_log = await agent_memory_service.get_memory_log(session_id, "ceo")
-    ceo_context = "\n".join([msg['content'] for msg in ceo_log])
-    ceo_out = await ai_service.agent_chat(
-        agent_role="CEO",
-        agent_personality=AGENT_PERSONALITIES["ceo"],
-        task=user_message,
-        memory_log=ceo_context,
-        user_api_key=user_api_key,
-    )
-    ceo_msg = AgentMessage(session_id=session_id, agent_id="ceo", role="CEO", content=ceo_out)
-    await agent_memory_service.append_message(session_id, "ceo", ceo_msg.model_dump())
-    trace.append({"agent": "CEO", "message": ceo_out})
-
-    # --- Engineer (gets CEO output as task) ---
-    eng_log = await agent_memory_service.get_memory_log(session_id, "engineer")
-    eng_context = "\n".join([msg['content'] for msg in eng_log])
-    eng_out = await ai_service.agent_chat(
-        agent_role="Engineer",
-        agent_personality=AGENT_PERSONALITIES["engineer"],
-        task=ceo_out,
-        memory_log=eng_context,
-        user_api_key=user_api_key,
-    )
-    eng_msg = AgentMessage(session_id=session_id, agent_id="engineer", role="Engineer", content=eng_out)
-    await agent_memory_service.append_message(session_id, "engineer", eng_msg.model_dump())
-    trace.append({"agent": "Engineer", "message": eng_out})
-
-    # --- Designer (refines Engineer's output) ---
-    designer_log = await agent_memory_service.get_memory_log(session_id, "designer")
-    designer_context = "\n".join([msg['content'] for msg in designer_log])
-    designer_out = await ai_service.agent_chat(
-        agent_role="Designer",
-        agent_personality=AGENT_PERSONALITIES["designer"],
-        task=eng_out,
-        memory_log=designer_context,
-        user_api_key=user_api_key,
-    )
-    designer_msg = AgentMessage(session_id=session_id, agent_id="designer", role="Designer", content=designer_out)
-    await agent_memory_service.append_message(session_id, "designer", designer_msg.model_dump())
-    trace.append({"agent": "Designer", "message": designer_out})
-
-    # --- Marketer (polishes Designer output) ---
-    marketer_log = await agent_memory_service.get_memory_log(session_id, "marketer")
-    marketer_context = "\n".join([msg['content'] for msg in marketer_log])
-    marketer_out = await ai_service.agent_chat(
-        agent_role="Marketer",
-        agent_personality=AGENT_PERSONALITIES["marketer"],
-        task=designer_out,
-        memory_log=marketer_context,
-        user_api_key=user_api_key,
-    )
-    marketer_msg = AgentMessage(session_id=session_id, agent_id="marketer", role="Marketer", content=marketer_out)
-    await agent_memory_service.append_message(session_id, "marketer", marketer_msg.model_dump())
-    trace.append({"agent": "Marketer", "message": marketer_out})
-
-    # --- CEO (summarizes/presents final result) ---
-    ceo_final_out = await ai_service.agent_chat(
-        agent_role="CEO",
-        agent_personality=AGENT_PERSONALITIES["ceo"],
-        task=marketer_out,
-        memory_log=ceo_context,
-        user_api_key=user_api_key,
-        context=marketer_out
-    )
-    ceo_final_msg = AgentMessage(session_id=session_id, agent_id="ceo", role="CEO", content=ceo_final_out)
-    await agent_memory_service.append_message(session_id, "ceo", ceo_final_msg.model_dump())
-    trace.append({"agent": "CEO", "message": ceo_final_out})
-
-    return {"trace": trace, "result": ceo_final_out}
+agent_scheduler = AgentGraphScheduler(ai_service, agent_memory_service, AGENT_PERSONALITIES)
+
+async def multi_agent_pipeline(
+    user_message: str,
+    session_id: str,
+    user_api_key: str = None,
+    graph: AgentGraph = SEQUENTIAL_AGENT_GRAPH,
+):
+    return await agent_scheduler.run(graph, user_message, session_id, user_api_key)
+
+def collab_params(request: dict) -> Tuple[str, str, Optional[str], AgentGraph]:
+    """Read prompt, session, key and agent graph from an agent-collab request body"""
+    graph = AGENT_GRAPHS.get(request.get("topology") or "sequential")
+    if graph is None:
+        raise HTTPException(status_code=400, detail=f"Unknown topology. Use one of: {', '.join(AGENT_GRAPHS)}")
+    return request["prompt"], request["session_id"], request.get("user_api_key"), graph
 
 @app.post("/api/agent-collab")
 async def agent_collaboration(request: dict):
-    """Multi-agent collaboration: user prompt is routed through CEO → Engineer → Designer → Marketer → CEO sequence"""
+    """
+    Multi-agent collaboration: user prompt is routed through CEO → Engineer → Designer → Marketer → CEO sequence.
+    Pass "topology": "fanout" to have Designer and Marketer work from the Engineer output in parallel.
+    """
     try:
-        user_message = request["prompt"]
-        session_id = request["session_id"]
-        user_api_key = request.get("user_api_key")
-        pipeline_output = await multi_agent_pipeline(user_message, session_id, user_api_key)
+        user_message, session_id, user_api_key, graph = collab_params(request)
+        pipeline_output = await multi_agent_pipeline(user_message, session_id, user_api_key, graph)
         return pipeline_output
+    except HTTPException:
+        raise
+    except AIRateLimitError as e:
+        raise rate_limited(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/agent-collab/stream")
+async def agent_collaboration_stream(request: dict):
+    """
+    Streaming multi-agent collaboration over Server-Sent Events. Emits
+    `stage_started`, `token` (unless "stream_tokens": false), `stage_done`,
+    and finally `final` or `error`. If the client disconnects, the remaining
+    agent calls are cancelled.
+    """
+    try:
+        user_message, session_id, user_api_key, graph = collab_params(request)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    stream_tokens = bool(request.get("stream_tokens", True))
+    
+    async def event_stream():
+        queue: asyncio.Queue = asyncio.Queue()
+        pipeline = asyncio.create_task(agent_scheduler.run(
+            graph, user_message, session_id, user_api_key,
+            on_event=queue.put_nowait, stream_tokens=stream_tokens,
+        ))
+        pipeline.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while (event := await queue.get()) is not None:
+                yield sse_event(event.type, event.model_dump(exclude_none=True))
+            if pipeline.exception() is not None:
+                yield sse_event("error", {"type": "error", "content": str(pipeline.exception())})
+        finally:
+            if not pipeline.done():
+                # Client went away: don't pay for the remaining LLM calls
+                pipeline.cancel()
+            with anyio.CancelScope(shield=True):
+                await asyncio.gather(pipeline, return_exceptions=True)
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,238 @@
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+from models import AgentMessage, AgentStreamEvent
+from services.context_builder import ContextBuilder, context_builder as default_context_builder
+from services.memory_service import LOG_SUMMARY_ROLE
+from services.metrics import AGENT_STAGE_LATENCY, span
+import asyncio
+import time
+
+# Define the personalities for the four agents
+AGENT_PERSONALITIES = {
+    "ceo": "Visionary, strategic, persuasive, holistic thinker. Sees the big picture and synthesizes team output into an actionable summary.",
+    "engineer": "Analytical, detail-oriented, practical. Breaks down visions into technical solutions, always thinking about robust implementation.",
+    "designer": "Creative, user-centric, visual thinker. Refines ideas for clarity, communicates through visuals, and ensures a compelling aesthetic.",
+    "marketer": "Persuasive, audience-aware, energetic. Focuses on messaging impact, clarity, brand, and engaging presentation.",
+}
+
+@dataclass
+class AgentStage:
+    """
+    One agent turn in a collaboration graph. A stage with no dependencies gets
+    the user's prompt as its task; otherwise its task is the output of the
+    stages in `depends_on`. Outputs of `context_from` stages are also passed
+    as teammate context.
+    """
+    name: str
+    agent_id: str
+    role: str
+    depends_on: List[str] = field(default_factory=list)
+    context_from: List[str] = field(default_factory=list)
+
+class AgentGraph:
+    def __init__(self, stages: List[AgentStage]):
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("Agent graph stage names must be unique")
+        for stage in stages:
+            for dep in stage.depends_on + stage.context_from:
+                if dep not in self.stages:
+                    raise ValueError(f"Stage '{stage.name}' references unknown stage '{dep}'")
+        self.order = self._topological_order(stages)
+
+    def _topological_order(self, stages: List[AgentStage]) -> List[str]:
+        """Stage names with every stage after its dependencies (declaration order otherwise)"""
+        order: List[str] = []
+        state: Dict[str, str] = {}
+
+        def visit(name: str) -> None:
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"Agent graph has a cycle through '{name}'")
+            state[name] = "visiting"
+            stage = self.stages[name]
+            for dep in stage.depends_on + stage.context_from:
+                visit(dep)
+            state[name] = "done"
+            order.append(name)
+
+        for stage in stages:
+            visit(stage.name)
+        return order
+
+    @property
+    def agent_ids(self) -> List[str]:
+        return list(dict.fromkeys(self.stages[name].agent_id for name in self.order))
+
+    @property
+    def final_stage(self) -> str:
+        return self.order[-1]
+
+# CEO → Engineer → Designer → Marketer → CEO
+SEQUENTIAL_AGENT_GRAPH = AgentGraph([
+    AgentStage("ceo", "ceo", "CEO"),
+    AgentStage("engineer", "engineer", "Engineer", depends_on=["ceo"]),
+    AgentStage("designer", "designer", "Designer", depends_on=["engineer"]),
+    AgentStage("marketer", "marketer", "Marketer", depends_on=["designer"]),
+    AgentStage("ceo_final", "ceo", "CEO", depends_on=["marketer"], context_from=["marketer"]),
+])
+
+# CEO → Engineer → (Designer ‖ Marketer) → CEO
+FANOUT_AGENT_GRAPH = AgentGraph([
+    AgentStage("ceo", "ceo", "CEO"),
+    AgentStage("engineer", "engineer", "Engineer", depends_on=["ceo"]),
+    AgentStage("designer", "designer", "Designer", depends_on=["engineer"]),
+    AgentStage("marketer", "marketer", "Marketer", depends_on=["engineer"]),
+    AgentStage("ceo_final", "ceo", "CEO", depends_on=["designer", "marketer"], context_from=["designer", "marketer"]),
+])
+
+AGENT_GRAPHS = {
+    "sequential": SEQUENTIAL_AGENT_GRAPH,
+    "fanout": FANOUT_AGENT_GRAPH,
+}
+
+class AgentGraphScheduler:
+    """
+    Runs an AgentGraph for one request. Every agent's memory log is read
+    concurrently up front. Each stage starts as soon as its dependencies finish.
+    Log writes run in the background and are awaited before returning. Wall-clock
+    time therefore follows the graph's critical path of LLM calls. Each
+    stage's prompt is packed into the context builder's agent token budget.
+    """
+
+    def __init__(
+        self,
+        ai_service,
+        agent_memory_service,
+        personalities: Dict[str, str] = AGENT_PERSONALITIES,
+        context_builder: Optional[ContextBuilder] = None,
+    ):
+        self.ai_service = ai_service
+        self.agent_memory_service = agent_memory_service
+        self.personalities = personalities
+        self.context_builder = context_builder or default_context_builder
+
+    def _stage_inputs(self, graph: AgentGraph, stage: AgentStage, user_message: str,
+                      outputs: Dict[str, str]) -> tuple:
+        def joined(names: List[str]) -> Optional[str]:
+            if not names:
+                return None
+            if len(names) == 1:
+                return outputs[names[0]]
+            return "\n\n".join(f"{graph.stages[n].role}: {outputs[n]}" for n in names)
+
+        task = joined(stage.depends_on) or user_message
+        return task, joined(stage.context_from)
+
+    async def run(
+        self,
+        graph: AgentGraph,
+        user_message: str,
+        session_id: str,
+        user_api_key: Optional[str] = None,
+        on_event: Optional[Callable[[AgentStreamEvent], None]] = None,
+        stream_tokens: bool = False,
+    ) -> dict:
+        """
+        Run the graph and return {"trace", "result"}. If `on_event` is given it
+        receives stage_started / stage_done / final events, and with
+        `stream_tokens` also every token as it arrives.
+        """
+        emit = on_event or (lambda event: None)
+
+        # Prefetch every agent's memory log concurrently
+        logs = await asyncio.gather(*[
+            self.agent_memory_service.get_memory_log(session_id, agent_id, fields=["role", "content"])
+            for agent_id in graph.agent_ids
+        ])
+        memory_logs: Dict[str, List[str]] = {}
+        log_summaries: Dict[str, Optional[str]] = {}
+        for agent_id, log in zip(graph.agent_ids, logs):
+            log_summaries[agent_id] = next(
+                (msg["content"] for msg in log if msg.get("role") == LOG_SUMMARY_ROLE), None
+            )
+            memory_logs[agent_id] = [msg["content"] for msg in log if msg.get("role") != LOG_SUMMARY_ROLE]
+
+        outputs: Dict[str, str] = {}
+        context_tokens: Dict[str, int] = {}
+        # (offset from the run start, duration) of each stage, in milliseconds
+        timings: Dict[str, tuple] = {}
+        run_start = time.perf_counter()
+        writes: List[asyncio.Task] = []
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_stage(stage: AgentStage) -> str:
+            await asyncio.gather(*[tasks[dep] for dep in stage.depends_on + stage.context_from])
+            started = time.perf_counter()
+            with span("agent.stage", **{"agent.stage": stage.name, "agent.role": stage.role}):
+                out = await run_agent(stage)
+            elapsed = time.perf_counter() - started
+            AGENT_STAGE_LATENCY.labels(stage.name, stage.role).observe(elapsed)
+            timings[stage.name] = (round((started - run_start) * 1000, 1), round(elapsed * 1000, 1))
+            outputs[stage.name] = out
+            emit(AgentStreamEvent(type="stage_done", stage=stage.name, agent=stage.role, content=out,
+                                  context_tokens=context_tokens[stage.name]))
+            msg = AgentMessage(session_id=session_id, agent_id=stage.agent_id, role=stage.role, content=out)
+            # Persist off the critical path
+            writes.append(asyncio.create_task(
+                self.agent_memory_service.queue_message(session_id, stage.agent_id, msg.model_dump())
+            ))
+            return out
+
+        async def run_agent(stage: AgentStage) -> str:
+            task, context = self._stage_inputs(graph, stage, user_message, outputs)
+            personality = self.personalities[stage.agent_id]
+            packed = self.context_builder.build_agent(
+                lambda t, log, ctx: self.ai_service.agent_system_prompt(stage.role, personality, t, log, ctx),
+                task,
+                memory_logs[stage.agent_id],
+                context,
+                summary=log_summaries[stage.agent_id],
+            )
+            context_tokens[stage.name] = packed.tokens
+            emit(AgentStreamEvent(type="stage_started", stage=stage.name, agent=stage.role,
+                                  context_tokens=packed.tokens))
+            agent_kwargs = dict(
+                agent_role=stage.role,
+                agent_personality=personality,
+                task=packed.task,
+                memory_log=packed.memory_log,
+                user_api_key=user_api_key,
+                context=packed.context,
+            )
+            if stream_tokens:
+                chunks = []
+                async for token in self.ai_service.agent_chat_stream(**agent_kwargs):
+                    chunks.append(token)
+                    emit(AgentStreamEvent(type="token", stage=stage.name, agent=stage.role, content=token))
+                out = "".join(chunks)
+            else:
+                out = await self.ai_service.agent_chat(**agent_kwargs)
+            return out
+
+        for name in graph.order:
+            tasks[name] = asyncio.create_task(run_stage(graph.stages[name]))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for pending in tasks.values():
+                pending.cancel()
+            # Keep the turns that did finish
+            await asyncio.gather(*writes, return_exceptions=True)
+            raise
+        await asyncio.gather(*writes)
+
+        trace = [
+            {
+                "agent": graph.stages[name].role,
+                "message": outputs[name],
+                "context_tokens": context_tokens[name],
+                "started_ms": timings[name][0],
+                "duration_ms": timings[name][1],
+            }
+            for name in graph.order
+        ]
+        result = outputs[graph.final_stage]
+        emit(AgentStreamEvent(type="final", content=result, trace=trace))
+        return {"trace": trace, "result": result}
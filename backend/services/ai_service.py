@@ -1,49 +1,201 @@
 import os
-from openai import OpenAI
-from typing import List, Optional
+import hashlib
+from collections import OrderedDict
+import anyio
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional
 from models import Message
+from services.metrics import record_llm_usage, timed_llm
+from services.rate_limiter import AIRateLimitError, request_scheduler_from_env
+from services.response_cache import response_cache_from_env
+
+DEFAULT_SYSTEM_PROMPT = "You are Emergent++, an intelligent AI co-founder that helps users brainstorm, plan, and build their ideas."
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain the running summary of a long conversation. Rewrite the current summary so it also "
+    "covers the new entries. Keep facts, decisions, names, numbers, preferences and open questions; drop "
+    "small talk. Reply with the updated summary only."
+)
 
 class AIService:
     def __init__(self):
         # Will use either user's API key or Emergent LLM key
         self.default_api_key = os.getenv("OPENAI_API_KEY")
+        self.max_clients = int(os.getenv("OPENAI_CLIENT_CACHE_SIZE", "64"))
+        self.max_connections = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+        self.max_keepalive_connections = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+        self.keepalive_expiry = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+        self.timeout = float(os.getenv("OPENAI_TIMEOUT", "120"))
+        self.base_url = os.getenv("OPENAI_BASE_URL") or None
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._clients: "OrderedDict[str, AsyncOpenAI]" = OrderedDict()
+        self.cache = response_cache_from_env()
+        self.scheduler = request_scheduler_from_env()
     
-    def get_client(self, user_api_key: Optional[str] = None) -> OpenAI:
-        """Get OpenAI client with user's key or default key"""
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """Shared HTTP connection pool used by every API key's client"""
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=10.0),
+            )
+            self._clients.clear()
+        return self._http_client
+    
+    def _resolve_api_key(self, user_api_key: Optional[str] = None) -> str:
         api_key = user_api_key or self.default_api_key
         if not api_key:
             raise ValueError("No API key provided. Please provide your OpenAI API key or configure system key.")
-        return OpenAI(api_key=api_key)
+        return api_key
+    
+    def get_client(self, user_api_key: Optional[str] = None) -> AsyncOpenAI:
+        """Get OpenAI client with user's key or default key"""
+        api_key = self._resolve_api_key(user_api_key)
+        
+        http_client = self._get_http_client()
+        client = self._clients.get(api_key)
+        if client is not None:
+            self._clients.move_to_end(api_key)
+            return client
+        
+        # The scheduler retries 429s, connection errors, timeouts and 5xx, honouring Retry-After per key
+        client = AsyncOpenAI(api_key=api_key, base_url=self.base_url, http_client=http_client, max_retries=0)
+        self._clients[api_key] = client
+        # Evicted clients share the pool, so dropping the reference is enough
+        while len(self._clients) > self.max_clients:
+            self._clients.popitem(last=False)
+        return client
+    
+    async def close(self) -> None:
+        """Release pooled connections (called on app shutdown)"""
+        self._clients.clear()
+        if self._http_client is not None and not self._http_client.is_closed:
+            await self._http_client.aclose()
+        self._http_client = None
+    
+    async def _cached(
+        self,
+        endpoint: str,
+        user_api_key: Optional[str],
+        params: dict,
+        compute: Callable[[AsyncOpenAI], Awaitable[Any]],
+    ) -> Any:
+        """
+        Run `compute(client)` through the response cache (a hit skips the network)
+        and, on a miss, through the per-key request scheduler
+        """
+        api_key = self._resolve_api_key(user_api_key)
+        scope = self._key_fingerprint(api_key)
+        
+        async def call() -> Any:
+            # Only on a miss: a cache hit never creates the HTTP pool or a client
+            client = self.get_client(api_key)
+            # Timed per attempt, after the scheduler admits it
+            with timed_llm(endpoint, params.get("model")):
+                return await compute(client)
+        
+        return await self.cache.get_or_compute(
+            endpoint, params, lambda: self.scheduler.run(scope, call), scope=scope
+        )
+    
+    def _key_fingerprint(self, api_key: str) -> str:
+        """Stable non-secret id for a key; caching and rate limiting are scoped by it"""
+        return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    
+    def key_scope(self, user_api_key: Optional[str] = None) -> str:
+        """Fingerprint of the key a request would use (the default key if none is given)"""
+        return self._key_fingerprint(self._resolve_api_key(user_api_key))
+    
+    async def _chat_text(self, endpoint: str, user_api_key: Optional[str], **params) -> str:
+        """Cached chat completion returning the message content"""
+        async def compute(client: AsyncOpenAI) -> str:
+            response = await client.chat.completions.create(**params)
+            record_llm_usage(endpoint, params.get("model"), response.usage)
+            return response.choices[0].message.content
+        return await self._cached(endpoint, user_api_key, params, compute)
+    
+    async def _stream_chat(self, endpoint: str, user_api_key: Optional[str], params: dict) -> AsyncIterator[str]:
+        """Stream chat completion deltas; the key's concurrency slot is held until the stream ends"""
+        api_key = self._resolve_api_key(user_api_key)
+        scope = self._key_fingerprint(api_key)
+        client = self.get_client(api_key)
+        stream = await self.scheduler.run(
+            scope,
+            # The last chunk then carries token usage (and no choices)
+            lambda: client.chat.completions.create(**params, stream=True, stream_options={"include_usage": True}),
+            keep_slot=True,
+        )
+        try:
+            # No span: it would be entered and exited in different contexts across yields
+            with timed_llm(endpoint, params.get("model"), in_span=False):
+                async for chunk in stream:
+                    if chunk.usage is not None:
+                        record_llm_usage(endpoint, params.get("model"), chunk.usage)
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+        finally:
+            self.scheduler.release(scope)
+            # Closing the response drops the upstream request if the caller stopped early
+            with anyio.CancelScope(shield=True):
+                await stream.close()
+    
+    def _format_chat_messages(self, messages: List[Message], system_prompt: str) -> List[dict]:
+        """Format messages for OpenAI"""
+        formatted_messages = [
+            {"role": "system", "content": system_prompt}
+        ]
+        
+        for msg in messages:
+            formatted_messages.append({
+                "role": msg.role,
+                "content": msg.content
+            })
+        return formatted_messages
     
     async def chat_completion(
         self,
         messages: List[Message],
-        system_prompt: str = "You are Emergent++, an intelligent AI co-founder that helps users brainstorm, plan, and build their ideas.",
+        system_prompt: str = DEFAULT_SYSTEM_PROMPT,
         user_api_key: Optional[str] = None
     ) -> str:
         """Generate chat completion with context"""
         try:
-            client = self.get_client(user_api_key)
-            
-            # Format messages for OpenAI
-            formatted_messages = [
-                {"role": "system", "content": system_prompt}
-            ]
-            
-            for msg in messages:
-                formatted_messages.append({
-                    "role": msg.role,
-                    "content": msg.content
-                })
-            
-            response = client.chat.completions.create(
+            return await self._chat_text(
+                "chat",
+                user_api_key,
                 model="gpt-4o",
-                messages=formatted_messages,
+                messages=self._format_chat_messages(messages, system_prompt),
                 temperature=0.7,
                 max_tokens=1000
             )
-            
-            return response.choices[0].message.content
+        except AIRateLimitError:
+            raise
+        except Exception as e:
+            raise Exception(f"AI Service Error: {str(e)}")
+    
+    async def chat_completion_stream(
+        self,
+        messages: List[Message],
+        system_prompt: str = DEFAULT_SYSTEM_PROMPT,
+        user_api_key: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Stream chat completion content deltas as they arrive"""
+        try:
+            params = dict(
+                model="gpt-4o",
+                messages=self._format_chat_messages(messages, system_prompt),
+                temperature=0.7,
+                max_tokens=1000
+            )
+            async for token in self._stream_chat("chat", user_api_key, params):
+                yield token
+        except AIRateLimitError:
+            raise
         except Exception as e:
             raise Exception(f"AI Service Error: {str(e)}")
     
@@ -53,38 +205,36 @@ class AIService:
         description: str,
         current_stage: str,
         months: int,
+        forecast_digest: str,
         user_api_key: Optional[str] = None
-    ) -> dict:
-        """Generate realistic startup growth simulation"""
+    ) -> str:
+        """Narrate a numerical growth forecast"""
         try:
-            client = self.get_client(user_api_key)
-            
             prompt = f"""
-You are a startup growth simulator. Generate a realistic {months}-month growth projection for:
+You are a startup growth analyst. Below is a {months}-month Monte Carlo forecast for:
 
 Startup: {startup_name}
 Description: {description}
 Current Stage: {current_stage}
 
-Provide realistic metrics for each month including:
-- Users/customers growth
-- Revenue (if applicable)
-- Team size
-- Key milestones
-- Challenges faced
-- Funding events (if any)
+Forecast (median with 10th-90th percentile range):
+{forecast_digest}
 
-Respond in JSON format with monthly data.
+Write a short narrative of this outlook: likely milestones, key risks and
+challenges, and when funding or hiring decisions matter. Refer to the numbers;
+do not invent different ones.
 """
             
-            response = client.chat.completions.create(
+            return await self._chat_text(
+                "simulation",
+                user_api_key,
                 model="gpt-4o",
                 messages=[{"role": "user", "content": prompt}],
-                temperature=0.8,
-                max_tokens=2000
+                temperature=0.7,
+                max_tokens=800
             )
-            
-            return {"simulation": response.choices[0].message.content}
+        except AIRateLimitError:
+            raise
         except Exception as e:
             raise Exception(f"Simulation Error: {str(e)}")
     
@@ -96,12 +246,9 @@ Respond in JSON format with monthly data.
     ) -> str:
         """Generate design image using DALL-E"""
         try:
-            client = self.get_client(user_api_key)
-            
             # Enhance prompt based on design type
             enhanced_prompt = f"{design_type} design: {prompt}. Professional, modern, clean aesthetic."
-            
-            response = client.images.generate(
+            params = dict(
                 model="dall-e-3",
                 prompt=enhanced_prompt,
                 size="1024x1024",
@@ -109,10 +256,33 @@ Respond in JSON format with monthly data.
                 n=1
             )
             
-            return response.data[0].url
+            async def compute(client: AsyncOpenAI) -> str:
+                response = await client.images.generate(**params)
+                return response.data[0].url
+            
+            return await self._cached("design", user_api_key, params, compute)
+        except AIRateLimitError:
+            raise
         except Exception as e:
             raise Exception(f"Design Generation Error: {str(e)}")
 
+    def agent_system_prompt(
+        self,
+        agent_role: str,
+        agent_personality: str,
+        task: str,
+        memory_log: str,
+        context: Optional[str],
+    ) -> str:
+        system_prompt = (
+            f"You are {agent_role}, one of several collaborating AI startup team experts. Your personality: {agent_personality}. "
+            f"The task: {task}. "
+            f"Here is your memory buffer (recent log): {memory_log}. "
+        )
+        if context:
+            system_prompt += f"Context from teammates: {context}. "
+        return system_prompt
+
     async def agent_chat(
         self,
         agent_role: str,
@@ -124,22 +294,73 @@ Respond in JSON format with monthly data.
     ) -> str:
         """Generate agent-specific response using provided personality and context."""
         try:
-            client = self.get_client(user_api_key)
-            system_prompt = (
-                f"You are {agent_role}, one of several collaborating AI startup team experts. Your personality: {agent_personality}. "
-                f"The task: {task}. "
-                f"Here is your memory buffer (recent log): {memory_log}. "
+            system_prompt = self.agent_system_prompt(agent_role, agent_personality, task, memory_log, context)
+            return await self._chat_text(
+                "agent",
+                user_api_key,
+                model="gpt-4o",
+                messages=[{"role": "system", "content": system_prompt}],
+                temperature=0.7,
+                max_tokens=1000
             )
-            if context:
-                system_prompt += f"Context from teammates: {context}. "
-            response = client.chat.completions.create(
+        except AIRateLimitError:
+            raise
+        except Exception as e:
+            raise Exception(f"Agent LLM Error: {str(e)}")
+
+    async def agent_chat_stream(
+        self,
+        agent_role: str,
+        agent_personality: str,
+        task: str,
+        memory_log: str = "",
+        user_api_key: Optional[str] = None,
+        context: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """Stream an agent response's content deltas as they arrive."""
+        try:
+            system_prompt = self.agent_system_prompt(agent_role, agent_personality, task, memory_log, context)
+            params = dict(
                 model="gpt-4o",
                 messages=[{"role": "system", "content": system_prompt}],
                 temperature=0.7,
                 max_tokens=1000
             )
-            return response.choices[0].message.content
+            async for token in self._stream_chat("agent", user_api_key, params):
+                yield token
+        except AIRateLimitError:
+            raise
         except Exception as e:
             raise Exception(f"Agent LLM Error: {str(e)}")
 
+    async def summarize(
+        self,
+        previous_summary: Optional[str],
+        entries: List[str],
+        model: str = "gpt-4o-mini",
+        max_tokens: int = 400,
+        user_api_key: Optional[str] = None,
+    ) -> str:
+        """Fold new log entries into a rolling summary"""
+        try:
+            prompt = (
+                f"Current summary:\n{previous_summary or '(none)'}\n\n"
+                "New entries, oldest first:\n" + "\n".join(entries)
+            )
+            return await self._chat_text(
+                "summary",
+                user_api_key,
+                model=model,
+                messages=[
+                    {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt},
+                ],
+                temperature=0.2,
+                max_tokens=max_tokens
+            )
+        except AIRateLimitError:
+            raise
+        except Exception as e:
+            raise Exception(f"Summary Error: {str(e)}")
+
 ai_service = AIService()
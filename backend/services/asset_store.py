@@ -0,0 +1,196 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+import asyncio
+import hashlib
+import logging
+import os
+import re
+
+import httpx
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Resized WebP renditions: name -> longest edge in pixels (None keeps full size)
+VARIANTS: Dict[str, Optional[int]] = {"thumb": 256, "medium": 512, "webp": None}
+# Bump when rendering settings change so cached variants are regenerated
+VARIANT_VERSION = "v1"
+
+MEDIA_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp", "gif": "image/gif"}
+
+ASSET_ID_RE = re.compile(r"^[0-9a-f]{64}$")
+
+class AssetStore:
+    """
+    Content-addressed image store on local disk. Originals are saved once
+    under their SHA-256. Resized WebP variants are rendered by a thread pool,
+    where Pillow releases the GIL while resizing and encoding. Rendering
+    starts in the background at ingest, or happens on first request.
+    """
+
+    def __init__(
+        self,
+        root: str = ".assets",
+        workers: int = 4,
+        max_bytes: int = 20 * 1024 * 1024,
+        public_url: str = "",
+        webp_quality: int = 80,
+    ):
+        self.root = root
+        self.workers = workers
+        self.max_bytes = max_bytes
+        self.public_url = public_url.rstrip("/")
+        self.webp_quality = webp_quality
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._rendering: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._background: set = set()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="assets")
+        return self._executor
+
+    def _get_http_client(self) -> httpx.AsyncClient:
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=10.0), follow_redirects=True)
+        return self._http_client
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+
+    def _original_path(self, asset_id: str, ext: str) -> str:
+        return os.path.join(self.root, "originals", asset_id[:2], f"{asset_id}.{ext}")
+
+    def _variant_path(self, asset_id: str, variant: str) -> str:
+        return os.path.join(self.root, "variants", asset_id[:2], f"{asset_id}-{variant}-{VARIANT_VERSION}.webp")
+
+    def _find_original(self, asset_id: str) -> Optional[Tuple[str, str]]:
+        for ext in MEDIA_TYPES:
+            path = self._original_path(asset_id, ext)
+            if os.path.exists(path):
+                return path, ext
+        return None
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{id(data)}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _store_original(self, data: bytes) -> str:
+        """Validate and save image bytes; returns the asset id (no-op if already stored)"""
+        with Image.open(BytesIO(data)) as image:
+            ext = (image.format or "").lower()
+            image.verify()
+        if ext not in MEDIA_TYPES:
+            raise ValueError(f"Unsupported image format: {ext or 'unknown'}")
+        asset_id = hashlib.sha256(data).hexdigest()
+        path = self._original_path(asset_id, ext)
+        if not os.path.exists(path):
+            self._write_atomic(path, data)
+        return asset_id
+
+    def _render_variant(self, source: str, target: str, max_edge: Optional[int]) -> None:
+        with Image.open(source) as image:
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+            if max_edge:
+                image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            buffer = BytesIO()
+            image.save(buffer, "WEBP", quality=self.webp_quality, method=4)
+        self._write_atomic(target, buffer.getvalue())
+
+    async def ingest_url(self, url: str) -> str:
+        """Download an image once, store it, and start rendering its variants; returns the asset id"""
+        chunks = []
+        size = 0
+        async with self._get_http_client().stream("GET", url) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise ValueError(f"Image larger than {self.max_bytes} bytes")
+                chunks.append(chunk)
+        asset_id = await self._run(self._store_original, b"".join(chunks))
+        for variant in VARIANTS:
+            task = asyncio.create_task(self.ensure_variant(asset_id, variant))
+            self._background.add(task)
+            task.add_done_callback(self._background_done)
+        return asset_id
+
+    def _background_done(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Rendering asset variant failed: %s", task.exception())
+
+    async def ensure_variant(self, asset_id: str, variant: str) -> Optional[str]:
+        """Path of a rendered variant, rendering it first if needed; None if the asset is unknown"""
+        target = self._variant_path(asset_id, variant)
+        if os.path.exists(target):
+            return target
+        key = (asset_id, variant)
+        pending = self._rendering.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        original = self._find_original(asset_id)
+        if original is None:
+            return None
+        future = asyncio.get_running_loop().create_future()
+        self._rendering[key] = future
+        try:
+            await self._run(self._render_variant, original[0], target, VARIANTS[variant])
+            future.set_result(target)
+            return target
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Don't warn about an exception nobody waited for
+            future.exception()
+            raise
+        finally:
+            del self._rendering[key]
+
+    async def open(self, asset_id: str, variant: Optional[str] = None) -> Optional[Tuple[str, str, str]]:
+        """(path, media type, etag) of an original or variant, or None if not found"""
+        if not ASSET_ID_RE.match(asset_id) or (variant is not None and variant not in VARIANTS):
+            return None
+        if variant is None:
+            original = self._find_original(asset_id)
+            if original is None:
+                return None
+            return original[0], MEDIA_TYPES[original[1]], f'"{asset_id}"'
+        path = await self.ensure_variant(asset_id, variant)
+        if path is None:
+            return None
+        return path, "image/webp", f'"{asset_id}-{variant}-{VARIANT_VERSION}"'
+
+    def url(self, asset_id: str, variant: Optional[str] = None) -> str:
+        path = f"/api/assets/{asset_id}" + (f"/{variant}" if variant else "")
+        return self.public_url + path
+
+    async def close(self) -> None:
+        for task in list(self._background):
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+def asset_store_from_env() -> AssetStore:
+    return AssetStore(
+        root=os.getenv("ASSET_DIR", ".assets"),
+        workers=int(os.getenv("ASSET_WORKERS", "4")),
+        max_bytes=int(os.getenv("ASSET_MAX_BYTES", str(20 * 1024 * 1024))),
+        public_url=os.getenv("ASSET_PUBLIC_URL", ""),
+        webp_quality=int(os.getenv("ASSET_WEBP_QUALITY", "80")),
+    )
+
+asset_store = asset_store_from_env()
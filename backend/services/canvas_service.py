@@ -1,71 +1,310 @@
-from pymongo import MongoClient
-from typing import List
-from models import Design, Conversation, Message
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional
+import asyncio
+import logging
+from models import Design, Conversation, Message, from_db, generate_uuid
 from datetime import datetime
-import os
+from services.database import database
+from services.pagination import Page, find_page
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class HistoryPage(Page):
+    summary: Optional[dict] = None  # Rolling summary of compacted messages; first page only
 
 class DesignService:
-    def __init__(self):
-        mongo_url = os.getenv("MONGO_URL", "mongodb://localhost:27017")
-        db_name = os.getenv("DATABASE_NAME", "emergent_plus")
-        self.client = MongoClient(mongo_url)
-        self.db = self.client[db_name]
-        self.collection = self.db["designs"]
+    @property
+    def collection(self):
+        return database.collection("designs")
     
     async def create_design(self, design: Design) -> Design:
         """Create new design"""
         design_dict = design.model_dump()
-        self.collection.insert_one(design_dict)
+        await self.collection.insert_one(design_dict)
         return design
     
-    async def get_designs(self, session_id: str) -> List[Design]:
-        """Get all designs for a session"""
-        designs = list(self.collection.find({"session_id": session_id}).sort("created_at", -1))
-        return [Design(**{**d, "_id": str(d["_id"])}) for d in designs]
+    async def get_designs(self, session_id: str, limit: Optional[int] = None) -> List[Design]:
+        """Get all designs for a session (newest first, optionally only the top `limit`)"""
+        cursor = self.collection.find({"session_id": session_id}, {"_id": 0}).sort("created_at", -1)
+        if limit:
+            cursor = cursor.limit(limit)
+        designs = await cursor.to_list(length=limit)
+        return [from_db(Design, d) for d in designs]
+    
+    async def get_designs_page(
+        self,
+        session_id: str,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+    ) -> Page:
+        """One page of a session's designs as raw documents, newest first"""
+        return await find_page(self.collection, {"session_id": session_id}, limit, cursor, fields)
+    
+    async def count_designs(self, session_id: str) -> int:
+        """Count designs for a session"""
+        return await self.collection.count_documents({"session_id": session_id})
     
     async def delete_design(self, design_id: str) -> bool:
         """Delete design"""
-        result = self.collection.delete_one({"id": design_id})
+        result = await self.collection.delete_one({"id": design_id})
         return result.deleted_count > 0
 
 class ConversationService:
-    def __init__(self):
-        mongo_url = os.getenv("MONGO_URL", "mongodb://localhost:27017")
-        db_name = os.getenv("DATABASE_NAME", "emergent_plus")
-        self.client = MongoClient(mongo_url)
-        self.db = self.client[db_name]
-        self.collection = self.db["conversations"]
+    """
+    Conversation metadata lives in `conversations` (one document per session,
+    holding a `message_count` sequence). Each message is its own document in
+    `conversation_messages`, keyed by (session_id, seq), so appends and tail
+    reads cost the same however long the history grows. Compaction folds old
+    messages into the conversation's rolling `summary` and removes them, so
+    storage per session stays bounded too.
+    """
+
+    @property
+    def collection(self):
+        return database.collection("conversations")
+
+    @property
+    def messages(self):
+        return database.collection("conversation_messages")
+
+    @property
+    def archive(self):
+        return database.collection("conversation_messages_archive")
     
     async def get_or_create_conversation(self, session_id: str) -> Conversation:
         """Get existing conversation or create new one"""
-        conversation = self.collection.find_one({"session_id": session_id})
-        if conversation:
-            return Conversation(**{**conversation, "_id": str(conversation["_id"])})
-        
-        # Create new conversation
         new_conv = Conversation(session_id=session_id)
-        self.collection.insert_one(new_conv.model_dump())
-        return new_conv
+        conversation = await self.collection.find_one_and_update(
+            {"session_id": session_id},
+            {"$setOnInsert": new_conv.model_dump(exclude={"session_id", "messages"})},
+            projection={"_id": 0, "messages": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return Conversation(**conversation)
+    
+    async def _next_seq(self, session_id: str) -> int:
+        """Reserve the next message sequence number for a session"""
+        now = datetime.now()
+        update = {
+            "$inc": {"message_count": 1, "uncompacted_count": 1},
+            "$set": {"updated_at": now},
+            "$setOnInsert": {"id": generate_uuid(), "created_at": now},
+        }
+        try:
+            conversation = await self.collection.find_one_and_update(
+                {"session_id": session_id}, update,
+                projection={"_id": 0, "message_count": 1},
+                upsert=True, return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # Lost a concurrent upsert race; the document exists now
+            conversation = await self.collection.find_one_and_update(
+                {"session_id": session_id}, update,
+                projection={"_id": 0, "message_count": 1},
+                return_document=ReturnDocument.AFTER,
+            )
+        return conversation["message_count"]
     
     async def add_message(self, session_id: str, message: Message) -> bool:
         """Add message to conversation"""
-        result = self.collection.update_one(
+        seq = await self._next_seq(session_id)
+        result = await self.messages.insert_one(
+            {"session_id": session_id, "seq": seq, **message.model_dump()}
+        )
+        return result.inserted_id is not None
+    
+    async def get_conversation_history(self, session_id: str, limit: int = 10) -> List[Message]:
+        """Get recent conversation history: the rolling summary (if any) as a system message, then the tail"""
+        if limit <= 0:
+            return []
+        # Tail read: newest `limit` messages via the (session_id, seq) index
+        conversation, messages = await asyncio.gather(
+            self.collection.find_one(
+                {"session_id": session_id},
+                {"_id": 0, "summary": 1, "summary_through_seq": 1, "summary_updated_at": 1},
+            ),
+            self.messages.find(
+                {"session_id": session_id},
+                {"_id": 0, "seq": 1, "role": 1, "content": 1, "timestamp": 1},
+            ).sort("seq", DESCENDING).limit(limit).to_list(length=limit),
+        )
+        history = []
+        through_seq = 0
+        if conversation and conversation.get("summary"):
+            through_seq = conversation.get("summary_through_seq", 0)
+            history.append(Message(
+                role="system",
+                content=f"Summary of the earlier conversation: {conversation['summary']}",
+                timestamp=conversation.get("summary_updated_at") or datetime.now(),
+            ))
+        # Skip messages already folded into the summary but not yet removed
+        history.extend(from_db(Message, msg) for msg in reversed(messages) if msg["seq"] > through_seq)
+        return history
+    
+    async def get_history_page(
+        self,
+        session_id: str,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+    ) -> HistoryPage:
+        """
+        One page of history as raw documents in chronological order. The
+        first page is the newest messages and carries the rolling summary
+        separately, in `summary`. `next_cursor` pages back to older ones.
+        Messages already folded into the summary are never returned.
+        """
+        conversation = await self.collection.find_one(
             {"session_id": session_id},
+            {"_id": 0, "summary": 1, "summary_through_seq": 1, "summary_updated_at": 1},
+        )
+        query = {"session_id": session_id}
+        if conversation and conversation.get("summary_through_seq"):
+            # Skip messages already folded into the summary but not yet removed
+            query["seq"] = {"$gt": conversation["summary_through_seq"]}
+        # Keyset on seq, which is unique and ordered within a session
+        page = await find_page(
+            self.messages, query, limit, cursor, fields, sort=(("seq", -1),), exclude=("session_id",)
+        )
+        summary = None
+        if not cursor and conversation and conversation.get("summary"):
+            summary = {
+                "content": conversation["summary"],
+                "through_seq": conversation.get("summary_through_seq", 0),
+                "updated_at": conversation.get("summary_updated_at"),
+            }
+        return HistoryPage(items=page.items[::-1], next_cursor=page.next_cursor, summary=summary)
+    
+    async def count_messages(self, session_id: str) -> int:
+        """Count messages in a session (read from the conversation's sequence counter)"""
+        conversation = await self.collection.find_one(
+            {"session_id": session_id}, {"_id": 0, "message_count": 1}
+        )
+        return conversation.get("message_count", 0) if conversation else 0
+    
+    async def migrate_legacy_conversations(self) -> int:
+        """
+        Move messages out of legacy `conversations.messages` arrays into
+        per-message documents. Idempotent; returns the number of sessions migrated.
+        A session whose seqs are already taken by different messages is left
+        unmigrated (and logged) rather than losing either copy.
+        """
+        migrated = 0
+        async for conversation in self.collection.find({"messages": {"$exists": True}}):
+            messages = conversation.get("messages") or []
+            docs = [
+                {"session_id": conversation["session_id"], "seq": seq, **msg}
+                for seq, msg in enumerate(messages, start=1)
+            ]
+            if docs:
+                try:
+                    await self.messages.insert_many(docs, ordered=False)
+                except BulkWriteError as e:
+                    errors = e.details.get("writeErrors", [])
+                    if any(err.get("code") != 11000 for err in errors):
+                        raise
+                    # Already-copied messages from an interrupted run are fine; anything else is a conflict
+                    if not await self._same_messages([docs[err["index"]] for err in errors]):
+                        logger.warning(
+                            "Not migrating conversation %s: its message seqs are taken by other messages",
+                            conversation["session_id"],
+                        )
+                        continue
+            # Only unset an array that is still there, and never move the sequence backwards
+            await self.collection.update_one(
+                {"_id": conversation["_id"], "messages": {"$exists": True}},
+                {
+                    "$unset": {"messages": ""},
+                    "$max": {"message_count": len(messages), "uncompacted_count": len(messages)},
+                },
+            )
+            migrated += 1
+        return migrated
+
+    async def _same_messages(self, docs: List[dict]) -> bool:
+        """Whether every doc is already stored, unchanged, under its (session_id, seq)"""
+        existing = await self.messages.find(
+            {"session_id": docs[0]["session_id"], "seq": {"$in": [doc["seq"] for doc in docs]}},
+            {"_id": 0},
+        ).to_list(length=None)
+        by_seq = {doc["seq"]: doc for doc in existing}
+        return all(by_seq.get(doc["seq"]) == {k: v for k, v in doc.items() if k != "_id"} for doc in docs)
+
+    async def sync_uncompacted_counts(self) -> int:
+        """
+        Recompute `uncompacted_count` where it is missing or disagrees with
+        message_count - summary_through_seq (documents written before it
+        existed). One scan at startup; returns the number of documents fixed.
+        """
+        pending = {"$subtract": [{"$ifNull": ["$message_count", 0]}, {"$ifNull": ["$summary_through_seq", 0]}]}
+        result = await self.collection.update_many(
+            {"$expr": {"$ne": [{"$ifNull": ["$uncompacted_count", None]}, pending]}},
+            [{"$set": {"uncompacted_count": pending}}],
+        )
+        return result.modified_count
+
+    async def compaction_candidates(self, min_pending: int, limit: int) -> List[str]:
+        """Sessions with at least `min_pending` messages not yet folded into their summary, most first"""
+        cursor = self.collection.find(
+            {"uncompacted_count": {"$gte": min_pending}},
+            {"_id": 0, "session_id": 1},
+        ).sort("uncompacted_count", DESCENDING).limit(limit)
+        return [conv["session_id"] async for conv in cursor]
+
+    async def compact(
+        self,
+        session_id: str,
+        keep: int,
+        min_batch: int,
+        max_batch: int,
+        summarize: Callable[[Optional[str], List[str]], Awaitable[str]],
+        archive: bool = False,
+    ) -> int:
+        """
+        Fold the oldest messages beyond the newest `keep` into the rolling
+        summary (at most `max_batch` at a time), then archive or delete them.
+        Returns the number of messages compacted.
+        """
+        conversation = await self.collection.find_one(
+            {"session_id": session_id},
+            {"_id": 0, "message_count": 1, "summary": 1, "summary_through_seq": 1},
+        )
+        if not conversation:
+            return 0
+        through_seq = conversation.get("summary_through_seq", 0)
+        upto_seq = min(conversation.get("message_count", 0) - keep, through_seq + max_batch)
+        if upto_seq - through_seq < min_batch:
+            return 0
+        messages = await self.messages.find(
+            {"session_id": session_id, "seq": {"$gt": through_seq, "$lte": upto_seq}},
+            {"_id": 0},
+        ).sort("seq", ASCENDING).to_list(length=None)
+        summary = conversation.get("summary")
+        if messages:
+            summary = await summarize(summary, [f"{msg['role']}: {msg['content']}" for msg in messages])
+        # Only apply if no other worker compacted this range first
+        result = await self.collection.update_one(
+            {"session_id": session_id, "summary_through_seq": through_seq or {"$in": [0, None]}},
             {
-                "$push": {"messages": message.model_dump()},
-                "$set": {"updated_at": datetime.now()}
+                "$set": {"summary": summary, "summary_through_seq": upto_seq, "summary_updated_at": datetime.now()},
+                "$inc": {"uncompacted_count": through_seq - upto_seq},
             },
-            upsert=True
         )
-        return result.modified_count > 0 or result.upserted_id is not None
-    
-    async def get_conversation_history(self, session_id: str, limit: int = 10) -> List[Message]:
-        """Get recent conversation history"""
-        conversation = self.collection.find_one({"session_id": session_id})
-        if conversation and "messages" in conversation:
-            messages = conversation["messages"][-limit:]
-            return [Message(**msg) for msg in messages]
-        return []
+        if result.modified_count == 0:
+            return 0
+        if archive and messages:
+            try:
+                await self.archive.insert_many(messages, ordered=False)
+            except BulkWriteError as e:
+                if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                    raise
+        await self.messages.delete_many({"session_id": session_id, "seq": {"$lte": upto_seq}})
+        return len(messages)
 
 design_service = DesignService()
 conversation_service = ConversationService()
@@ -0,0 +1,129 @@
+from typing import List, Optional
+from services.ai_service import ai_service
+from services.canvas_service import conversation_service
+from services.context_builder import context_builder
+from services.memory_service import agent_memory_service
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+class CompactionService:
+    """
+    Background job that periodically folds old conversation messages and
+    agent log entries into per-session rolling summaries, keeping only a
+    recent tail of raw entries. Runs on its own task, off the request path.
+    """
+
+    def __init__(
+        self,
+        interval: float = 300.0,
+        keep_messages: int = 20,
+        keep_log_entries: int = 10,
+        min_batch: int = 20,
+        max_batch: int = 100,
+        sessions_per_run: int = 50,
+        entry_tokens: int = 500,
+        summary_model: str = "gpt-4o-mini",
+        summary_tokens: int = 400,
+        archive: bool = False,
+    ):
+        self.interval = interval
+        self.keep_messages = keep_messages
+        self.keep_log_entries = keep_log_entries
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        self.sessions_per_run = sessions_per_run
+        self.entry_tokens = entry_tokens
+        self.summary_model = summary_model
+        self.summary_tokens = summary_tokens
+        self.archive = archive
+        self._task: Optional[asyncio.Task] = None
+
+    async def _summarize(self, previous_summary: Optional[str], entries: List[str]) -> str:
+        # Bound the summarizer's input however long individual entries are
+        entries = [context_builder.counter.truncate(entry, self.entry_tokens) for entry in entries]
+        return await ai_service.summarize(
+            previous_summary, entries, model=self.summary_model, max_tokens=self.summary_tokens
+        )
+
+    async def compact_conversations(self) -> int:
+        """Compact every conversation that is due; returns the number of messages folded"""
+        compacted = 0
+        session_ids = await conversation_service.compaction_candidates(
+            self.keep_messages + self.min_batch, self.sessions_per_run
+        )
+        for session_id in session_ids:
+            try:
+                compacted += await conversation_service.compact(
+                    session_id, self.keep_messages, self.min_batch, self.max_batch,
+                    self._summarize, archive=self.archive,
+                )
+            except Exception as e:
+                logger.warning("Compacting conversation %s failed: %s", session_id, e)
+        return compacted
+
+    async def compact_agent_logs(self) -> int:
+        """Compact every agent log that is due; returns the number of entries folded"""
+        compacted = 0
+        logs = await agent_memory_service.compaction_candidates(
+            self.keep_log_entries + self.min_batch, self.sessions_per_run
+        )
+        for session_id, agent_id in logs:
+            try:
+                compacted += await agent_memory_service.compact(
+                    session_id, agent_id, self.keep_log_entries, self.min_batch, self.max_batch,
+                    self._summarize, archive=self.archive,
+                )
+            except Exception as e:
+                logger.warning("Compacting %s log for %s failed: %s", agent_id, session_id, e)
+        return compacted
+
+    async def run_once(self) -> dict:
+        return {
+            "messages": await self.compact_conversations(),
+            "log_entries": await self.compact_agent_logs(),
+        }
+
+    async def _run_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                result = await self.run_once()
+                if any(result.values()):
+                    logger.info("Compacted %(messages)d messages and %(log_entries)d agent log entries", result)
+            except Exception as e:
+                logger.error("Compaction run failed: %s", e)
+
+    def start(self) -> None:
+        """Start the periodic job (no-op if disabled or already running)"""
+        if self.interval <= 0 or (self._task is not None and not self._task.done()):
+            return
+        if not ai_service.default_api_key:
+            logger.info("Compaction disabled: it needs OPENAI_API_KEY to summarize")
+            return
+        self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+def compaction_service_from_env() -> CompactionService:
+    return CompactionService(
+        interval=float(os.getenv("COMPACTION_INTERVAL_SECONDS", "300")),
+        keep_messages=int(os.getenv("COMPACTION_KEEP_MESSAGES", "20")),
+        keep_log_entries=int(os.getenv("COMPACTION_KEEP_LOG_ENTRIES", "10")),
+        min_batch=int(os.getenv("COMPACTION_MIN_BATCH", "20")),
+        max_batch=int(os.getenv("COMPACTION_MAX_BATCH", "100")),
+        sessions_per_run=int(os.getenv("COMPACTION_SESSIONS_PER_RUN", "50")),
+        entry_tokens=int(os.getenv("COMPACTION_ENTRY_TOKENS", "500")),
+        summary_model=os.getenv("COMPACTION_SUMMARY_MODEL", "gpt-4o-mini"),
+        summary_tokens=int(os.getenv("COMPACTION_SUMMARY_TOKENS", "400")),
+        archive=os.getenv("COMPACTION_ARCHIVE", "false").lower() in ("1", "true", "yes"),
+    )
+
+compaction_service = compaction_service_from_env()
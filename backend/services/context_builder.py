@@ -0,0 +1,251 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+from models import Memory, Message
+import math
+import os
+
+try:
+    import tiktoken
+except ImportError:  # optional; counts fall back to a character estimate
+    tiktoken = None
+
+# Chat format framing: tokens added per message and to prime the reply
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+CHARS_PER_TOKEN = 4
+TRUNCATION_MARKER = " …"
+
+MEMORY_HEADER = "\nRelevant memories from this workspace:\n"
+
+class TokenCounter:
+    """
+    Counts tokens with tiktoken when its encoding is available, else ~4
+    characters per token. The encoding is loaded on first use, because a
+    cold tiktoken cache downloads it; call `load()` at startup to do that
+    off the request path.
+    """
+
+    def __init__(self, model: str = "gpt-4o"):
+        self.model = model
+        self._loaded = False
+        self._encoding = None
+
+    def load(self) -> None:
+        """Load the encoding (blocking; may download the BPE file once)"""
+        if self._loaded:
+            return
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(self.model)
+            except Exception:
+                # Unknown model, or the BPE file can't be fetched (offline)
+                self._encoding = None
+        self._loaded = True
+
+    @property
+    def encoding(self):
+        if not self._loaded:
+            self.load()
+        return self._encoding
+
+    @property
+    def exact(self) -> bool:
+        return self.encoding is not None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut `text` to at most `max_tokens`, keeping its start"""
+        if self.count(text) <= max_tokens:
+            return text
+        room = max_tokens - self.count(TRUNCATION_MARKER)
+        if room <= 0:
+            return ""
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            return self.encoding.decode(tokens[:room]) + TRUNCATION_MARKER
+        return text[:room * CHARS_PER_TOKEN] + TRUNCATION_MARKER
+
+@dataclass
+class ContextItem:
+    """
+    One candidate piece of prompt context. Items are packed in `priority`
+    order (lowest first). An item that doesn't fit is truncated if at least
+    `min_tokens` of it would remain, otherwise dropped. Once an item of a
+    `group` is dropped, the rest of that group is dropped too, so a history
+    never has gaps.
+    """
+    key: str
+    text: str
+    priority: int
+    overhead: int = 0
+    min_tokens: int = 64
+    group: Optional[str] = None
+
+@dataclass
+class ChatContext:
+    system_prompt: str
+    messages: List[Message]
+    tokens: int
+    dropped_messages: int = 0
+    dropped_memories: int = 0
+
+@dataclass
+class AgentContext:
+    task: str
+    memory_log: str
+    context: Optional[str]
+    tokens: int
+    dropped_log_entries: int = 0
+
+class ContextBuilder:
+    """
+    Assembles chat and agent prompts within a token budget. Fixed parts
+    (system prompt, the user's message or the agent's task) come first, then
+    the most recent history, recalled memories and older history or log
+    entries until the budget is spent.
+    """
+
+    def __init__(
+        self,
+        chat_budget: int = 6000,
+        agent_budget: int = 3000,
+        recent_messages: int = 4,
+        counter: Optional[TokenCounter] = None,
+    ):
+        self.chat_budget = chat_budget
+        self.agent_budget = agent_budget
+        self.recent_messages = recent_messages
+        self.counter = counter or TokenCounter()
+
+    def count_messages(self, system_prompt: str, messages: List[Message]) -> int:
+        """Prompt tokens for a system prompt plus chat messages"""
+        tokens = self.counter.count(system_prompt) + MESSAGE_OVERHEAD_TOKENS + REPLY_PRIMING_TOKENS
+        for msg in messages:
+            tokens += self.counter.count(msg.content) + MESSAGE_OVERHEAD_TOKENS
+        return tokens
+
+    def pack(self, items: List[ContextItem], budget: int) -> Tuple[Dict[str, str], int]:
+        """Fit items into `budget` tokens; returns {key: kept text} and the tokens used"""
+        kept: Dict[str, str] = {}
+        closed_groups = set()
+        used = 0
+        for item in sorted(items, key=lambda item: item.priority):
+            if item.group in closed_groups:
+                continue
+            remaining = budget - used - item.overhead
+            cost = self.counter.count(item.text)
+            text = item.text
+            if cost > remaining:
+                text = self.counter.truncate(item.text, remaining) if remaining >= item.min_tokens else ""
+                if not text:
+                    if item.group is not None:
+                        closed_groups.add(item.group)
+                    continue
+                cost = self.counter.count(text)
+            kept[item.key] = text
+            used += cost + item.overhead
+        return kept, used
+
+    def build_chat(
+        self,
+        system_prompt: str,
+        history: List[Message],
+        user_message: Message,
+        memories: List[Memory],
+    ) -> ChatContext:
+        """Pick the history and recalled memories that fit the chat budget"""
+        fixed = self.count_messages(system_prompt, [])
+        if memories:
+            fixed += self.counter.count(MEMORY_HEADER)
+        items = [ContextItem("user", user_message.content, 0, MESSAGE_OVERHEAD_TOKENS, min_tokens=1)]
+        newest_first = list(enumerate(history))[::-1]
+        rank = 0
+        for i, msg in newest_first:
+            if msg.role == "system":
+                # Rolling summary of compacted history; ranks with recalled memories
+                items.append(ContextItem(f"history:{i}", msg.content, 2, MESSAGE_OVERHEAD_TOKENS))
+                continue
+            items.append(ContextItem(
+                f"history:{i}", msg.content, 1 if rank < self.recent_messages else 3,
+                MESSAGE_OVERHEAD_TOKENS, group="history",
+            ))
+            rank += 1
+        for i, mem in enumerate(memories):
+            items.append(ContextItem(f"memory:{i}", f"- [{mem.category}] {mem.content}", 2, overhead=1))
+
+        kept, _ = self.pack(items, self.chat_budget - fixed)
+
+        messages = [
+            msg.model_copy(update={"content": kept[f"history:{i}"]})
+            for i, msg in enumerate(history) if f"history:{i}" in kept
+        ]
+        messages.append(user_message.model_copy(update={"content": kept.get("user", "")}))
+        lines = [kept[f"memory:{i}"] for i in range(len(memories)) if f"memory:{i}" in kept]
+        if lines:
+            system_prompt += MEMORY_HEADER + "\n".join(lines)
+        return ChatContext(
+            system_prompt=system_prompt,
+            messages=messages,
+            tokens=self.count_messages(system_prompt, messages),
+            dropped_messages=len(history) - (len(messages) - 1),
+            dropped_memories=len(memories) - len(lines),
+        )
+
+    def build_agent(
+        self,
+        render: Callable[[str, str, Optional[str]], str],
+        task: str,
+        log_entries: List[str],
+        context: Optional[str] = None,
+        summary: Optional[str] = None,
+    ) -> AgentContext:
+        """
+        Fit an agent's task, teammate context, log summary and newest log
+        entries into the agent budget. `render(task, memory_log, context)`
+        builds the system prompt.
+        """
+        base = self.counter.count(render("", "", None))
+        fixed = base + MESSAGE_OVERHEAD_TOKENS + REPLY_PRIMING_TOKENS
+        items = [ContextItem("task", task, 0, min_tokens=1)]
+        if context:
+            # The template wraps teammate context in extra text
+            wrapper = max(0, self.counter.count(render("", "", " ")) - base)
+            items.append(ContextItem("context", context, 1, overhead=wrapper))
+        if summary:
+            items.append(ContextItem("summary", f"Summary of earlier entries: {summary}", 2, overhead=1))
+        for i in reversed(range(len(log_entries))):
+            items.append(ContextItem(f"log:{i}", log_entries[i], 3, overhead=1, group="log"))
+
+        kept, _ = self.pack(items, self.agent_budget - fixed)
+
+        entries = [kept[f"log:{i}"] for i in range(len(log_entries)) if f"log:{i}" in kept]
+        if "summary" in kept:
+            entries.insert(0, kept["summary"])
+        packed = AgentContext(
+            task=kept.get("task", ""),
+            memory_log="\n".join(entries),
+            context=kept.get("context"),
+            tokens=0,
+            dropped_log_entries=len(log_entries) - len(entries) + ("summary" in kept),
+        )
+        packed.tokens = (
+            self.counter.count(render(packed.task, packed.memory_log, packed.context))
+            + MESSAGE_OVERHEAD_TOKENS + REPLY_PRIMING_TOKENS
+        )
+        return packed
+
+def context_builder_from_env() -> ContextBuilder:
+    return ContextBuilder(
+        chat_budget=int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "6000")),
+        agent_budget=int(os.getenv("AGENT_CONTEXT_TOKEN_BUDGET", "3000")),
+        recent_messages=int(os.getenv("CHAT_CONTEXT_RECENT_MESSAGES", "4")),
+        counter=TokenCounter(os.getenv("CONTEXT_TOKENIZER_MODEL", "gpt-4o")),
+    )
+
+context_builder = context_builder_from_env()
@@ -0,0 +1,62 @@
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from services.metrics import InstrumentedCollection
+from typing import Optional
+import os
+
+class Database:
+    """Process-wide MongoDB client shared by every service"""
+
+    def __init__(self):
+        self.client: Optional[AsyncIOMotorClient] = None
+        self._db: Optional[AsyncIOMotorDatabase] = None
+
+    def client_options(self) -> dict:
+        """Connection pool, timeout, read preference and write concern settings from env"""
+        options = {
+            "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", "100")),
+            "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+            "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000")),
+            "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000")),
+            "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000")),
+            "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "10000")),
+            "readPreference": os.getenv("MONGO_READ_PREFERENCE", "primary"),
+            "appname": os.getenv("MONGO_APP_NAME", "emergent-plus-backend"),
+        }
+        socket_timeout = os.getenv("MONGO_SOCKET_TIMEOUT_MS")
+        if socket_timeout:
+            options["socketTimeoutMS"] = int(socket_timeout)
+        write_concern = os.getenv("MONGO_WRITE_CONCERN")
+        if write_concern:
+            options["w"] = int(write_concern) if write_concern.isdigit() else write_concern
+        journal = os.getenv("MONGO_JOURNAL")
+        if journal:
+            options["journal"] = journal.lower() in ("1", "true", "yes")
+        return options
+
+    def connect(self) -> None:
+        """Create the shared client (called on app startup)"""
+        if self.client is not None:
+            return
+        mongo_url = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+        db_name = os.getenv("DATABASE_NAME", "emergent_plus")
+        self.client = AsyncIOMotorClient(mongo_url, **self.client_options())
+        self._db = self.client[db_name]
+
+    def close(self) -> None:
+        """Close the shared client (called on app shutdown)"""
+        if self.client is not None:
+            self.client.close()
+        self.client = None
+        self._db = None
+
+    @property
+    def db(self) -> AsyncIOMotorDatabase:
+        if self._db is None:
+            raise RuntimeError("Database is not connected. Call database.connect() on startup.")
+        return self._db
+
+    def collection(self, name: str) -> InstrumentedCollection:
+        """Get a collection handle from the shared client; every operation on it is timed"""
+        return InstrumentedCollection(self.db[name])
+
+database = Database()
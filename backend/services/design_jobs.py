@@ -0,0 +1,245 @@
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+from models import Design, DesignJob, DesignSpec, from_db, generate_uuid
+from services.database import database
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATES = ("succeeded", "failed")
+
+# Creates and stores one design: (session_id, prompt, design_type, user_api_key) -> Design
+DesignRunner = Callable[[str, str, str, Optional[str]], Awaitable[Design]]
+
+class DesignQueueFullError(Exception):
+    """Too many design jobs are waiting already"""
+
+class DesignJobQueue:
+    """
+    Runs design generations in the background. Submitted jobs are stored in
+    `design_jobs` and queued per API key. A fixed set of worker tasks takes
+    jobs round-robin across keys, and each key has at most
+    `per_key_concurrency` jobs running. A large batch from one tenant can't
+    hold every worker this way. Status changes are written to MongoDB for
+    polling and published to in-process subscribers for streaming.
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        per_key_concurrency: int = 2,
+        max_queued: int = 1000,
+        retention_hours: float = 168.0,
+    ):
+        self.workers = workers
+        self.per_key_concurrency = per_key_concurrency
+        self.max_queued = max_queued
+        self.retention_hours = retention_hours
+        self._runner: Optional[DesignRunner] = None
+        self._pending: Dict[str, Deque[Tuple[DesignJob, Optional[str]]]] = {}
+        self._rotation: Deque[str] = deque()  # keys with queued jobs, in round-robin order
+        self._in_flight: Dict[str, int] = {}
+        self._running: Dict[str, DesignJob] = {}
+        self._queued = 0
+        self._changed: Optional[asyncio.Condition] = None
+        self._tasks: List[asyncio.Task] = []
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    @property
+    def collection(self):
+        return database.collection("design_jobs")
+
+    def start(self, runner: DesignRunner) -> None:
+        """Start the worker tasks (no-op if already running)"""
+        if self._tasks:
+            return
+        self._runner = runner
+        self._changed = asyncio.Condition()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Cancel the workers and mark every unfinished job of this process as failed"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        unfinished = [job for jobs in self._pending.values() for job, _ in jobs]
+        unfinished += list(self._running.values())
+        self._pending.clear()
+        self._rotation.clear()
+        self._running.clear()
+        self._queued = 0
+        if unfinished:
+            await self._finish_many(unfinished, "Interrupted by a server shutdown")
+
+    async def submit(
+        self,
+        session_id: str,
+        specs: List[DesignSpec],
+        scope: str,
+        user_api_key: Optional[str] = None,
+    ) -> List[DesignJob]:
+        """Store one job per spec under a shared batch id and queue them under `scope`"""
+        if not self._tasks:
+            raise RuntimeError("Design job queue is not running")
+        if self._queued + len(specs) > self.max_queued:
+            raise DesignQueueFullError(f"More than {self.max_queued} design jobs are queued")
+        batch_id = generate_uuid()
+        jobs = [
+            DesignJob(batch_id=batch_id, session_id=session_id, prompt=spec.prompt, design_type=spec.design_type)
+            for spec in specs
+        ]
+        await self.collection.insert_many([job.model_dump() for job in jobs], ordered=False)
+        # The key stays in memory only; it is never written to the job documents
+        queue = self._pending.setdefault(scope, deque())
+        queue.extend((job, user_api_key) for job in jobs)
+        self._queued += len(jobs)
+        if scope not in self._rotation:
+            self._rotation.append(scope)
+        async with self._changed:
+            self._changed.notify(len(jobs))
+        return jobs
+
+    def _take(self) -> Optional[Tuple[str, DesignJob, Optional[str]]]:
+        """Next job from the first key (round-robin) that is under its concurrency cap"""
+        for _ in range(len(self._rotation)):
+            scope = self._rotation.popleft()
+            queue = self._pending[scope]
+            if self._in_flight.get(scope, 0) >= self.per_key_concurrency:
+                self._rotation.append(scope)
+                continue
+            job, user_api_key = queue.popleft()
+            if queue:
+                self._rotation.append(scope)
+            else:
+                del self._pending[scope]
+            self._queued -= 1
+            self._in_flight[scope] = self._in_flight.get(scope, 0) + 1
+            return scope, job, user_api_key
+        return None
+
+    async def _work(self) -> None:
+        while True:
+            async with self._changed:
+                while (taken := self._take()) is None:
+                    await self._changed.wait()
+            scope, job, user_api_key = taken
+            try:
+                await self._run(job, user_api_key)
+            finally:
+                self._in_flight[scope] -= 1
+                if not self._in_flight[scope]:
+                    del self._in_flight[scope]
+                async with self._changed:
+                    self._changed.notify()
+
+    async def _run(self, job: DesignJob, user_api_key: Optional[str]) -> None:
+        self._running[job.id] = job
+        job.status = "running"
+        job.started_at = datetime.now()
+        await self._save(job, {"status": job.status, "started_at": job.started_at})
+        try:
+            design = await self._runner(job.session_id, job.prompt, job.design_type, user_api_key)
+        except asyncio.CancelledError:
+            # Left in _running so stop() marks it failed
+            raise
+        except Exception as e:
+            logger.warning("Design job %s failed: %s", job.id, e)
+            del self._running[job.id]
+            await self._finish_many([job], str(e))
+            return
+        del self._running[job.id]
+        job.status = "succeeded"
+        job.design = design
+        job.finished_at = datetime.now()
+        await self._save(job, {
+            "status": job.status,
+            "design": design.model_dump(),
+            "finished_at": job.finished_at,
+            "expires_at": job.finished_at + timedelta(hours=self.retention_hours),
+        })
+
+    async def _save(self, job: DesignJob, fields: dict) -> None:
+        try:
+            await self.collection.update_one({"id": job.id}, {"$set": fields})
+        except Exception as e:
+            logger.error("Saving design job %s failed: %s", job.id, e)
+        self._publish(job)
+
+    async def _finish_many(self, jobs: List[DesignJob], error: str) -> None:
+        now = datetime.now()
+        for job in jobs:
+            job.status = "failed"
+            job.error = error
+            job.finished_at = now
+        try:
+            await self.collection.update_many(
+                {"id": {"$in": [job.id for job in jobs]}},
+                {"$set": {
+                    "status": "failed",
+                    "error": error,
+                    "finished_at": now,
+                    "expires_at": now + timedelta(hours=self.retention_hours),
+                }},
+            )
+        except Exception as e:
+            logger.error("Saving failed design jobs failed: %s", e)
+        for job in jobs:
+            self._publish(job)
+
+    def _publish(self, job: DesignJob) -> None:
+        for queue in self._subscribers.get(job.batch_id, ()):
+            queue.put_nowait(job.model_copy(deep=True))
+
+    def subscribe(self, batch_id: str) -> asyncio.Queue:
+        """Queue receiving a copy of each job of the batch whenever its status changes"""
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(batch_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, batch_id: str, queue: asyncio.Queue) -> None:
+        subscribers = self._subscribers.get(batch_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[batch_id]
+
+    async def get_job(self, job_id: str) -> Optional[DesignJob]:
+        doc = await self.collection.find_one({"id": job_id}, {"_id": 0})
+        return from_db(DesignJob, doc) if doc else None
+
+    async def get_batch(self, batch_id: str) -> List[DesignJob]:
+        """Jobs of a batch in submission order"""
+        docs = await self.collection.find({"batch_id": batch_id}, {"_id": 0}).sort("created_at", 1).to_list(length=None)
+        return [from_db(DesignJob, doc) for doc in docs]
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._tasks),
+            "queued": self._queued,
+            "running": len(self._running),
+            "keys": {
+                scope: {"queued": len(self._pending.get(scope, ())), "running": self._in_flight.get(scope, 0)}
+                for scope in set(self._pending) | set(self._in_flight)
+            },
+        }
+
+def batch_status(jobs: List[DesignJob]) -> dict:
+    """Per-status job counts of a batch and whether every job has finished"""
+    counts = {status: 0 for status in ("queued", "running") + FINISHED_STATES}
+    for job in jobs:
+        counts[job.status] = counts.get(job.status, 0) + 1
+    return {"counts": counts, "done": all(job.status in FINISHED_STATES for job in jobs)}
+
+def design_job_queue_from_env() -> DesignJobQueue:
+    return DesignJobQueue(
+        workers=int(os.getenv("DESIGN_JOB_WORKERS", "4")),
+        per_key_concurrency=int(os.getenv("DESIGN_JOB_PER_KEY_CONCURRENCY", "2")),
+        max_queued=int(os.getenv("DESIGN_JOB_MAX_QUEUED", "1000")),
+        retention_hours=float(os.getenv("DESIGN_JOB_RETENTION_HOURS", "168")),
+    )
+
+design_job_queue = design_job_queue_from_env()
@@ -0,0 +1,222 @@
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from typing import Dict, List, Optional, Tuple
+from services.database import database
+import argparse
+import asyncio
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+# Indexes backing each collection's hot query shapes
+INDEXES: Dict[str, List[IndexModel]] = {
+    "memories": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("session_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+                   name="session_created_id"),
+        IndexModel([("session_id", ASCENDING), ("updated_at", ASCENDING)], name="session_updated"),
+    ],
+    "agent_memories": [
+        IndexModel([("session_id", ASCENDING), ("agent_id", ASCENDING)], name="session_agent_unique", unique=True),
+        IndexModel([("uncompacted_count", DESCENDING)], name="uncompacted_count"),
+    ],
+    "startups": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("session_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+                   name="session_created_id"),
+    ],
+    "designs": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("session_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+                   name="session_created_id"),
+    ],
+    "conversations": [
+        IndexModel([("session_id", ASCENDING)], name="session_unique", unique=True),
+        IndexModel([("uncompacted_count", DESCENDING)], name="uncompacted_count"),
+    ],
+    "conversation_messages": [
+        IndexModel([("session_id", ASCENDING), ("seq", ASCENDING)], name="session_seq_unique", unique=True),
+    ],
+    "conversation_messages_archive": [
+        IndexModel([("session_id", ASCENDING), ("seq", ASCENDING)], name="session_seq_unique", unique=True),
+    ],
+    "agent_memories_archive": [
+        IndexModel([("session_id", ASCENDING), ("agent_id", ASCENDING), ("timestamp", ASCENDING)],
+                   name="session_agent_timestamp"),
+    ],
+    "simulations": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("startup_id", ASCENDING), ("inputs_hash", ASCENDING), ("seed", ASCENDING)],
+                   name="startup_inputs_seed_unique", unique=True),
+        IndexModel([("startup_id", ASCENDING), ("created_at", DESCENDING)], name="startup_created"),
+    ],
+    "design_jobs": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("batch_id", ASCENDING), ("created_at", ASCENDING)], name="batch_created"),
+        IndexModel([("expires_at", ASCENDING)], name="expires_ttl", expireAfterSeconds=0),
+    ],
+    "llm_cache": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_ttl", expireAfterSeconds=0),
+    ],
+}
+
+# Page after a cursor, as built by services.pagination.find_page
+KEYSET_SORT = [("created_at", DESCENDING), ("id", DESCENDING)]
+KEYSET_AFTER = {"$or": [
+    {"created_at": {"$lt": datetime(2024, 1, 1)}},
+    {"created_at": datetime(2024, 1, 1), "id": {"$lt": "x"}},
+]}
+
+# Service query shapes that must be served by an index: (collection, filter, sort)
+QUERY_SHAPES: List[Tuple[str, dict, Optional[list]]] = [
+    ("memories", {"session_id": "s"}, [("created_at", DESCENDING)]),
+    ("memories", {"session_id": "s", "category": "idea"}, [("created_at", DESCENDING)]),
+    ("memories", {"id": "x"}, None),
+    ("memories", {"$and": [{"session_id": "s"}, KEYSET_AFTER]}, KEYSET_SORT),
+    ("memories", {"id": {"$in": ["x", "y"]}}, None),
+    ("memories", {"session_id": "s", "updated_at": {"$gte": datetime(1970, 1, 1)}}, None),
+    ("agent_memories", {"session_id": "s", "agent_id": "ceo"}, None),
+    ("agent_memories", {"uncompacted_count": {"$gte": 30}}, [("uncompacted_count", DESCENDING)]),
+    ("startups", {"session_id": "s"}, [("created_at", DESCENDING)]),
+    ("startups", {"id": "x"}, None),
+    ("startups", {"$and": [{"session_id": "s"}, KEYSET_AFTER]}, KEYSET_SORT),
+    ("startups", {"id": {"$in": ["x", "y"]}}, None),
+    ("simulations", {"startup_id": "x", "inputs_hash": "h", "seed": 1}, None),
+    ("simulations", {"startup_id": "x", "inputs_hash": "h"}, [("created_at", DESCENDING)]),
+    ("simulations", {"startup_id": "x"}, [("created_at", DESCENDING)]),
+    ("simulations", {"id": "x"}, None),
+    ("designs", {"session_id": "s"}, [("created_at", DESCENDING)]),
+    ("designs", {"id": "x"}, None),
+    ("designs", {"$and": [{"session_id": "s"}, KEYSET_AFTER]}, KEYSET_SORT),
+    ("design_jobs", {"id": "x"}, None),
+    ("design_jobs", {"id": {"$in": ["x", "y"]}}, None),
+    ("design_jobs", {"batch_id": "b"}, [("created_at", ASCENDING)]),
+    ("conversations", {"session_id": "s"}, None),
+    ("conversations", {"uncompacted_count": {"$gte": 40}}, [("uncompacted_count", DESCENDING)]),
+    ("conversation_messages", {"session_id": "s"}, [("seq", DESCENDING)]),
+    ("conversation_messages", {"$and": [{"session_id": "s", "seq": {"$gt": 1}}, {"seq": {"$lt": 9}}]},
+     [("seq", DESCENDING)]),
+]
+
+class IndexManager:
+    def __init__(self, indexes: Dict[str, List[IndexModel]] = INDEXES):
+        self.indexes = indexes
+
+    async def ensure_indexes(self) -> None:
+        """Create every declared index (no-op for indexes that already exist)"""
+        for collection_name, models in self.indexes.items():
+            try:
+                await database.collection(collection_name).create_indexes(models)
+            except OperationFailure as e:
+                # e.g. duplicate keys blocking a unique index; surfaced by report_drift
+                logger.error("Could not create indexes on %s: %s", collection_name, e)
+
+    async def report_drift(self) -> Dict[str, Dict[str, List[str]]]:
+        """Compare declared indexes with what exists on the server"""
+        drift = {}
+        for collection_name, models in self.indexes.items():
+            declared = {model.document["name"]: model.document for model in models}
+            existing = await database.collection(collection_name).index_information()
+            existing.pop("_id_", None)
+
+            missing = [name for name in declared if name not in existing]
+            extra = [name for name in existing if name not in declared]
+            changed = []
+            for name, spec in declared.items():
+                info = existing.get(name)
+                if info is None:
+                    continue
+                if list(spec["key"].items()) != [tuple(k) for k in info["key"]] or \
+                        bool(spec.get("unique")) != bool(info.get("unique")) or \
+                        spec.get("expireAfterSeconds") != info.get("expireAfterSeconds"):
+                    changed.append(name)
+
+            if missing or extra or changed:
+                drift[collection_name] = {"missing": missing, "extra": extra, "changed": changed}
+        for collection_name, details in drift.items():
+            logger.warning("Index drift on %s: %s", collection_name, details)
+        return drift
+
+    async def winning_plan_stages(
+        self,
+        collection_name: str,
+        query: dict,
+        sort: Optional[list] = None,
+    ) -> List[str]:
+        """Return the stage names of the query planner's winning plan"""
+        cursor = database.collection(collection_name).find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = []
+        stack = [explain["queryPlanner"]["winningPlan"]]
+        while stack:
+            plan = stack.pop()
+            # Newer servers nest the classic plan under queryPlan
+            plan = plan.get("queryPlan", plan)
+            if "stage" in plan:
+                stages.append(plan["stage"])
+            if "inputStage" in plan:
+                stack.append(plan["inputStage"])
+            stack.extend(plan.get("inputStages", []))
+        return stages
+
+    async def assert_uses_index(
+        self,
+        collection_name: str,
+        query: dict,
+        sort: Optional[list] = None,
+    ) -> None:
+        """Raise AssertionError if the query falls back to a collection scan"""
+        stages = await self.winning_plan_stages(collection_name, query, sort)
+        if "COLLSCAN" in stages:
+            raise AssertionError(
+                f"Query on {collection_name} {query} (sort={sort}) uses COLLSCAN: {stages}"
+            )
+
+    async def check_query_shapes(self) -> List[str]:
+        """Explain every registered service query and list the ones doing a COLLSCAN"""
+        failures = []
+        for collection_name, query, sort in QUERY_SHAPES:
+            try:
+                await self.assert_uses_index(collection_name, query, sort)
+            except AssertionError as e:
+                failures.append(str(e))
+        return failures
+
+    async def verify(self, ensure: bool = True) -> List[str]:
+        """Index drift and COLLSCAN query shapes, as messages (empty when all is well)"""
+        if ensure:
+            await self.ensure_indexes()
+        problems = [f"Index drift on {name}: {details}" for name, details in (await self.report_drift()).items()]
+        return problems + await self.check_query_shapes()
+
+index_manager = IndexManager()
+
+async def _verify(ensure: bool) -> List[str]:
+    database.connect()
+    try:
+        return await index_manager.verify(ensure)
+    finally:
+        database.close()
+
+def main() -> None:
+    """
+    Check the database at MONGO_URL / DATABASE_NAME; exits non-zero on drift
+    or on a service query that would scan a whole collection. For CI:
+
+        cd backend && MONGO_URL=mongodb://localhost:27017 DATABASE_NAME=ci python -m services.indexes
+    """
+    parser = argparse.ArgumentParser(description="Verify MongoDB indexes and query plans")
+    parser.add_argument("--no-ensure", action="store_true", help="don't create missing indexes first")
+    args = parser.parse_args()
+    problems = asyncio.run(_verify(ensure=not args.no_ensure))
+    for problem in problems:
+        print(problem)
+    print(f"{len(QUERY_SHAPES)} query shapes checked, {len(problems)} problems")
+    sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+    main()
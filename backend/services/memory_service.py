@@ -1,80 +1,551 @@
-from pymongo import MongoClient
-from typing import List, Optional
-from models import Memory
+from collections import OrderedDict
+from pymongo import DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from models import Memory, from_db
 from datetime import datetime
+from services.database import database
+from services.pagination import Page, find_page
+from services.search_index import SessionSearchIndex
+from services.vector_index import HashingEmbedder, SessionVectorIndex
+import asyncio
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
+# Fields the in-process session indexes are built from
+INDEX_FIELDS = {
+    "_id": 0, "id": 1, "content": 1, "tags": 1, "created_at": 1, "updated_at": 1,
+    "embedding": 1, "embedding_version": 1,
+}
+
+# Stored embeddings are internal; keep them out of API reads
+READ_PROJECTION = {"embedding": 0, "embedding_version": 0}
+
+# Role of the rolling-summary entry that get_memory_log puts before the log tail
+LOG_SUMMARY_ROLE = "summary"
+
+class SessionMemoryIndex:
+    """Keyword (BM25) and semantic (vector) indexes for one session's memories"""
+
+    def __init__(self, dim: int):
+        self.text = SessionSearchIndex()
+        self.vectors = SessionVectorIndex(dim)
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    @property
+    def synced_at(self) -> Optional[datetime]:
+        return self.text.synced_at
+
+    def remove(self, memory_id: str) -> None:
+        self.text.remove(memory_id)
+        self.vectors.remove(memory_id)
+
 class MemoryService:
     def __init__(self):
-        mongo_url = os.getenv("MONGO_URL", "mongodb://localhost:27017")
-        db_name = os.getenv("DATABASE_NAME", "emergent_plus")
-        self.client = MongoClient(mongo_url)
-        self.db = self.client[db_name]
-        self.collection = self.db["memories"]
+        self.max_indexed_sessions = int(os.getenv("MEMORY_INDEX_MAX_SESSIONS", "256"))
+        self.embedder = HashingEmbedder(int(os.getenv("MEMORY_EMBEDDING_DIM", "256")))
+        self._session_indexes: "OrderedDict[str, SessionMemoryIndex]" = OrderedDict()
+        self._index_locks: Dict[str, asyncio.Lock] = {}
+
+    @property
+    def collection(self):
+        return database.collection("memories")
+    
+    def _embed(self, content: str, tags: List[str]) -> bytes:
+        return self.embedder.to_bytes(self.embedder.embed(" ".join([content, *tags])))
+    
+    def _index_memory(self, index: SessionMemoryIndex, mem: dict) -> None:
+        tags = mem.get("tags", [])
+        index.text.add(mem["id"], mem["content"], tags, mem["created_at"], mem.get("updated_at"))
+        embedding = mem.get("embedding")
+        # Version 1 embeddings only differ from the current ones for non-ASCII text
+        stale = mem.get("embedding_version", 1) != self.embedder.VERSION and \
+            not all(text.isascii() for text in [mem["content"], *tags])
+        if embedding is None or len(embedding) != self.embedder.dim * 4 or stale:
+            # Written before embeddings existed, with another dimension or an older tokenizer
+            embedding = self._embed(mem["content"], tags)
+        index.vectors.add(mem["id"], self.embedder.from_bytes(embedding))
+    
+    async def _get_session_index(self, session_id: str) -> SessionMemoryIndex:
+        """
+        Load the session's search indexes, building them on first use. Memories
+        changed by other workers are pulled in by updated_at. A count mismatch
+        means something was deleted elsewhere, so the index is rebuilt.
+        """
+        lock = self._index_locks.setdefault(session_id, asyncio.Lock())
+        async with lock:
+            index = self._session_indexes.get(session_id)
+            if index is not None:
+                self._session_indexes.move_to_end(session_id)
+                query = {"session_id": session_id}
+                if index.synced_at is not None:
+                    query["updated_at"] = {"$gte": index.synced_at}
+                async for mem in self.collection.find(query, INDEX_FIELDS):
+                    self._index_memory(index, mem)
+                if await self.count_memories(session_id) == len(index):
+                    return index
+            
+            index = SessionMemoryIndex(self.embedder.dim)
+            async for mem in self.collection.find({"session_id": session_id}, INDEX_FIELDS):
+                self._index_memory(index, mem)
+            self._session_indexes[session_id] = index
+            self._session_indexes.move_to_end(session_id)
+            while len(self._session_indexes) > self.max_indexed_sessions:
+                evicted, _ = self._session_indexes.popitem(last=False)
+                self._index_locks.pop(evicted, None)
+            return index
     
     async def create_memory(self, memory: Memory) -> Memory:
         """Create new memory"""
         memory_dict = memory.model_dump()
-        self.collection.insert_one(memory_dict)
+        memory_dict["embedding"] = self._embed(memory.content, memory.tags)
+        memory_dict["embedding_version"] = self.embedder.VERSION
+        await self.collection.insert_one(memory_dict)
+        index = self._session_indexes.get(memory.session_id)
+        if index is not None:
+            self._index_memory(index, memory_dict)
         return memory
     
-    async def get_memories(self, session_id: str, category: Optional[str] = None) -> List[Memory]:
-        """Get memories for a session"""
+    async def create_memories(self, memories: List[Memory], chunk_size: int = 1000) -> Tuple[int, List[dict]]:
+        """
+        Bulk insert with unordered insert_many, `chunk_size` documents per
+        round trip. A failed document (e.g. a duplicate id) doesn't stop the
+        rest. Returns the number inserted and an error per failed document,
+        with its position in `memories`.
+        """
+        docs = [memory.model_dump() for memory in memories]
+        # Embedding thousands of documents is CPU work; keep it off the event loop
+        embeddings = await asyncio.to_thread(
+            lambda: [self._embed(doc["content"], doc["tags"]) for doc in docs]
+        )
+        for doc, embedding in zip(docs, embeddings):
+            doc["embedding"] = embedding
+            doc["embedding_version"] = self.embedder.VERSION
+        
+        inserted = 0
+        errors: List[dict] = []
+        failed = set()
+        for start in range(0, len(docs), chunk_size):
+            chunk = docs[start:start + chunk_size]
+            try:
+                result = await self.collection.insert_many(chunk, ordered=False)
+                inserted += len(result.inserted_ids)
+            except BulkWriteError as e:
+                inserted += e.details.get("nInserted", 0)
+                for error in e.details.get("writeErrors", []):
+                    position = start + error["index"]
+                    failed.add(position)
+                    errors.append({"index": position, "id": docs[position]["id"], "detail": error.get("errmsg", "")})
+        
+        for position, doc in enumerate(docs):
+            index = self._session_indexes.get(doc["session_id"])
+            if index is not None and position not in failed:
+                self._index_memory(index, doc)
+        return inserted, errors
+    
+    async def get_memories(
+        self,
+        session_id: str,
+        category: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[Memory]:
+        """Get memories for a session (newest first, optionally only the top `limit`)"""
         query = {"session_id": session_id}
         if category:
             query["category"] = category
         
-        memories = list(self.collection.find(query).sort("created_at", -1))
-        return [Memory(**{**mem, "_id": str(mem["_id"])}) for mem in memories]
+        cursor = self.collection.find(query, {"_id": 0, **READ_PROJECTION}).sort("created_at", -1)
+        if limit:
+            cursor = cursor.limit(limit)
+        memories = await cursor.to_list(length=limit)
+        return [from_db(Memory, mem) for mem in memories]
     
-    async def search_memories(self, session_id: str, search_term: str) -> List[Memory]:
-        """Search memories by content"""
-        query = {
-            "session_id": session_id,
-            "$or": [
-                {"content": {"$regex": search_term, "$options": "i"}},
-                {"tags": {"$in": [search_term]}}
-            ]
-        }
-        memories = list(self.collection.find(query).sort("created_at", -1))
-        return [Memory(**{**mem, "_id": str(mem["_id"])}) for mem in memories]
+    async def get_memories_page(
+        self,
+        session_id: str,
+        category: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+    ) -> Page:
+        """One page of a session's memories as raw documents, newest first"""
+        query = {"session_id": session_id}
+        if category:
+            query["category"] = category
+        return await find_page(self.collection, query, limit, cursor, fields, exclude=READ_PROJECTION)
+    
+    async def count_memories(self, session_id: str) -> int:
+        """Count memories for a session"""
+        return await self.collection.count_documents({"session_id": session_id})
+    
+    async def search(
+        self,
+        session_id: str,
+        query: str,
+        tags: Optional[List[str]] = None,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> Tuple[List[Memory], int]:
+        """Ranked memory search; returns one page of memories and the total match count"""
+        index = await self._get_session_index(session_id)
+        ranked, total = index.text.search(query, tags=tags, limit=limit, offset=offset)
+        return await self._load_ranked(ranked), total
+    
+    async def _load_ranked(self, ranked: List[Tuple[str, float]]) -> List[Memory]:
+        """Fetch memories for ranked ids, preserving rank order"""
+        if not ranked:
+            return []
+        ids = [memory_id for memory_id, _ in ranked]
+        docs = await self.collection.find(
+            {"id": {"$in": ids}}, {"_id": 0, **READ_PROJECTION}
+        ).to_list(length=len(ids))
+        by_id = {doc["id"]: doc for doc in docs}
+        return [from_db(Memory, by_id[memory_id]) for memory_id in ids if memory_id in by_id]
+    
+    async def search_memories(
+        self,
+        session_id: str,
+        search_term: str,
+        tags: Optional[List[str]] = None,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> List[Memory]:
+        """Search memories by content and tags, best matches first"""
+        memories, _ = await self.search(session_id, search_term, tags, limit, offset)
+        return memories
+    
+    async def recall_memories(
+        self,
+        session_id: str,
+        text: str,
+        k: int = 5,
+        min_score: float = 0.1,
+    ) -> List[Memory]:
+        """Semantic recall: the `k` memories most similar to `text` (cosine)"""
+        index = await self._get_session_index(session_id)
+        ranked = index.vectors.search(self.embedder.embed(text), k=k, min_score=min_score)
+        return await self._load_ranked(ranked)
     
     async def update_memory(self, memory_id: str, content: str, tags: List[str]) -> bool:
         """Update memory"""
-        result = self.collection.update_one(
+        mem = await self.collection.find_one_and_update(
             {"id": memory_id},
-            {"$set": {"content": content, "tags": tags, "updated_at": datetime.now()}}
+            {"$set": {
+                "content": content,
+                "tags": tags,
+                "embedding": self._embed(content, tags),
+                "embedding_version": self.embedder.VERSION,
+                "updated_at": datetime.now(),
+            }},
+            projection={**INDEX_FIELDS, "session_id": 1},
+            return_document=ReturnDocument.AFTER,
         )
-        return result.modified_count > 0
+        if mem is None:
+            return False
+        index = self._session_indexes.get(mem["session_id"])
+        if index is not None:
+            self._index_memory(index, mem)
+        return True
     
     async def delete_memory(self, memory_id: str) -> bool:
         """Delete memory"""
-        result = self.collection.delete_one({"id": memory_id})
-        return result.deleted_count > 0
+        mem = await self.collection.find_one_and_delete(
+            {"id": memory_id}, projection={"_id": 0, "session_id": 1}
+        )
+        if mem is None:
+            return False
+        index = self._session_indexes.get(mem["session_id"])
+        if index is not None:
+            index.remove(memory_id)
+        return True
 
 memory_service = MemoryService()
 
+class AgentLogBuffer:
+    """
+    Write-behind buffer for agent log appends. Entries are flushed with one
+    unordered bulk_write, one $push per (session, agent), when
+    `max_entries` are waiting or every `interval` seconds. Anything left is
+    flushed on stop. Entries that fail to flush are kept for the next try.
+    """
+
+    def __init__(self, service: "AgentMemoryService", max_entries: int = 200,
+                 interval: float = 1.0, max_pending: int = 10000):
+        self.service = service
+        self.max_entries = max_entries
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending: List[Tuple[str, str, dict]] = []
+        self._flushing: List[Tuple[str, str, dict]] = []
+        self._lock = asyncio.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def __len__(self) -> int:
+        return len(self._pending) + len(self._flushing)
+
+    async def add(self, session_id: str, agent_id: str, message: dict) -> None:
+        self._pending.append((session_id, agent_id, message))
+        if len(self._pending) >= self.max_pending:
+            # The database is falling behind; make writers wait for it
+            await self.flush()
+        elif len(self._pending) >= self.max_entries:
+            self._wakeup.set()
+
+    def unflushed(self, session_id: str, agent_id: str) -> List[dict]:
+        """Entries for one log that may not be in the database yet, oldest first"""
+        return [
+            message for s, a, message in self._flushing + self._pending
+            if s == session_id and a == agent_id
+        ]
+
+    async def flush(self) -> int:
+        """Write every pending entry; returns the number written"""
+        async with self._lock:
+            if not self._pending:
+                return 0
+            self._flushing, self._pending = self._pending, []
+            grouped: Dict[Tuple[str, str], List[dict]] = {}
+            for session_id, agent_id, message in self._flushing:
+                grouped.setdefault((session_id, agent_id), []).append(message)
+            keys = list(grouped)
+            now = datetime.now()
+            ops = [
+                UpdateOne(
+                    {"session_id": session_id, "agent_id": agent_id},
+                    {
+                        "$push": {"log": {"$each": grouped[(session_id, agent_id)]}},
+                        "$inc": {"uncompacted_count": len(grouped[(session_id, agent_id)])},
+                        "$set": {"updated_at": now},
+                    },
+                    upsert=True,
+                )
+                for session_id, agent_id in keys
+            ]
+            failed_keys = set()
+            try:
+                await self.service.collection.bulk_write(ops, ordered=False)
+            except BulkWriteError as e:
+                failed_keys = {keys[error["index"]] for error in e.details.get("writeErrors", [])}
+                logger.error("Flushing %d agent logs failed: %s", len(failed_keys), e)
+            except Exception as e:
+                failed_keys = set(keys)
+                logger.error("Flushing agent logs failed: %s", e)
+            retry = [entry for entry in self._flushing if (entry[0], entry[1]) in failed_keys]
+            written = len(self._flushing) - len(retry)
+            # Failed entries go back in front of newer ones, keeping log order
+            self._pending = retry + self._pending
+            self._flushing = []
+            return written
+
+    async def _run_forever(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        """Start the periodic flusher (no-op if disabled or already running)"""
+        if self.interval <= 0 or self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self) -> None:
+        """Stop the flusher and write whatever is still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        if self._pending:
+            logger.error("%d agent log entries could not be written at shutdown", len(self._pending))
+
 class AgentMemoryService:
+    """
+    One document per (session, agent) with a `log` array of messages.
+    Compaction folds old entries into a rolling `summary` and pulls them
+    from the log, so each document stays bounded. Appends from agent runs
+    go through a write-behind buffer while it is running.
+    """
+
     def __init__(self):
-        mongo_url = os.getenv("MONGO_URL", "mongodb://localhost:27017")
-        db_name = os.getenv("DATABASE_NAME", "emergent_plus")
-        self.client = MongoClient(mongo_url)
-        self.db = self.client[db_name]
-        self.collection = self.db["agent_memories"]
+        self.buffer = AgentLogBuffer(
+            self,
+            max_entries=int(os.getenv("AGENT_LOG_FLUSH_ENTRIES", "200")),
+            interval=float(os.getenv("AGENT_LOG_FLUSH_SECONDS", "1.0")),
+            max_pending=int(os.getenv("AGENT_LOG_MAX_PENDING", "10000")),
+        )
+
+    @property
+    def collection(self):
+        return database.collection("agent_memories")
+
+    @property
+    def archive(self):
+        return database.collection("agent_memories_archive")
 
     async def append_message(self, session_id: str, agent_id: str, message: dict) -> bool:
         """Append an agent message to the log."""
-        result = self.collection.update_one(
+        result = await self.collection.update_one(
             {"session_id": session_id, "agent_id": agent_id},
-            {"$push": {"log": message}, "$set": {"updated_at": datetime.now()}},
+            {"$push": {"log": message}, "$inc": {"uncompacted_count": 1}, "$set": {"updated_at": datetime.now()}},
             upsert=True,
         )
         return result.modified_count > 0 or result.upserted_id is not None
 
-    async def get_memory_log(self, session_id: str, agent_id: str, limit: int = 10) -> list:
-        entry = self.collection.find_one({"session_id": session_id, "agent_id": agent_id})
-        if entry and "log" in entry:
-            return entry["log"][-limit:]
-        return []
+    async def queue_message(self, session_id: str, agent_id: str, message: dict) -> None:
+        """Append through the write-behind buffer, or directly if it isn't running"""
+        if self.buffer.running:
+            await self.buffer.add(session_id, agent_id, message)
+        else:
+            await self.append_message(session_id, agent_id, message)
+
+    async def get_memory_log(
+        self,
+        session_id: str,
+        agent_id: str,
+        limit: int = 10,
+        fields: Optional[List[str]] = None,
+    ) -> list:
+        """
+        Get the last `limit` log entries, optionally only the given entry
+        fields. If the log has been compacted, its summary comes first as an
+        entry with role "summary". Entries still in the write-behind buffer
+        are included.
+        """
+        if limit <= 0:
+            return []
+        query = {"session_id": session_id, "agent_id": agent_id}
+        unflushed = self.buffer.unflushed(session_id, agent_id)
+        requested = fields
+        if fields and unflushed and "id" not in fields:
+            # Needed to tell flushed entries from buffered ones
+            fields = [*fields, "id"]
+        if fields:
+            # Slice and trim entries on the server so only what is needed is sent
+            entries = await self.collection.aggregate([
+                {"$match": query},
+                {"$limit": 1},
+                {"$project": {
+                    "_id": 0,
+                    "summary": 1,
+                    "summary_updated_at": 1,
+                    "log": {"$map": {
+                        "input": {"$slice": [{"$ifNull": ["$log", []]}, -limit]},
+                        "as": "entry",
+                        "in": {field: f"$$entry.{field}" for field in fields},
+                    }},
+                }},
+            ]).to_list(length=1)
+            entry = entries[0] if entries else None
+        else:
+            entry = await self.collection.find_one(
+                query, {"_id": 0, "summary": 1, "summary_updated_at": 1, "log": {"$slice": -limit}}
+            )
+        if not entry and not unflushed:
+            return []
+        entry = entry or {}
+        log = entry.get("log") or []
+        if unflushed:
+            # A flush may land between our read and now; skip what the read already saw
+            seen = {msg.get("id") for msg in log}
+            log = (log + [msg for msg in unflushed if msg.get("id") not in seen])[-limit:]
+            if requested:
+                log = [{field: msg[field] for field in requested if field in msg} for msg in log]
+        if entry.get("summary"):
+            summary = {
+                "session_id": session_id,
+                "agent_id": agent_id,
+                "role": LOG_SUMMARY_ROLE,
+                "content": entry["summary"],
+                "timestamp": entry.get("summary_updated_at"),
+            }
+            if fields:
+                summary = {field: summary[field] for field in fields if field in summary}
+            log = [summary] + log
+        return log
+
+    async def sync_uncompacted_counts(self) -> int:
+        """
+        Recompute `uncompacted_count` (the log length) where it is missing or
+        wrong. One scan at startup; returns the number of documents fixed.
+        """
+        size = {"$size": {"$ifNull": ["$log", []]}}
+        result = await self.collection.update_many(
+            {"$expr": {"$ne": [{"$ifNull": ["$uncompacted_count", None]}, size]}},
+            [{"$set": {"uncompacted_count": size}}],
+        )
+        return result.modified_count
+
+    async def compaction_candidates(self, min_entries: int, limit: int) -> List[Tuple[str, str]]:
+        """(session_id, agent_id) of logs holding at least `min_entries` entries, longest first"""
+        cursor = self.collection.find(
+            {"uncompacted_count": {"$gte": min_entries}},
+            {"_id": 0, "session_id": 1, "agent_id": 1},
+        ).sort("uncompacted_count", DESCENDING).limit(limit)
+        return [(doc["session_id"], doc["agent_id"]) async for doc in cursor]
+
+    async def compact(
+        self,
+        session_id: str,
+        agent_id: str,
+        keep: int,
+        min_batch: int,
+        max_batch: int,
+        summarize: Callable[[Optional[str], List[str]], Awaitable[str]],
+        archive: bool = False,
+    ) -> int:
+        """
+        Fold the oldest entries beyond the newest `keep` into the rolling
+        summary (at most `max_batch` at a time) and pull them from the log.
+        Returns the number of entries compacted.
+        """
+        query = {"session_id": session_id, "agent_id": agent_id}
+        docs = await self.collection.aggregate([
+            {"$match": query},
+            {"$limit": 1},
+            {"$project": {
+                "_id": 0,
+                "summary": 1,
+                "size": {"$size": {"$ifNull": ["$log", []]}},
+                "head": {"$slice": [{"$ifNull": ["$log", []]}, max_batch]},
+            }},
+        ]).to_list(length=1)
+        if not docs:
+            return 0
+        doc = docs[0]
+        entries = doc["head"][:max(0, doc["size"] - keep)]
+        if len(entries) < min_batch:
+            return 0
+        summary = await summarize(
+            doc.get("summary"), [f"{entry.get('role')}: {entry.get('content')}" for entry in entries]
+        )
+        ids = [entry.get("id") for entry in entries]
+        # Only apply if the oldest entry is still there (no other worker got here first)
+        result = await self.collection.update_one(
+            {**query, "log.0.id": ids[0]},
+            {
+                "$set": {"summary": summary, "summary_updated_at": datetime.now()},
+                "$pull": {"log": {"id": {"$in": ids}}},
+                "$inc": {"uncompacted_count": -len(ids)},
+            },
+        )
+        if result.modified_count == 0:
+            return 0
+        if archive:
+            await self.archive.insert_many([{**query, **entry} for entry in entries])
+        return len(entries)
 
 agent_memory_service = AgentMemoryService()
@@ -0,0 +1,260 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Iterator, Optional
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+)
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # optional; spans are skipped without it
+    otel_trace = None
+
+# Latency buckets from 1ms (Mongo point reads) to 2 minutes (long LLM calls and streams)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route template and status", ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "Time until the response body was fully sent", ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being handled", ["method"])
+# Per-request time spent in each dependency, summed over concurrent calls
+HTTP_MONGO_TIME = Histogram(
+    "http_request_mongo_seconds", "MongoDB time per request", ["route"], buckets=LATENCY_BUCKETS
+)
+HTTP_LLM_TIME = Histogram(
+    "http_request_llm_seconds", "OpenAI time per request", ["route"], buckets=LATENCY_BUCKETS
+)
+HTTP_RENDER_TIME = Histogram(
+    "http_request_render_seconds", "JSON serialization time per request", ["route"], buckets=LATENCY_BUCKETS
+)
+
+MONGO_LATENCY = Histogram(
+    "mongo_operation_duration_seconds", "MongoDB operations by collection and method", ["collection", "operation"],
+    buckets=LATENCY_BUCKETS,
+)
+MONGO_ERRORS = Counter("mongo_operation_errors_total", "Failed MongoDB operations", ["collection", "operation"])
+MONGO_IN_FLIGHT = Gauge("mongo_operations_in_flight", "MongoDB operations awaiting a reply")
+
+LLM_LATENCY = Histogram(
+    "llm_request_duration_seconds", "OpenAI calls that reached the network (cache hits excluded)",
+    ["endpoint", "model"], buckets=LATENCY_BUCKETS,
+)
+LLM_ERRORS = Counter("llm_request_errors_total", "Failed OpenAI calls", ["endpoint", "model"])
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens reported by OpenAI usage", ["endpoint", "model", "kind"])
+LLM_IN_FLIGHT = Gauge("llm_requests_in_flight", "OpenAI calls in progress")
+
+AGENT_STAGE_LATENCY = Histogram(
+    "agent_stage_duration_seconds", "Multi-agent pipeline stages, context packing to reply", ["stage", "agent"],
+    buckets=LATENCY_BUCKETS,
+)
+
+@dataclass
+class RequestTimings:
+    mongo: float = 0.0
+    llm: float = 0.0
+    render: float = 0.0
+
+# Shared by every task a request spawns (tasks copy the context, not the object)
+current_timings: ContextVar[Optional[RequestTimings]] = ContextVar("current_timings", default=None)
+
+def add_request_time(kind: str, seconds: float) -> None:
+    timings = current_timings.get()
+    if timings is not None:
+        setattr(timings, kind, getattr(timings, kind) + seconds)
+
+_tracer = None
+if otel_trace is not None and os.getenv("OTEL_SPANS_ENABLED", "true").lower() in ("1", "true", "yes"):
+    _tracer = otel_trace.get_tracer("emergent-plus-backend")
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Any]:
+    """
+    OpenTelemetry span when opentelemetry is installed (exported by whatever
+    SDK the deployment configures), otherwise nothing. Only use it around
+    awaits inside one coroutine, never across an async generator's yields.
+    """
+    if _tracer is None:
+        yield None
+        return
+    with _tracer.start_as_current_span(
+        name, attributes={k: v for k, v in attributes.items() if v is not None}
+    ) as current:
+        yield current
+
+@contextmanager
+def timed_mongo(collection: str, operation: str) -> Iterator[None]:
+    MONGO_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    try:
+        with span(f"mongo.{operation}", **{"db.system": "mongodb", "db.collection": collection}):
+            yield
+    except BaseException:
+        MONGO_ERRORS.labels(collection, operation).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        MONGO_IN_FLIGHT.dec()
+        MONGO_LATENCY.labels(collection, operation).observe(elapsed)
+        add_request_time("mongo", elapsed)
+
+@contextmanager
+def timed_llm(endpoint: str, model: Optional[str], in_span: bool = True) -> Iterator[None]:
+    """Time one OpenAI call; pass in_span=False when the body spans an async generator's yields"""
+    model = model or "unknown"
+    LLM_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    try:
+        if in_span:
+            with span(f"llm.{endpoint}", **{"llm.model": model}):
+                yield
+        else:
+            yield
+    except BaseException:
+        LLM_ERRORS.labels(endpoint, model).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        LLM_IN_FLIGHT.dec()
+        LLM_LATENCY.labels(endpoint, model).observe(elapsed)
+        add_request_time("llm", elapsed)
+
+def record_llm_usage(endpoint: str, model: Optional[str], usage: Any) -> None:
+    """Count the prompt and completion tokens of an OpenAI usage object (no-op if None)"""
+    if usage is None:
+        return
+    model = model or "unknown"
+    LLM_TOKENS.labels(endpoint, model, "prompt").inc(getattr(usage, "prompt_tokens", 0) or 0)
+    LLM_TOKENS.labels(endpoint, model, "completion").inc(getattr(usage, "completion_tokens", 0) or 0)
+
+class _InstrumentedCursor:
+    """Motor cursor wrapper timing to_list, explain and iteration; builder calls are passed through"""
+
+    def __init__(self, cursor: Any, collection: str, operation: str):
+        self._cursor = cursor
+        self._collection = collection
+        self._operation = operation
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._cursor, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            # sort(), limit() and friends return the cursor itself; keep it wrapped
+            return self if result is self._cursor else result
+        return call
+
+    async def to_list(self, *args, **kwargs) -> list:
+        with timed_mongo(self._collection, self._operation):
+            return await self._cursor.to_list(*args, **kwargs)
+
+    async def explain(self) -> dict:
+        with timed_mongo(self._collection, "explain"):
+            return await self._cursor.explain()
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        iterator = self._cursor.__aiter__()
+        while True:
+            # One observation per batch fetch; documents in a fetched batch return immediately
+            with timed_mongo(self._collection, self._operation):
+                try:
+                    doc = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+            yield doc
+
+class InstrumentedCollection:
+    """Collection wrapper recording the latency of every awaited operation"""
+
+    CURSOR_METHODS = frozenset({"find", "aggregate", "list_indexes"})
+
+    def __init__(self, collection: Any):
+        self._collection = collection
+        self._name = collection.name
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._collection, name)
+        if not callable(attr) or name.startswith("_"):
+            return attr
+        if name in self.CURSOR_METHODS:
+            return lambda *args, **kwargs: _InstrumentedCursor(attr(*args, **kwargs), self._name, name)
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if not hasattr(result, "__await__"):
+                return result
+            return self._timed(name, result)
+        return call
+
+    async def _timed(self, operation: str, awaitable: Any) -> Any:
+        with timed_mongo(self._name, operation):
+            return await awaitable
+
+def route_label(scope: dict) -> str:
+    """Route template of a handled request, e.g. /api/memory/{session_id} (bounded cardinality)"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-route latency, status, in-flight requests
+    and the Mongo, OpenAI and serialization time each request spent. For
+    streaming responses the latency runs until the stream ends.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        method = scope["method"]
+        status = 500
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.labels(method).inc()
+        start = time.perf_counter()
+        try:
+            with span(f"{method} {scope['path']}", **{"http.method": method}) as current:
+                await self.app(scope, receive, send_with_status)
+                if current is not None:
+                    current.update_name(f"{method} {route_label(scope)}")
+                    current.set_attribute("http.status_code", status)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = route_label(scope)
+            HTTP_IN_FLIGHT.labels(method).dec()
+            HTTP_REQUESTS.labels(method, route, str(status)).inc()
+            HTTP_LATENCY.labels(method, route).observe(elapsed)
+            HTTP_MONGO_TIME.labels(route).observe(timings.mongo)
+            HTTP_LLM_TIME.labels(route).observe(timings.llm)
+            HTTP_RENDER_TIME.labels(route).observe(timings.render)
+            current_timings.reset(token)
+
+def metrics_payload() -> bytes:
+    """Prometheus text exposition; aggregates worker processes when PROMETHEUS_MULTIPROC_DIR is set"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
@@ -0,0 +1,97 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+import base64
+import json
+
+# Default and maximum page sizes for list endpoints
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Newest first, with `id` breaking ties between equal timestamps
+CREATED_DESC: Tuple[Tuple[str, int], ...] = (("created_at", -1), ("id", -1))
+
+class PageRequestError(ValueError):
+    """Malformed cursor or unknown projection field"""
+
+@dataclass
+class Page:
+    items: List[dict]
+    next_cursor: Optional[str] = None
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Opaque cursor holding the sort-key values of the last item on a page"""
+    encoded = [{"$date": v.isoformat()} if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(encoded, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError("wrong number of values")
+        return [
+            datetime.fromisoformat(v["$date"]) if isinstance(v, dict) and "$date" in v else v
+            for v in values
+        ]
+    except (ValueError, TypeError, KeyError) as e:
+        raise PageRequestError(f"Invalid cursor: {e}") from e
+
+def after_filter(sort: Sequence[Tuple[str, int]], values: Sequence[Any]) -> dict:
+    """
+    Filter for the items after `values` in `sort` order. For (a, b) that is
+    a beyond the cursor, or a equal and b beyond it.
+    """
+    clauses = []
+    for i, (name, direction) in enumerate(sort):
+        clause = {prev: values[j] for j, (prev, _) in enumerate(sort[:i])}
+        clause[name] = {"$lt" if direction < 0 else "$gt": values[i]}
+        clauses.append(clause)
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[List[str]]:
+    """Split a comma-separated `fields=` value and check it against `allowed`"""
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = sorted(set(names) - set(allowed))
+    if unknown:
+        raise PageRequestError(f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+def clamp_limit(limit: Optional[int]) -> int:
+    if not limit or limit < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
+
+async def find_page(
+    collection,
+    query: dict,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+    sort: Sequence[Tuple[str, int]] = CREATED_DESC,
+    exclude: Sequence[str] = (),
+) -> Page:
+    """
+    One page of `query` in `sort` order, starting after `cursor`. Only
+    `fields` are read (every field but `exclude` if None). The sort keys are
+    always read, because the next cursor is built from them. Costs one
+    index range scan of `limit` + 1 documents however many match.
+    """
+    limit = clamp_limit(limit)
+    if cursor:
+        query = {"$and": [query, after_filter(sort, decode_cursor(cursor, len(sort)))]}
+    if fields is not None:
+        projection = {"_id": 0, **{name: 1 for name in fields}, **{name: 1 for name, _ in sort}}
+    else:
+        projection = {"_id": 0, **{name: 0 for name in exclude}}
+    docs = await collection.find(query, projection).sort(list(sort)).limit(limit + 1).to_list(length=limit + 1)
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor([docs[-1].get(name) for name, _ in sort])
+    if fields is not None:
+        docs = [{name: doc[name] for name in fields if name in doc} for doc in docs]
+    return Page(items=docs, next_cursor=next_cursor)
@@ -0,0 +1,275 @@
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+import asyncio
+import os
+import random
+import time
+
+import openai
+
+# Worth another attempt: dropped connections, timeouts (APITimeoutError is a
+# connection error) and 5xx responses. The SDK's own retries are turned off.
+TRANSIENT_ERRORS = (openai.APIConnectionError, openai.InternalServerError)
+
+class AIRateLimitError(Exception):
+    """OpenAI kept returning 429 after all retries"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> float:
+        """Take a token; returns 0 on success, else seconds until one is available"""
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def penalize(self, seconds: float) -> None:
+        """Stop handing out tokens for `seconds` (after a 429)"""
+        self.tokens = 0
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def is_idle(self) -> bool:
+        now = time.monotonic()
+        self._refill(now)
+        return self.tokens >= self.burst and now >= self.blocked_until
+
+class _KeyState:
+    def __init__(self, rate: float, burst: float):
+        self.bucket = TokenBucket(rate, burst)
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.in_flight = 0
+        self.granted = 0
+        self.throttled = 0
+        self.retries = 0
+
+class RequestScheduler:
+    """
+    Admission control for OpenAI calls. Each key gets a token bucket and a
+    concurrency cap, and a global cap bounds total in-flight calls. Waiting
+    requests are granted round-robin across keys, so one busy tenant cannot
+    starve the others. 429s are retried with jittered exponential backoff
+    that honours Retry-After, and so are connection errors, timeouts and
+    5xx responses.
+    """
+
+    def __init__(
+        self,
+        rate: float = 5.0,
+        burst: float = 10.0,
+        per_key_concurrency: int = 8,
+        global_concurrency: int = 64,
+        max_retries: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.per_key_concurrency = per_key_concurrency
+        self.global_concurrency = global_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._keys: Dict[str, _KeyState] = {}
+        self._rotation: Deque[str] = deque()  # keys with queued requests, in round-robin order
+        self._in_flight = 0
+        self._totals = {"granted": 0, "throttled": 0, "retries": 0}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_at = 0.0
+
+    def _state(self, key: str) -> _KeyState:
+        state = self._keys.get(key)
+        if state is None:
+            if len(self._keys) >= 1024:
+                # Forget keys whose limits have fully recovered
+                for idle_key in [k for k, s in self._keys.items() if self._is_idle(s)]:
+                    self._forget(idle_key)
+            state = self._keys[key] = _KeyState(self.rate, self.burst)
+        return state
+
+    @staticmethod
+    def _is_idle(state: _KeyState) -> bool:
+        return not state.in_flight and not any(not w.done() for w in state.waiters) and state.bucket.is_idle()
+
+    def _forget(self, key: str) -> None:
+        """Drop a key's state; it must leave the rotation too, or _dispatch would look it up"""
+        del self._keys[key]
+        try:
+            self._rotation.remove(key)
+        except ValueError:
+            pass
+
+    def _schedule_wakeup(self, delay: float) -> None:
+        loop = asyncio.get_running_loop()
+        when = loop.time() + delay
+        if self._timer is not None and self._timer_at <= when:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer_at = when
+        self._timer = loop.call_at(when, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Grant queued requests one per key per pass, round-robin"""
+        granted = True
+        while granted and self._in_flight < self.global_concurrency and self._rotation:
+            granted = False
+            for _ in range(len(self._rotation)):
+                if self._in_flight >= self.global_concurrency:
+                    break
+                key = self._rotation.popleft()
+                state = self._keys.get(key)
+                if state is None:
+                    continue
+                while state.waiters and state.waiters[0].done():
+                    state.waiters.popleft()
+                if not state.waiters:
+                    continue
+                self._rotation.append(key)
+                if state.in_flight >= self.per_key_concurrency:
+                    continue
+                wait = state.bucket.try_acquire()
+                if wait > 0:
+                    self._schedule_wakeup(wait)
+                    continue
+                state.waiters.popleft().set_result(None)
+                state.in_flight += 1
+                state.granted += 1
+                self._totals["granted"] += 1
+                self._in_flight += 1
+                granted = True
+
+    async def acquire(self, key: str) -> None:
+        state = self._state(key)
+        future = asyncio.get_running_loop().create_future()
+        state.waiters.append(future)
+        if key not in self._rotation:
+            self._rotation.append(key)
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as we were cancelled; hand the slot back
+                self.release(key)
+            raise
+
+    def release(self, key: str) -> None:
+        state = self._keys[key]
+        state.in_flight -= 1
+        self._in_flight -= 1
+        if self._is_idle(state):
+            self._forget(key)
+        self._dispatch()
+
+    def _retry_after(self, error: openai.APIError) -> Optional[float]:
+        response = getattr(error, "response", None)
+        headers = response.headers if response is not None else {}
+        try:
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000
+            value = headers.get("retry-after")
+            if value:
+                try:
+                    return float(value)
+                except ValueError:
+                    return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+        return None
+
+    async def run(self, key: str, call: Callable[[], Awaitable[Any]], keep_slot: bool = False) -> Any:
+        """
+        Run `call` under `key`'s limits, retrying 429s and transient errors
+        up to `max_retries` times. With `keep_slot` the
+        concurrency slot stays taken on success and the caller must `release`
+        it (used for streams).
+        """
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(key)
+            state = self._keys[key]
+            try:
+                result = await call()
+            except openai.RateLimitError as e:
+                retry_after = self._retry_after(e)
+                state.throttled += 1
+                self._totals["throttled"] += 1
+                give_up = getattr(e, "code", None) == "insufficient_quota" or attempt == self.max_retries
+                if not give_up:
+                    state.bucket.penalize(retry_after or 0)
+                    state.retries += 1
+                    self._totals["retries"] += 1
+                self.release(key)
+                if give_up:
+                    raise AIRateLimitError(f"OpenAI rate limit exceeded: {e}", retry_after) from e
+                backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                await asyncio.sleep(max(retry_after or 0, backoff))
+                continue
+            except TRANSIENT_ERRORS as e:
+                give_up = attempt == self.max_retries
+                if not give_up:
+                    state.retries += 1
+                    self._totals["retries"] += 1
+                self.release(key)
+                if give_up:
+                    raise
+                backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                await asyncio.sleep(max(self._retry_after(e) or 0, backoff))
+                continue
+            except BaseException:
+                self.release(key)
+                raise
+            if not keep_slot:
+                self.release(key)
+            return result
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self._in_flight,
+            "global_concurrency": self.global_concurrency,
+            "queued": sum(len(s.waiters) for s in self._keys.values()),
+            **self._totals,
+            "keys": {
+                key: {
+                    "queued": len(state.waiters),
+                    "in_flight": state.in_flight,
+                    "granted": state.granted,
+                    "throttled": state.throttled,
+                    "retries": state.retries,
+                }
+                for key, state in self._keys.items()
+            },
+        }
+
+def request_scheduler_from_env() -> RequestScheduler:
+    return RequestScheduler(
+        rate=float(os.getenv("OPENAI_RATE_LIMIT_RPS", "5")),
+        burst=float(os.getenv("OPENAI_RATE_LIMIT_BURST", "10")),
+        per_key_concurrency=int(os.getenv("OPENAI_PER_KEY_CONCURRENCY", "8")),
+        global_concurrency=int(os.getenv("OPENAI_GLOBAL_CONCURRENCY", "64")),
+        max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "4")),
+        base_delay=float(os.getenv("OPENAI_RETRY_BASE_DELAY", "0.5")),
+        max_delay=float(os.getenv("OPENAI_RETRY_MAX_DELAY", "20")),
+    )
@@ -0,0 +1,226 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from services.database import database
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+class CacheBackend(ABC):
+    """Persistent cache tier. Values must be JSON-serialisable."""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        """The live value stored under `key`, or None"""
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        """Store `value` under `key` for `ttl` seconds"""
+
+class MongoCacheBackend(CacheBackend):
+    """Stores entries in a collection with a TTL index on `expires_at`"""
+
+    def __init__(self, collection_name: str = "llm_cache"):
+        self.collection_name = collection_name
+
+    @property
+    def collection(self):
+        return database.collection(self.collection_name)
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = await self.collection.find_one(
+            {"_id": key, "expires_at": {"$gt": datetime.now()}}, {"_id": 0, "value": 1}
+        )
+        return entry["value"] if entry else None
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        await self.collection.update_one(
+            {"_id": key},
+            {"$set": {"value": value, "expires_at": datetime.now() + timedelta(seconds=ttl)}},
+            upsert=True,
+        )
+
+class DiskCacheBackend(CacheBackend):
+    """Stores one JSON file per entry under `directory`"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _read(self, key: str) -> Optional[Any]:
+        try:
+            with open(self._path(key)) as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if entry["expires_at"] <= time.time():
+            return None
+        return entry["value"]
+
+    def _write(self, key: str, value: Any, ttl: float) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"value": value, "expires_at": time.time() + ttl}, f)
+        os.replace(tmp_path, path)
+
+    async def get(self, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(self._read, key)
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        await asyncio.to_thread(self._write, key, value, ttl)
+
+class ResponseCache:
+    """
+    Content-addressed cache for LLM responses. Keys hash the endpoint, scope
+    (API key fingerprint), model, parameters and messages. Lookups hit an
+    in-memory LRU (bounded in bytes) first and then the optional persistent
+    backend. Concurrent misses for the same key share one upstream call.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 32 * 1024 * 1024,
+        ttls: Optional[Dict[str, float]] = None,
+        backend: Optional[CacheBackend] = None,
+    ):
+        self.max_bytes = max_bytes
+        self.ttls = ttls or {}
+        self.backend = backend
+        self._entries: "OrderedDict[str, Tuple[float, Any, int]]" = OrderedDict()  # key -> (expires, value, size)
+        self._bytes = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    @staticmethod
+    def make_key(endpoint: str, params: dict, scope: str = "") -> str:
+        payload = json.dumps(
+            {"endpoint": endpoint, "scope": scope, "params": params},
+            sort_keys=True, separators=(",", ":"), default=str,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _get_memory(self, key: str) -> Tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value, size = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self._bytes -= size
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def _set_memory(self, key: str, value: Any, ttl: float, endpoint: str) -> None:
+        size = len(key) + len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[2]
+        self._entries[key] = (time.monotonic() + ttl, value, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self._stats[endpoint]["evictions"] += 1
+
+    async def get_or_compute(
+        self,
+        endpoint: str,
+        params: dict,
+        compute: Callable[[], Awaitable[Any]],
+        scope: str = "",
+    ) -> Any:
+        """Return the cached response for these params, calling `compute` on a miss"""
+        ttl = self.ttls.get(endpoint, 0)
+        if ttl <= 0:
+            return await compute()
+        stats = self._stats[endpoint]
+        key = self.make_key(endpoint, params, scope)
+
+        found, value = self._get_memory(key)
+        if found:
+            stats["hits"] += 1
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            stats["coalesced"] += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if inflight.cancelled():
+                    # The leading request was cancelled, not this one; try again
+                    return await self.get_or_compute(endpoint, params, compute, scope)
+                raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = None
+            if self.backend is not None:
+                try:
+                    value = await self.backend.get(key)
+                except Exception as e:
+                    logger.warning("Response cache backend read failed: %s", e)
+            if value is not None:
+                stats["persistent_hits"] += 1
+            else:
+                stats["misses"] += 1
+                value = await compute()
+                if self.backend is not None:
+                    try:
+                        await self.backend.set(key, value, ttl)
+                    except Exception as e:
+                        logger.warning("Response cache backend write failed: %s", e)
+            self._set_memory(key, value, ttl, endpoint)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Don't warn about an exception nobody waited for
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttls": self.ttls,
+            "endpoints": {endpoint: dict(counts) for endpoint, counts in self._stats.items()},
+        }
+
+def response_cache_from_env() -> ResponseCache:
+    backend_name = os.getenv("LLM_CACHE_BACKEND", "").lower()
+    backend: Optional[CacheBackend] = None
+    if backend_name == "mongo":
+        backend = MongoCacheBackend()
+    elif backend_name == "disk":
+        backend = DiskCacheBackend(os.getenv("LLM_CACHE_DIR", ".llm_cache"))
+    return ResponseCache(
+        max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+        ttls={
+            "chat": float(os.getenv("LLM_CACHE_TTL_CHAT", "0")),
+            "agent": float(os.getenv("LLM_CACHE_TTL_AGENT", "600")),
+            "simulation": float(os.getenv("LLM_CACHE_TTL_SIMULATION", "3600")),
+            "design": float(os.getenv("LLM_CACHE_TTL_DESIGN", "1800")),
+        },
+        backend=backend,
+    )
@@ -0,0 +1,206 @@
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import math
+import re
+import unicodedata
+
+import numpy as np
+
+# Scripts written without spaces between words
+CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+# A run of CJK characters, or a run of other letters and digits in any script
+TOKEN_RE = re.compile(rf"[{CJK}]+|[^\W_{CJK}]+")
+CJK_RE = re.compile(rf"[{CJK}]")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have i in is it its of on or "
+    "that the this to was we were will with".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """
+    Case-folded, NFKC-normalised word tokens without stopwords. A CJK run
+    has no word boundaries to split on, so it becomes overlapping character
+    bigrams (a single character stays a unigram). ASCII text tokenizes
+    exactly as it did with the old ASCII-only pattern.
+    """
+    tokens = []
+    for token in TOKEN_RE.findall(unicodedata.normalize("NFKC", text).casefold()):
+        if CJK_RE.match(token):
+            tokens.extend([token[i:i + 2] for i in range(len(token) - 1)] if len(token) > 1 else [token])
+        elif token not in STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+class SessionSearchIndex:
+    """
+    In-process BM25 inverted index over one session's memories. Postings are
+    kept in dicts for cheap updates. Each memory also has a row in dense
+    length and timestamp arrays, and a term's postings are turned into row
+    and tf arrays the first time a query needs them after a change. So a
+    query scores a common term's postings in NumPy, not in a Python loop.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, initial_capacity: int = 64):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)  # term -> {memory_id: tf}
+        self.tag_docs: Dict[str, Set[str]] = defaultdict(set)  # case-folded tag -> memory ids
+        self.doc_terms: Dict[str, Tuple[str, ...]] = {}
+        self.doc_tags: Dict[str, Set[str]] = {}
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.lengths = np.zeros(initial_capacity, dtype=np.float64)
+        self.created = np.zeros(initial_capacity, dtype=np.float64)  # created_at as a timestamp
+        self.total_length = 0
+        # Row arrays built from postings and tag_docs; dropped when those change
+        self._term_arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._tag_arrays: Dict[str, np.ndarray] = {}
+        # Newest updated_at seen; used to pull changes made by other workers
+        self.synced_at: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _invalidate(self, memory_id: str) -> None:
+        for term in self.doc_terms.get(memory_id, ()):
+            self._term_arrays.pop(term, None)
+        for tag in self.doc_tags.get(memory_id, ()):
+            self._tag_arrays.pop(tag, None)
+
+    def add(self, memory_id: str, content: str, tags: Iterable[str], created_at: datetime,
+            updated_at: Optional[datetime] = None) -> None:
+        """Index a memory, replacing any previous version"""
+        self.remove(memory_id)
+        tags = list(tags or [])
+        tokens = tokenize(content)
+        for tag in tags:
+            tokens.extend(tokenize(tag))
+        counts = Counter(tokens)
+        for term, tf in counts.items():
+            self.postings[term][memory_id] = tf
+        self.doc_terms[memory_id] = tuple(counts)
+        self.doc_tags[memory_id] = {tag.casefold() for tag in tags}
+        for tag in self.doc_tags[memory_id]:
+            self.tag_docs[tag].add(memory_id)
+        self._invalidate(memory_id)
+        row = len(self.ids)
+        if row == self.lengths.shape[0]:
+            self.lengths = np.concatenate([self.lengths, np.zeros(row)])
+            self.created = np.concatenate([self.created, np.zeros(row)])
+        self.ids.append(memory_id)
+        self.rows[memory_id] = row
+        self.lengths[row] = len(tokens)
+        self.created[row] = created_at.timestamp()
+        self.total_length += len(tokens)
+        if updated_at and (self.synced_at is None or updated_at > self.synced_at):
+            self.synced_at = updated_at
+
+    def remove(self, memory_id: str) -> None:
+        row = self.rows.pop(memory_id, None)
+        if row is None:
+            return
+        self._invalidate(memory_id)
+        for term in self.doc_terms.pop(memory_id):
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(memory_id, None)
+                if not docs:
+                    del self.postings[term]
+        for tag in self.doc_tags.pop(memory_id):
+            docs = self.tag_docs.get(tag)
+            if docs is not None:
+                docs.discard(memory_id)
+                if not docs:
+                    del self.tag_docs[tag]
+        self.total_length -= int(self.lengths[row])
+        # Move the last row into the hole to keep the arrays dense
+        last = len(self.ids) - 1
+        if row != last:
+            moved_id = self.ids[last]
+            self._invalidate(moved_id)
+            self.ids[row] = moved_id
+            self.rows[moved_id] = row
+            self.lengths[row] = self.lengths[last]
+            self.created[row] = self.created[last]
+        self.ids.pop()
+
+    def _term_rows(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(rows, term frequencies) of a term's postings, or None if no memory has it"""
+        arrays = self._term_arrays.get(term)
+        if arrays is None:
+            docs = self.postings.get(term)
+            if not docs:
+                return None
+            rows = np.fromiter((self.rows[mid] for mid in docs), dtype=np.int64, count=len(docs))
+            tfs = np.fromiter(docs.values(), dtype=np.float64, count=len(docs))
+            arrays = self._term_arrays[term] = (rows, tfs)
+        return arrays
+
+    def _tag_mask(self, tags: Set[str]) -> np.ndarray:
+        """Rows of memories carrying every tag in `tags`"""
+        mask = np.ones(len(self.ids), dtype=bool)
+        for tag in tags:
+            rows = self._tag_arrays.get(tag)
+            if rows is None:
+                docs = self.tag_docs.get(tag, ())
+                rows = np.fromiter((self.rows[mid] for mid in docs), dtype=np.int64, count=len(docs))
+                self._tag_arrays[tag] = rows
+            has_tag = np.zeros(len(self.ids), dtype=bool)
+            has_tag[rows] = True
+            mask &= has_tag
+        return mask
+
+    def _top(self, rows: np.ndarray, scores: np.ndarray, count: int) -> np.ndarray:
+        """The `count` best of `rows` by score, newest first among equal scores"""
+        if count < len(rows):
+            # Everything scoring at least the count-th best, so ties at the cut are kept
+            threshold = np.partition(scores, len(scores) - count)[len(scores) - count]
+            keep = scores >= threshold
+            rows, scores = rows[keep], scores[keep]
+        order = np.lexsort((-self.created[rows], -scores))[:count]
+        return rows[order]
+
+    def search(
+        self,
+        query: str,
+        tags: Optional[List[str]] = None,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> Tuple[List[Tuple[str, float]], int]:
+        """
+        Rank memories for `query` with BM25, keeping only memories that carry
+        every tag in `tags`. Returns one page of (memory_id, score) and the
+        total number of matches. An empty query lists tag matches newest first.
+        """
+        required_tags = {tag.casefold() for tag in tags or []}
+        n_docs = len(self.ids)
+        if not n_docs or limit <= 0:
+            return [], 0
+
+        terms = set(tokenize(query))
+        if not terms:
+            if not required_tags:
+                return [], 0
+            matches = np.flatnonzero(self._tag_mask(required_tags))
+            top = self._top(matches, self.created[matches], offset + limit)
+            return [(self.ids[row], 0.0) for row in top[offset:]], len(matches)
+
+        avg_length = self.total_length / n_docs
+        scores = np.zeros(n_docs, dtype=np.float64)
+        for term in terms:
+            arrays = self._term_rows(term)
+            if arrays is None:
+                continue
+            rows, tfs = arrays
+            idf = math.log(1 + (n_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+            length_norm = 1 - self.b + self.b * self.lengths[rows] / avg_length
+            scores[rows] += idf * tfs * (self.k1 + 1) / (tfs + self.k1 * length_norm)
+
+        if required_tags:
+            scores[~self._tag_mask(required_tags)] = 0.0
+        # idf and tf are positive, so every matching memory scores above zero
+        matches = np.flatnonzero(scores)
+        top = self._top(matches, scores[matches], offset + limit)
+        return [(self.ids[row], float(scores[row])) for row in top[offset:]], len(matches)
@@ -0,0 +1,283 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, fields, replace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from bson import Binary
+from models import StartupMetrics
+import asyncio
+import json
+import multiprocessing
+import numpy as np
+import os
+import secrets
+
+# Metrics recorded for every path and month
+SERIES = ("users", "revenue", "cash", "funding", "team_size", "growth_rate")
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+# Float64 per-path arrays carried from month to month
+STATE_ARRAYS = ("users", "growth_rate", "cash", "funding", "team_size", "arpu")
+
+@dataclass(frozen=True)
+class SimulationParams:
+    """Monthly model parameters. Rates are per month; money is in USD."""
+    growth_mean: float  # Long-run monthly user growth rate
+    growth_volatility: float  # Std dev of monthly growth shocks
+    growth_reversion: float  # How fast growth returns to its mean (0-1)
+    churn: float  # Share of users lost each month
+    organic_users: float  # Mean users gained each month regardless of growth
+    market_size: float  # Users at which growth saturates
+    arpu: float  # Monthly revenue per user
+    cost_per_employee: float  # Monthly cost per team member
+    fixed_costs: float  # Other monthly costs
+    hire_rate: float  # Expected hires per team member per month while runway allows
+    attrition: float  # Share of the team leaving each month
+    funding_probability: float  # Chance of closing a round in a given month
+    funding_median: float  # Median round size
+    bootstrap_months: float  # Months of costs founders can cover before any funding
+
+# Defaults per Startup.stage
+STAGE_PARAMS: Dict[str, SimulationParams] = {
+    "idea": SimulationParams(0.25, 0.30, 0.3, 0.10, 20, 1e6, 0.0, 6000, 1000, 0.03, 0.01, 0.03, 150_000, 6),
+    "mvp": SimulationParams(0.20, 0.25, 0.3, 0.08, 50, 5e6, 5.0, 7000, 2000, 0.05, 0.01, 0.05, 500_000, 6),
+    "launch": SimulationParams(0.15, 0.20, 0.3, 0.06, 200, 2e7, 15.0, 8000, 5000, 0.06, 0.015, 0.06, 1_500_000, 4),
+    "growth": SimulationParams(0.10, 0.12, 0.3, 0.04, 500, 5e7, 25.0, 10000, 20000, 0.06, 0.015, 0.05, 8_000_000, 3),
+    "scale": SimulationParams(0.05, 0.08, 0.3, 0.025, 2000, 2e8, 40.0, 12000, 100000, 0.04, 0.015, 0.03, 30_000_000, 3),
+}
+
+def stage_params(stage: str, overrides: Optional[Dict[str, float]] = None) -> SimulationParams:
+    """Defaults for `stage` (unknown stages use "idea") with any overrides applied"""
+    params = STAGE_PARAMS.get(stage, STAGE_PARAMS["idea"])
+    if overrides:
+        known = {f.name for f in fields(SimulationParams)}
+        params = replace(params, **{k: float(v) for k, v in overrides.items() if k in known and v is not None})
+    return params
+
+def new_seed() -> int:
+    return secrets.randbits(63)
+
+@dataclass
+class SimulationState:
+    """Per-path state after `month` simulated months, plus the RNG position"""
+    month: int
+    users: np.ndarray
+    growth_rate: np.ndarray
+    cash: np.ndarray
+    funding: np.ndarray
+    team_size: np.ndarray
+    arpu: np.ndarray
+    alive: np.ndarray
+    rng_state: Dict[str, Any]
+
+    @property
+    def paths(self) -> int:
+        return self.users.shape[0]
+
+    def to_document(self) -> dict:
+        """Compact MongoDB form: raw array bytes, RNG state as JSON (its ints exceed 64 bits)"""
+        doc = {name: Binary(getattr(self, name).tobytes()) for name in STATE_ARRAYS}
+        doc["alive"] = Binary(self.alive.astype(np.uint8).tobytes())
+        doc["month"] = self.month
+        doc["rng_state"] = json.dumps(self.rng_state)
+        return doc
+
+    @classmethod
+    def from_document(cls, doc: dict) -> "SimulationState":
+        return cls(
+            month=doc["month"],
+            alive=np.frombuffer(doc["alive"], dtype=np.uint8).astype(bool),
+            rng_state=json.loads(doc["rng_state"]),
+            **{name: np.frombuffer(doc[name], dtype=np.float64).copy() for name in STATE_ARRAYS},
+        )
+
+class MonteCarloSimulator:
+    """
+    Vectorised Monte Carlo model of a startup. Every month, across all paths
+    at once:
+
+    - growth follows a mean-reverting random walk and saturates as users
+      approach the market size;
+    - users grow, churn, and pick up some organic sign-ups;
+    - revenue is users times a per-path ARPU;
+    - cash gains revenue, pays the team and fixed costs, and may receive a
+      funding round (more likely when runway is short);
+    - the team hires while runway is long and loses people to attrition.
+
+    A path whose cash runs out stops. Random draws are taken month by month
+    in a fixed order, so a run can be resumed from a saved state and gives
+    the same numbers as one uninterrupted run.
+    """
+
+    def __init__(self, params: SimulationParams):
+        self.params = params
+
+    def initial_state(self, metrics: StartupMetrics, paths: int, seed: int) -> SimulationState:
+        p = self.params
+        rng = np.random.Generator(np.random.PCG64(seed))
+        team = np.full(paths, max(metrics.team_size, 1), dtype=np.float64)
+        monthly_costs = team * p.cost_per_employee + p.fixed_costs
+        # Funding on record is treated as cash in the bank
+        cash = np.maximum(metrics.funding, monthly_costs * p.bootstrap_months)
+        growth = metrics.growth_rate or p.growth_mean
+        # Pricing uncertainty: each path gets its own ARPU
+        arpu = (metrics.revenue / metrics.users) if metrics.users and metrics.revenue else p.arpu
+        arpu = arpu * rng.lognormal(0.0, 0.25, paths)
+        return SimulationState(
+            month=0,
+            users=np.full(paths, float(metrics.users)),
+            growth_rate=np.full(paths, float(growth)),
+            cash=cash,
+            funding=np.full(paths, float(metrics.funding)),
+            team_size=team,
+            arpu=arpu,
+            alive=np.ones(paths, dtype=bool),
+            rng_state=rng.bit_generator.state,
+        )
+
+    def advance(self, state: SimulationState, months: int) -> Tuple[SimulationState, Dict[str, np.ndarray], np.ndarray]:
+        """
+        Simulate `months` more months. Returns the new state, (months, paths)
+        arrays per metric, and the share of paths still alive each month.
+        """
+        p = self.params
+        n = state.paths
+        bit_generator = np.random.PCG64()
+        bit_generator.state = state.rng_state
+        rng = np.random.Generator(bit_generator)
+
+        users = state.users.copy()
+        growth = state.growth_rate.copy()
+        cash = state.cash.copy()
+        funding = state.funding.copy()
+        team = state.team_size.copy()
+        alive = state.alive.copy()
+        series = {name: np.empty((months, n)) for name in SERIES}
+        survival = np.empty(months)
+
+        for m in range(months):
+            # Draw everything up front, in a fixed order, so resuming is exact
+            growth_shock = rng.standard_normal(n)
+            organic = rng.poisson(p.organic_users, n)
+            raise_roll = rng.random(n)
+            raise_size = rng.lognormal(0.0, 0.6, n)
+            hires = rng.poisson(p.hire_rate * team)
+            leavers = rng.binomial(team.astype(np.int64), p.attrition)
+
+            growth += p.growth_reversion * (p.growth_mean - growth) + p.growth_volatility * growth_shock
+            np.clip(growth, -0.5, 2.0, out=growth)
+            saturation = np.clip(1.0 - users / p.market_size, 0.0, 1.0)
+            users = np.where(alive, np.maximum(users * (1.0 + growth * saturation - p.churn) + organic, 0.0), 0.0)
+            revenue = users * state.arpu
+
+            burn = np.where(alive, team * p.cost_per_employee + p.fixed_costs, 0.0)
+            cash += revenue - burn
+            runway = np.where(burn > revenue, cash / np.maximum(burn - revenue, 1.0), np.inf)
+            raise_chance = np.minimum(p.funding_probability * np.where(runway < 6, 3.0, 1.0), 0.9)
+            raised = alive & (raise_roll < raise_chance)
+            amount = np.where(raised, p.funding_median * raise_size, 0.0)
+            cash += amount
+            funding += amount
+
+            team = np.maximum(team + np.where(runway > 9, hires, 0) - leavers, 1.0)
+
+            alive &= cash > 0
+            users[~alive] = 0.0
+            revenue[~alive] = 0.0
+            growth[~alive] = 0.0
+            team[~alive] = 0.0
+            survival[m] = alive.mean()
+
+            series["users"][m] = users
+            series["revenue"][m] = revenue
+            series["cash"][m] = cash
+            series["funding"][m] = funding
+            series["team_size"][m] = team
+            series["growth_rate"][m] = growth
+
+        new_state = SimulationState(
+            month=state.month + months,
+            users=users,
+            growth_rate=growth,
+            cash=cash,
+            funding=funding,
+            team_size=team,
+            arpu=state.arpu,
+            alive=alive,
+            rng_state=rng.bit_generator.state,
+        )
+        return new_state, series, survival
+
+def percentile_bands(series: Dict[str, np.ndarray], percentiles=PERCENTILES) -> Dict[str, Dict[str, List[float]]]:
+    """Per-month percentiles and mean of each metric"""
+    bands = {}
+    for name, values in series.items():
+        qs = np.percentile(values, percentiles, axis=1)
+        bands[name] = {f"p{pct}": np.round(q, 4).tolist() for pct, q in zip(percentiles, qs)}
+        bands[name]["mean"] = np.round(values.mean(axis=1), 4).tolist()
+    return bands
+
+def params_dict(params: SimulationParams) -> Dict[str, float]:
+    return {f.name: getattr(params, f.name) for f in fields(SimulationParams)}
+
+def run_forecast(
+    metrics: StartupMetrics,
+    params: SimulationParams,
+    paths: int,
+    seed: int,
+    months: int,
+    state: Optional[SimulationState] = None,
+) -> Tuple[SimulationState, dict]:
+    """
+    Simulate `months` months, continuing from `state` if given, else starting
+    from `metrics`. Returns the end state and the percentile bands and
+    survival for the simulated months only.
+    """
+    simulator = MonteCarloSimulator(params)
+    if state is None:
+        state = simulator.initial_state(metrics, paths, seed)
+    state, series, survival = simulator.advance(state, months)
+    return state, {"metrics": percentile_bands(series), "survival": np.round(survival, 4).tolist()}
+
+def forecast_digest(forecast: dict) -> str:
+    """Compact month-by-month text of a forecast's medians and ranges, for prompting"""
+    metrics = forecast["metrics"]
+    lines = []
+    for i, month in enumerate(forecast["months"]):
+        users, revenue, cash = metrics["users"], metrics["revenue"], metrics["cash"]
+        lines.append(
+            f"Month {month}: users {users['p50'][i]:.0f} (p10 {users['p10'][i]:.0f}, p90 {users['p90'][i]:.0f}); "
+            f"MRR ${revenue['p50'][i]:,.0f} (p10 ${revenue['p10'][i]:,.0f}, p90 ${revenue['p90'][i]:,.0f}); "
+            f"cash ${cash['p50'][i]:,.0f}; team {metrics['team_size']['p50'][i]:.0f}; "
+            f"survival {forecast['survival'][i]:.0%}"
+        )
+    return "\n".join(lines)
+
+class SimulationPool:
+    """
+    Process pool for running many simulations in parallel across CPU cores.
+    Workers are spawned on first use and reused.
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawned workers don't inherit the server's threads and sockets
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Call `fn(*args)` in a worker process; both must be picklable"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), fn, *args)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+simulation_pool = SimulationPool(int(os.getenv("SIMULATION_WORKERS", "0")) or None)
@@ -0,0 +1,153 @@
+from datetime import datetime
+from pymongo import DESCENDING
+from pymongo.errors import DuplicateKeyError
+from typing import Dict, List, Optional
+from models import Startup, generate_uuid
+from services.database import database
+from services.simulation import (
+    SimulationPool, SimulationState, new_seed, params_dict, run_forecast, stage_params
+)
+import asyncio
+import hashlib
+import json
+
+# Everything but the bulky per-path end state
+SUMMARY_PROJECTION = {"_id": 0, "state": 0}
+
+class SimulationService:
+    """
+    Stores each simulation as one document in `simulations`, keyed by
+    (startup_id, inputs_hash, seed). Per-month results are columnar arrays
+    (one list per metric and percentile). The per-path end state and RNG
+    position are kept too. A repeat request is answered from storage, and
+    a longer horizon only simulates the months that are missing.
+    """
+
+    @property
+    def collection(self):
+        return database.collection("simulations")
+
+    @staticmethod
+    def inputs_hash(startup: Startup, params: Dict[str, float], paths: int) -> str:
+        """Hash of everything that determines a simulation except its seed and horizon"""
+        payload = json.dumps(
+            {"stage": startup.stage, "metrics": startup.metrics.model_dump(), "params": params, "paths": paths},
+            sort_keys=True, separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    @staticmethod
+    def _forecast(doc: dict, months: int, cached: bool, computed_months: int) -> dict:
+        """API view of a stored simulation, cut to `months`"""
+        return {
+            "simulation_id": doc["id"],
+            "months": list(range(1, months + 1)),
+            "paths": doc["paths"],
+            "seed": doc["seed"],
+            "params": doc["params"],
+            "metrics": {
+                metric: {band: values[:months] for band, values in bands.items()}
+                for metric, bands in doc["metrics"].items()
+            },
+            "survival": doc["survival"][:months],
+            "cached": cached,
+            "computed_months": computed_months,
+        }
+
+    async def simulate(
+        self,
+        startup: Startup,
+        months: int,
+        paths: int = 2000,
+        seed: Optional[int] = None,
+        scenario: Optional[Dict[str, float]] = None,
+        pool: Optional[SimulationPool] = None,
+        fresh: bool = False,
+    ) -> dict:
+        """
+        Return the simulation for these inputs, computing only what is not
+        stored yet. Without a seed, the latest stored run for the same
+        inputs is reused, if there is one, unless `fresh` asks for a new
+        random seed. The work runs in `pool` if given, otherwise in a thread.
+        """
+        run = pool.run if pool is not None else asyncio.to_thread
+        params = stage_params(startup.stage, scenario)
+        inputs_hash = self.inputs_hash(startup, params_dict(params), paths)
+        query = {"startup_id": startup.id, "inputs_hash": inputs_hash}
+        doc = None
+        if seed is not None:
+            query["seed"] = seed
+        if seed is not None or not fresh:
+            doc = await self.collection.find_one(query, SUMMARY_PROJECTION, sort=[("created_at", DESCENDING)])
+
+        if doc and doc["months"] >= months:
+            return self._forecast(doc, months, cached=True, computed_months=0)
+
+        if doc:
+            # Resume from the stored end state
+            stored = await self.collection.find_one({"id": doc["id"]}, {"_id": 0, "state": 1})
+            state = SimulationState.from_document(stored["state"])
+            extra = months - doc["months"]
+            state, forecast = await run(run_forecast, startup.metrics, params, paths, doc["seed"], extra, state)
+            doc["metrics"] = {
+                metric: {band: values + forecast["metrics"][metric][band] for band, values in bands.items()}
+                for metric, bands in doc["metrics"].items()
+            }
+            doc["survival"] = doc["survival"] + forecast["survival"]
+            # Only extend the horizon this request read; a concurrent extension wins otherwise
+            await self.collection.update_one(
+                {"id": doc["id"], "months": doc["months"]},
+                {"$set": {
+                    "months": months,
+                    "metrics": doc["metrics"],
+                    "survival": doc["survival"],
+                    "state": state.to_document(),
+                    "updated_at": datetime.now(),
+                }},
+            )
+            doc["months"] = months
+            return self._forecast(doc, months, cached=False, computed_months=extra)
+
+        seed = new_seed() if seed is None else seed
+        state, forecast = await run(run_forecast, startup.metrics, params, paths, seed, months)
+        now = datetime.now()
+        doc = {
+            "id": generate_uuid(),
+            "startup_id": startup.id,
+            "inputs_hash": inputs_hash,
+            "seed": seed,
+            "paths": paths,
+            "stage": startup.stage,
+            "start_metrics": startup.metrics.model_dump(),
+            "params": params_dict(params),
+            "months": months,
+            "metrics": forecast["metrics"],
+            "survival": forecast["survival"],
+            "state": state.to_document(),
+            "created_at": now,
+            "updated_at": now,
+        }
+        try:
+            await self.collection.insert_one(doc)
+        except DuplicateKeyError:
+            # A concurrent request stored the same simulation; the results are identical
+            pass
+        return self._forecast(doc, months, cached=False, computed_months=months)
+
+    async def get_simulations(self, startup_id: str, limit: Optional[int] = None) -> List[dict]:
+        """Stored simulations for a startup (newest first), without their results"""
+        cursor = self.collection.find(
+            {"startup_id": startup_id},
+            {"_id": 0, "id": 1, "seed": 1, "paths": 1, "months": 1, "stage": 1, "params": 1,
+             "start_metrics": 1, "created_at": 1, "updated_at": 1},
+        ).sort("created_at", DESCENDING)
+        if limit:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def delete_simulations(self, startup_id: str) -> int:
+        """Delete every stored simulation of a startup"""
+        result = await self.collection.delete_many({"startup_id": startup_id})
+        return result.deleted_count
+
+simulation_service = SimulationService()
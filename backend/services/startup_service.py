@@ -1,38 +1,57 @@
-from pymongo import MongoClient
 from typing import List, Optional
-from models import Startup, StartupMetrics
+from models import Startup, StartupMetrics, from_db
 from datetime import datetime
-import os
+from services.database import database
+from services.pagination import Page, find_page
 
 class StartupService:
-    def __init__(self):
-        mongo_url = os.getenv("MONGO_URL", "mongodb://localhost:27017")
-        db_name = os.getenv("DATABASE_NAME", "emergent_plus")
-        self.client = MongoClient(mongo_url)
-        self.db = self.client[db_name]
-        self.collection = self.db["startups"]
+    @property
+    def collection(self):
+        return database.collection("startups")
     
     async def create_startup(self, startup: Startup) -> Startup:
         """Create new startup"""
         startup_dict = startup.model_dump()
-        self.collection.insert_one(startup_dict)
+        await self.collection.insert_one(startup_dict)
         return startup
     
-    async def get_startups(self, session_id: str) -> List[Startup]:
-        """Get all startups for a session"""
-        startups = list(self.collection.find({"session_id": session_id}).sort("created_at", -1))
-        return [Startup(**{**s, "_id": str(s["_id"])}) for s in startups]
+    async def get_startups(self, session_id: str, limit: Optional[int] = None) -> List[Startup]:
+        """Get all startups for a session (newest first, optionally only the top `limit`)"""
+        cursor = self.collection.find({"session_id": session_id}, {"_id": 0}).sort("created_at", -1)
+        if limit:
+            cursor = cursor.limit(limit)
+        startups = await cursor.to_list(length=limit)
+        return [from_db(Startup, s) for s in startups]
+    
+    async def get_startups_page(
+        self,
+        session_id: str,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+    ) -> Page:
+        """One page of a session's startups as raw documents, newest first"""
+        return await find_page(self.collection, {"session_id": session_id}, limit, cursor, fields)
+    
+    async def count_startups(self, session_id: str) -> int:
+        """Count startups for a session"""
+        return await self.collection.count_documents({"session_id": session_id})
     
     async def get_startup(self, startup_id: str) -> Optional[Startup]:
         """Get specific startup"""
-        startup = self.collection.find_one({"id": startup_id})
+        startup = await self.collection.find_one({"id": startup_id}, {"_id": 0})
         if startup:
-            return Startup(**{**startup, "_id": str(startup["_id"])})
+            return from_db(Startup, startup)
         return None
     
+    async def get_startups_by_ids(self, startup_ids: List[str]) -> List[Startup]:
+        """Get several startups in one query (missing ids are skipped)"""
+        startups = await self.collection.find({"id": {"$in": startup_ids}}, {"_id": 0}).to_list(length=None)
+        return [from_db(Startup, s) for s in startups]
+    
     async def update_metrics(self, startup_id: str, metrics: StartupMetrics) -> bool:
         """Update startup metrics"""
-        result = self.collection.update_one(
+        result = await self.collection.update_one(
             {"id": startup_id},
             {"$set": {"metrics": metrics.model_dump(), "updated_at": datetime.now()}}
         )
@@ -40,7 +59,7 @@ class StartupService:
     
     async def add_milestone(self, startup_id: str, milestone: dict) -> bool:
         """Add milestone to startup"""
-        result = self.collection.update_one(
+        result = await self.collection.update_one(
             {"id": startup_id},
             {"$push": {"milestones": milestone}, "$set": {"updated_at": datetime.now()}}
         )
@@ -48,7 +67,7 @@ class StartupService:
     
     async def update_stage(self, startup_id: str, stage: str) -> bool:
         """Update startup stage"""
-        result = self.collection.update_one(
+        result = await self.collection.update_one(
             {"id": startup_id},
             {"$set": {"stage": stage, "updated_at": datetime.now()}}
         )
@@ -56,7 +75,7 @@ class StartupService:
     
     async def delete_startup(self, startup_id: str) -> bool:
         """Delete startup"""
-        result = self.collection.delete_one({"id": startup_id})
+        result = await self.collection.delete_one({"id": startup_id})
         return result.deleted_count > 0
 
 startup_service = StartupService()
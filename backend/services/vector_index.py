@@ -0,0 +1,90 @@
+from typing import Dict, List, Tuple
+from services.search_index import tokenize
+import numpy as np
+import zlib
+
+class HashingEmbedder:
+    """
+    Local, network-free text embedder: signed feature hashing of unigrams and
+    bigrams with sublinear term weighting, L2-normalised.
+    """
+
+    # Bumped when tokenization changes; 2 added non-ASCII scripts
+    VERSION = 2
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def embed(self, text: str) -> np.ndarray:
+        tokens = tokenize(text)
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        vec = np.zeros(self.dim, dtype=np.float32)
+        if not features:
+            return vec
+        # crc32 is stable across processes, unlike hash()
+        hashes = np.fromiter((zlib.crc32(f.encode()) for f in features), dtype=np.uint32, count=len(features))
+        buckets = hashes % self.dim
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+        np.add.at(vec, buckets, signs)
+        vec = np.sign(vec) * np.log1p(np.abs(vec))
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec /= norm
+        return vec.astype(np.float32, copy=False)
+
+    def to_bytes(self, vec: np.ndarray) -> bytes:
+        return vec.astype(np.float32, copy=False).tobytes()
+
+    def from_bytes(self, data: bytes) -> np.ndarray:
+        return np.frombuffer(data, dtype=np.float32)
+
+class SessionVectorIndex:
+    """Dense in-memory matrix of one session's memory embeddings with cosine top-k"""
+
+    def __init__(self, dim: int, initial_capacity: int = 64):
+        self.dim = dim
+        self.vectors = np.zeros((initial_capacity, dim), dtype=np.float32)
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, memory_id: str, vector: np.ndarray) -> None:
+        """Insert or replace a memory's (unit-length) vector"""
+        row = self.rows.get(memory_id)
+        if row is None:
+            row = len(self.ids)
+            if row == self.vectors.shape[0]:
+                grown = np.zeros((row * 2, self.dim), dtype=np.float32)
+                grown[:row] = self.vectors
+                self.vectors = grown
+            self.ids.append(memory_id)
+            self.rows[memory_id] = row
+        self.vectors[row] = vector
+
+    def remove(self, memory_id: str) -> None:
+        row = self.rows.pop(memory_id, None)
+        if row is None:
+            return
+        # Move the last row into the hole to keep the matrix dense
+        last = len(self.ids) - 1
+        if row != last:
+            moved_id = self.ids[last]
+            self.vectors[row] = self.vectors[last]
+            self.ids[row] = moved_id
+            self.rows[moved_id] = row
+        self.ids.pop()
+
+    def search(self, query: np.ndarray, k: int = 5, min_score: float = 0.0) -> List[Tuple[str, float]]:
+        """Top-k (memory_id, cosine similarity), best first"""
+        n = len(self.ids)
+        if n == 0 or k <= 0:
+            return []
+        scores = self.vectors[:n] @ query
+        if k < n:
+            top = np.argpartition(scores, -k)[-k:]
+        else:
+            top = np.arange(n)
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(self.ids[i], float(scores[i])) for i in top if scores[i] > min_score]
@@ -0,0 +1,49 @@
+import asyncio
+import os
+import uuid
+
+import pytest
+
+from services.database import database
+from services.indexes import index_manager
+
+# Query plans need a real server; mongomock has no planner
+MONGO_TEST_URL = os.getenv("MONGO_TEST_URL")
+
+pytestmark = pytest.mark.skipif(not MONGO_TEST_URL, reason="set MONGO_TEST_URL to a disposable mongod")
+
+@pytest.fixture
+def test_database(monkeypatch):
+    monkeypatch.setenv("MONGO_URL", MONGO_TEST_URL)
+    monkeypatch.setenv("DATABASE_NAME", f"emergent_plus_test_{uuid.uuid4().hex[:8]}")
+    yield
+    async def drop():
+        database.connect()
+        await database.client.drop_database(database.db.name)
+        database.close()
+    asyncio.run(drop())
+
+def test_service_queries_use_indexes(test_database):
+    async def main():
+        database.connect()
+        try:
+            return await index_manager.verify()
+        finally:
+            database.close()
+
+    assert asyncio.run(main()) == []
+
+def test_ttl_change_is_drift(test_database):
+    async def main():
+        database.connect()
+        try:
+            await index_manager.ensure_indexes()
+            await database.db.command({
+                "collMod": "design_jobs",
+                "index": {"name": "expires_ttl", "expireAfterSeconds": 3600},
+            })
+            return await index_manager.report_drift()
+        finally:
+            database.close()
+
+    assert asyncio.run(main()) == {"design_jobs": {"missing": [], "extra": [], "changed": ["expires_ttl"]}}
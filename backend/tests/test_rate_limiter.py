@@ -0,0 +1,125 @@
+import asyncio
+import time
+
+import openai
+import pytest
+from openai import AsyncOpenAI
+from starlette.responses import JSONResponse
+
+from benchmarks.fake_openai import FakeOpenAI, rate_limited
+from services.rate_limiter import AIRateLimitError, RequestScheduler
+
+def chat(client: AsyncOpenAI):
+    return lambda: client.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": "hi"}])
+
+def clients(server: FakeOpenAI, *keys: str) -> dict:
+    return {key: AsyncOpenAI(api_key=key, base_url=server.base_url, max_retries=0) for key in keys}
+
+def test_retries_429_until_success():
+    # Two 429s honouring retry-after-ms, then a completion
+    with FakeOpenAI(lambda key, n: rate_limited(retry_after_ms=100) if n <= 2 else None) as server:
+        async def main():
+            scheduler = RequestScheduler(base_delay=0.01)
+            client = clients(server, "k")["k"]
+            start = time.monotonic()
+            response = await scheduler.run("k", chat(client))
+            return response, time.monotonic() - start, scheduler.stats()
+
+        response, elapsed, stats = asyncio.run(main())
+    assert response.choices[0].message.content == "ok"
+    assert server.calls["k"] == 3
+    assert elapsed >= 0.2
+    assert stats["throttled"] == 2 and stats["retries"] == 2
+    assert stats["in_flight"] == 0
+
+def test_gives_up_after_max_retries():
+    with FakeOpenAI(lambda key, n: rate_limited(retry_after_ms=10)) as server:
+        async def main():
+            scheduler = RequestScheduler(max_retries=2, base_delay=0.01)
+            with pytest.raises(AIRateLimitError) as raised:
+                await scheduler.run("k", chat(clients(server, "k")["k"]))
+            return raised.value, scheduler.stats()
+
+        error, stats = asyncio.run(main())
+    assert server.calls["k"] == 3
+    assert error.retry_after == pytest.approx(0.01)
+    assert stats["throttled"] == 3 and stats["in_flight"] == 0
+
+def test_insufficient_quota_is_not_retried():
+    with FakeOpenAI(lambda key, n: rate_limited(code="insufficient_quota")) as server:
+        async def main():
+            scheduler = RequestScheduler(base_delay=0.01)
+            with pytest.raises(AIRateLimitError):
+                await scheduler.run("k", chat(clients(server, "k")["k"]))
+
+        asyncio.run(main())
+    assert server.calls["k"] == 1
+
+def test_retries_5xx_until_success():
+    unavailable = JSONResponse({"error": {"message": "Service unavailable", "type": "server_error"}}, status_code=503)
+    with FakeOpenAI(lambda key, n: unavailable if n <= 2 else None) as server:
+        async def main():
+            scheduler = RequestScheduler(base_delay=0.01)
+            response = await scheduler.run("k", chat(clients(server, "k")["k"]))
+            return response, scheduler.stats()
+
+        response, stats = asyncio.run(main())
+    assert response.choices[0].message.content == "ok"
+    assert server.calls["k"] == 3
+    assert stats["retries"] == 2 and stats["throttled"] == 0 and stats["in_flight"] == 0
+
+def test_retries_connection_errors_then_gives_up():
+    with FakeOpenAI() as server:
+        base_url = server.base_url
+    # The server is gone: every attempt fails to connect
+    async def main():
+        scheduler = RequestScheduler(max_retries=2, base_delay=0.01)
+        client = AsyncOpenAI(api_key="k", base_url=base_url, max_retries=0)
+        attempts = 0
+
+        async def call():
+            nonlocal attempts
+            attempts += 1
+            return await chat(client)()
+
+        with pytest.raises(openai.APIConnectionError):
+            await scheduler.run("k", call)
+        return attempts, scheduler.stats()
+
+    attempts, stats = asyncio.run(main())
+    assert attempts == 3
+    assert stats["retries"] == 2 and stats["in_flight"] == 0
+
+def test_global_cap_saturated_across_keys():
+    # Keys queue behind the global cap and go idle while still in the rotation
+    with FakeOpenAI(latency=0.02) as server:
+        async def main():
+            scheduler = RequestScheduler(rate=1000, burst=2, global_concurrency=1)
+            by_key = clients(server, "A", "B")
+            results = await asyncio.gather(*[scheduler.run(key, chat(by_key[key])) for key in "ABA"])
+            # The scheduler must keep working once every key has been forgotten
+            results.append(await scheduler.run("B", chat(by_key["B"])))
+            return results, scheduler.stats()
+
+        results, stats = asyncio.run(main())
+    assert [r.choices[0].message.content for r in results] == ["ok"] * 4
+    assert server.peak_concurrent == 1
+    assert stats["granted"] == 4 and stats["in_flight"] == 0 and stats["keys"] == {}
+
+def test_busy_key_does_not_starve_others():
+    with FakeOpenAI(latency=0.05) as server:
+        async def main():
+            scheduler = RequestScheduler(rate=1000, burst=1000, per_key_concurrency=4, global_concurrency=4)
+            by_key = clients(server, "heavy", "light")
+            heavy = [asyncio.create_task(scheduler.run("heavy", chat(by_key["heavy"]))) for _ in range(20)]
+            await asyncio.sleep(0.01)
+            start = time.monotonic()
+            await scheduler.run("light", chat(by_key["light"]))
+            light_elapsed = time.monotonic() - start
+            await asyncio.gather(*heavy)
+            return light_elapsed
+
+        light_elapsed = asyncio.run(main())
+    # Granted on the next free slot, not after the 20 queued heavy calls (~0.25s)
+    assert light_elapsed < 0.15
+    assert server.peak_concurrent <= 4
@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from services.search_index import SessionSearchIndex, tokenize
+from services.vector_index import HashingEmbedder, SessionVectorIndex
+
+NOW = datetime(2024, 10, 28, 10, 0, 0)
+
+MEMORIES = [
+    ("ru", "Стратегия ценообразования для подписки", ["Финансы"]),
+    ("zh", "价格策略和市场定位", ["市场"]),
+    ("fr", "Un plan naïve pour le café du coin", ["idée"]),
+    ("en", "Pricing strategy for the subscription tier", ["finance"]),
+]
+
+def build_index() -> SessionSearchIndex:
+    index = SessionSearchIndex()
+    for i, (memory_id, content, tags) in enumerate(MEMORIES):
+        index.add(memory_id, content, tags, NOW - timedelta(minutes=i))
+    return index
+
+def test_tokenize_non_ascii():
+    assert tokenize("Стратегия ценообразования") == ["стратегия", "ценообразования"]
+    assert tokenize("价格策略") == ["价格", "格策", "策略"]
+    assert tokenize("naïve Café") == ["naïve", "café"]
+    # NFKC folds full-width forms
+    assert tokenize("ＡＢＣ") == ["abc"]
+
+def test_tokenize_ascii_unchanged():
+    assert tokenize("The quick_brown fox, 2024! I/O") == ["quick", "brown", "fox", "2024", "o"]
+
+def test_search_non_ascii_content():
+    index = build_index()
+    assert [mid for mid, _ in index.search("ценообразования")[0]] == ["ru"]
+    assert [mid for mid, _ in index.search("价格")[0]] == ["zh"]
+    assert [mid for mid, _ in index.search("NAÏVE")[0]] == ["fr"]
+    assert [mid for mid, _ in index.search("", tags=["финансы"])[0]] == ["ru"]
+
+def test_recall_non_ascii_content():
+    embedder = HashingEmbedder(256)
+    index = SessionVectorIndex(256)
+    for memory_id, content, tags in MEMORIES:
+        index.add(memory_id, embedder.embed(" ".join([content, *tags])))
+    query = embedder.embed("ценообразования подписки")
+    assert np.linalg.norm(query) > 0
+    assert index.search(query, k=1)[0][0] == "ru"
+    assert index.search(embedder.embed("市场定位"), k=1)[0][0] == "zh"